@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
     # GeoDjango
     'django.contrib.gis',
+    'django.contrib.postgres',
 
     # Third-party apps
     'rest_framework',
@@ -64,6 +65,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware too
+    'maps.metrics.MetricsMiddleware',
+    'maps.replicas.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -109,9 +113,85 @@ DATABASES = {
         'PASSWORD': os.environ.get('DATABASE_PASSWORD', 'awm123'),
         'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
         'PORT': os.environ.get('DATABASE_PORT', '5433'),
+        # Keep connections open between requests (per worker thread) instead
+        # of reconnecting every time; checked before reuse after errors
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas: DATABASE_REPLICA_HOSTS=host[:port],... adds replica_1,
+# replica_2, ... with the primary's credentials. GET requests to the map API
+# read from them (see maps/replicas.py); writes always go to 'default'.
+for _i, _host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), 1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica_{_i}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['maps.replicas.ReplicaRouter']
+
+# After a write, the client's reads stay on the primary this long
+MAPS_REPLICA_PIN_SECONDS = int(os.environ.get('MAPS_REPLICA_PIN_SECONDS', 5))
+
+# =========================
+# CACHE
+# =========================
+# In-process cache for versioned API responses (see maps/cache.py).
+# Keys carry the dataset version, so a load never leaves stale entries, but
+# every parameter variant (bbox, zoom, filters) gets its own entry. Entries
+# expire, so one-off variants and old versions don't hold memory or crowd
+# the hot entries out of MAX_ENTRIES.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'maps',
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '3600')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '500')),
+        },
+    }
+}
+
+# Vector tiles are cached on disk per dataset version (see maps/tiles.py)
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', str(BASE_DIR / 'tile_cache'))
+# Deeper tiles are rendered on every request rather than written to disk
+TILE_CACHE_MAX_ZOOM = int(os.environ.get('TILE_CACHE_MAX_ZOOM', '12'))
+
+# Bulk exports (/api/export/) likewise, one set of files per version (see maps/export.py)
+EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR', str(BASE_DIR / 'export_cache'))
+
+# Serve /nearest and /nearby from an in-memory KD-tree (needs SciPy);
+# set MAPS_SPATIAL_INDEX=False to query PostGIS instead (see maps/spatial.py)
+MAPS_SPATIAL_INDEX = os.environ.get('MAPS_SPATIAL_INDEX', 'True') == 'True'
+
+# Airports with at least this many routes (in + out) are flagged is_major_hub
+# whenever AirportStats is refreshed (see maps/stats.py)
+MAPS_HUB_MIN_DEGREE = int(os.environ.get('MAPS_HUB_MIN_DEGREE', 200))
+
+# Per-view latency/query/size/cache metrics at /metrics (see maps/metrics.py).
+# Set MAPS_SLOW_REQUEST_MS to log the SQL of requests slower than that.
+MAPS_METRICS = os.environ.get('MAPS_METRICS', 'True') == 'True'
+# Clients allowed to scrape /metrics (comma-separated CIDRs), and an optional
+# bearer token they must also send. Scrape each worker directly, not via nginx.
+MAPS_METRICS_ALLOWED_IPS = [
+    cidr for cidr in os.environ.get('MAPS_METRICS_ALLOWED_IPS', '127.0.0.1/32,::1/128').split(',') if cidr.strip()
+]
+MAPS_METRICS_TOKEN = os.environ.get('MAPS_METRICS_TOKEN') or None
+MAPS_SLOW_REQUEST_MS = (
+    float(os.environ['MAPS_SLOW_REQUEST_MS']) if os.environ.get('MAPS_SLOW_REQUEST_MS') else None
+)
+
+# psycopg 3 connection pool (per ASGI worker) for the /api/async/ views
+MAPS_ASYNC_POOL_MIN = int(os.environ.get('MAPS_ASYNC_POOL_MIN', 2))
+MAPS_ASYNC_POOL_MAX = int(os.environ.get('MAPS_ASYNC_POOL_MAX', 20))
+# Database alias the async views read from, e.g. 'replica_1'
+MAPS_ASYNC_DATABASE = os.environ.get('MAPS_ASYNC_DATABASE', 'default')
+
 # =========================
 # INTERNATIONALIZATION
 # =========================
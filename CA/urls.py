@@ -1,14 +1,26 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from maps.views import AirportViewSet, FlightRouteViewSet, index
+from maps import async_views
+from maps.metrics import metrics
+from maps.views import AirportViewSet, AnalyticsViewSet, FlightRouteViewSet, export, index, tile
 
 router = DefaultRouter()
 router.register(r'airports', AirportViewSet, basename='airports')
 router.register(r'routes', FlightRouteViewSet, basename='routes')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', index, name='index'), # Frontend map page
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
+    # Async (ASGI) read endpoints, see maps/async_views.py
+    path('api/async/airports/', async_views.airport_list, name='async-airports-list'),
+    path('api/async/airports/routes/', async_views.airport_routes, name='async-airports-routes'),
+    path('api/async/airports/nearby/', async_views.airport_nearby, name='async-airports-nearby'),
+    path('api/async/airports/nearest/', async_views.airport_nearest, name='async-airports-nearest'),
+    path('api/async/airports/hubs/', async_views.airport_hubs, name='async-airports-hubs'),
+    path('api/export/<str:layer>.<str:fmt>', export, name='export'),
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.pbf', tile, name='tile'),
+    path('metrics', metrics, name='metrics'),
 ]
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Primary side of streaming replication (docker-compose.replica.yml).
+# Runs once, when the primary's data volume is first initialised.
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<EOSQL
+CREATE ROLE ${REPLICATION_USER} WITH REPLICATION LOGIN PASSWORD '${REPLICATION_PASSWORD}';
+EOSQL
+
+echo "host replication ${REPLICATION_USER} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
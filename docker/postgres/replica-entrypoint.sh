@@ -0,0 +1,16 @@
+#!/bin/sh
+# Hot-standby replica: clone the primary on first start, then follow it.
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  echo "Cloning primary ${PRIMARY_HOST}..."
+  until PGPASSWORD="$REPLICATION_PASSWORD" pg_basebackup \
+      -h "$PRIMARY_HOST" -U "$REPLICATION_USER" -D "$PGDATA" -R -X stream; do
+    echo "Primary is unavailable - sleeping"
+    rm -rf "${PGDATA:?}"/*
+    sleep 2
+  done
+  chmod 0700 "$PGDATA"
+fi
+
+exec postgres -c hot_standby=on
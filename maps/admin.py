@@ -1,5 +1,6 @@
 from django.contrib.gis import admin
 from .models import Airport, FlightRoute
+from .signals import record_change
 
 # Airport admin with map
 @admin.register(Airport)
@@ -7,6 +8,8 @@ class AirportAdmin(admin.OSMGeoAdmin):
     list_display = ('name', 'iata_code', 'city', 'country', 'is_major_hub')
     search_fields = ('name', 'iata_code', 'city', 'country')
     list_filter = ('country', 'is_major_hub')
+    # Derived from route counts on every stats refresh
+    readonly_fields = ('is_major_hub',)
 
     # Map defaults (center on Dublin roughly)
     default_lon = -6.26
@@ -20,6 +23,19 @@ class FlightRouteAdmin(admin.OSMGeoAdmin):
     list_display = ('origin', 'destination', 'airline', 'distance_km')
     search_fields = ('airline', 'origin__iata_code', 'destination__iata_code')
     list_filter = ('airline',)
+    # Derived from the airports' positions on save
+    readonly_fields = ('geom', 'distance_km')
+
+    # FlightRoute has no delete signals (see signals.py), so note the
+    # airports whose stats change here
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        record_change([obj.origin_id, obj.destination_id])
+
+    def delete_queryset(self, request, queryset):
+        ends = {pk for row in queryset.values_list('origin_id', 'destination_id') for pk in row}
+        super().delete_queryset(request, queryset)
+        record_change(ends)
 
     # Map defaults (Europe view)
     default_lon = 0
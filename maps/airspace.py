@@ -0,0 +1,158 @@
+"""
+Region and corridor queries over route geometries, for airspace-impact
+analysis.
+
+Routes are tested as geography, i.e. as great-circle arcs between their
+airports, with ``ST_Intersects`` / ``ST_DWithin`` served by the GIST index
+on ``(geom::geography)`` (migration 0008). A route crossing the antimeridian
+is one short arc over the date line, not a line back across the whole map.
+
+Query regions (bboxes and polygons) are given in lon/lat and read as flat
+lon/lat shapes: their edges are densified to ``REGION_STEP_DEGREES`` before
+the cast, so a bbox edge follows its parallel instead of a great circle.
+Corridors (points or lines) are used as given, as geography. Geography
+polygons must be smaller than a hemisphere, so regions spanning 180° or
+more of longitude or latitude are rejected.
+
+Output paths are the great circles densified every ``SEGMENT_KM`` with
+``ST_Segmentize``, with longitudes kept continuous across the antimeridian
+(they may run past ±180, which Leaflet draws correctly).
+"""
+
+import json
+
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, MultiPolygon
+from django.db.models import BooleanField, F, FloatField, TextField
+from django.db.models.expressions import RawSQL
+
+from .models import FlightRoute
+from .viewport import bbox_polygons
+
+SEGMENT_KM = 100
+REGION_STEP_DEGREES = 1.0
+MAX_QUERY_VERTICES = 10_000
+MAX_CORRIDOR_KM = 2000
+# Regions must span less than this (a hemisphere) in longitude and latitude
+MAX_REGION_DEGREES = 180
+
+ROUTE_GEOGRAPHY = "maps_flightroute.geom::geography"
+REGION_SQL = f"ST_Segmentize(ST_GeomFromEWKT(%s), {REGION_STEP_DEGREES})::geography"
+CORRIDOR_SQL = "ST_GeomFromEWKT(%s)::geography"
+
+
+def parse_geometry(value, types):
+    """
+    Parse a WKT or GeoJSON geometry in lon/lat (EPSG:4326) whose type is in
+    ``types``. Raises ValueError.
+    """
+    try:
+        geom = GEOSGeometry(value, srid=4326)
+    except (ValueError, TypeError, GEOSException, GDALException):
+        raise ValueError("not WKT or GeoJSON")
+    if geom.geom_type not in types:
+        raise ValueError(f"expected {' or '.join(types)}")
+    if geom.empty or not geom.valid or geom.num_coords > MAX_QUERY_VERTICES:
+        raise ValueError("empty, invalid or too many vertices")
+    min_lon, min_lat, max_lon, max_lat = geom.extent
+    if not (-180 <= min_lon and max_lon <= 180 and -90 <= min_lat and max_lat <= 90):
+        raise ValueError("coordinates out of range")
+    return geom
+
+
+def check_region_span(lon_span, lat_span):
+    if lon_span >= MAX_REGION_DEGREES or lat_span >= MAX_REGION_DEGREES:
+        raise ValueError(f"region must span less than {MAX_REGION_DEGREES} degrees")
+
+
+def parse_region(value):
+    """A WKT or GeoJSON (Multi)Polygon query region. Raises ValueError."""
+    region = parse_geometry(value, ("Polygon", "MultiPolygon"))
+    min_lon, min_lat, max_lon, max_lat = region.extent
+    check_region_span(max_lon - min_lon, max_lat - min_lat)
+    return region
+
+
+def bbox_region(bbox):
+    """
+    The bbox as one (Multi)Polygon, split at the antimeridian if needed.
+    Raises ValueError if it is too large.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_span = max_lon - min_lon if min_lon <= max_lon else 360 - (min_lon - max_lon)
+    check_region_span(lon_span, max_lat - min_lat)
+    polygons = bbox_polygons(bbox)
+    return polygons[0] if len(polygons) == 1 else MultiPolygon(*polygons, srid=4326)
+
+
+def routes_in_region(region):
+    """FlightRoutes whose great-circle path intersects ``region``."""
+    return FlightRoute.objects.filter(
+        RawSQL(f"ST_Intersects({ROUTE_GEOGRAPHY}, {REGION_SQL})", (region.ewkt,), output_field=BooleanField())
+    )
+
+
+def routes_near(target, km):
+    """
+    FlightRoutes passing within ``km`` of ``target`` (a point or a corridor
+    line), annotated with ``offset_km``, their closest approach.
+    """
+    return FlightRoute.objects.filter(
+        RawSQL(
+            f"ST_DWithin({ROUTE_GEOGRAPHY}, {CORRIDOR_SQL}, %s)",
+            (target.ewkt, km * 1000),
+            output_field=BooleanField(),
+        )
+    ).annotate(
+        offset_km=RawSQL(
+            f"round((ST_Distance({ROUTE_GEOGRAPHY}, {CORRIDOR_SQL}) / 1000.0)::numeric, 2)",
+            (target.ewkt,),
+            output_field=FloatField(),
+        )
+    )
+
+
+def path_rows(queryset, *extra):
+    """
+    Project routes to plain dicts with endpoint codes and ``path``, the
+    densified great circle as GeoJSON text.
+    """
+    return queryset.annotate(
+        origin_code=F("origin__iata_code"),
+        destination_code=F("destination__iata_code"),
+        path=RawSQL(
+            f"ST_AsGeoJSON(ST_Segmentize({ROUTE_GEOGRAPHY}, %s), 5)",
+            (SEGMENT_KM * 1000,),
+            output_field=TextField(),
+        ),
+    ).values("id", "airline", "distance_km", "origin_code", "destination_code", "path", *extra)
+
+
+def unwrap(coordinates):
+    """Shift longitudes by ±360 where a path jumps across the antimeridian."""
+    out = [coordinates[0]]
+    offset = 0
+    for (prev_lon, _), (lon, lat) in zip(coordinates, coordinates[1:]):
+        if lon - prev_lon > 180:
+            offset -= 360
+        elif lon - prev_lon < -180:
+            offset += 360
+        out.append([round(lon + offset, 5), lat])
+    return out
+
+
+def path_feature(row, **extra):
+    properties = {
+        "id": row["id"],
+        "origin": row["origin_code"],
+        "destination": row["destination_code"],
+        "airline": row["airline"],
+        "distance_km": row["distance_km"],
+    }
+    properties.update(extra)
+    coordinates = json.loads(row["path"])["coordinates"] if row["path"] else []
+    return {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": unwrap(coordinates) if coordinates else []},
+        "properties": properties,
+    }
@@ -0,0 +1,132 @@
+"""
+Network analytics for dashboards: per-airline aggregates and route
+distance histograms.
+
+Airline aggregates are computed in one GROUP BY over the ``airline`` index
+and kept in memory once per dataset version; histograms are bucketed in
+SQL with ``width_bucket``. Responses go through the versioned cache, so
+repeat requests are served without touching the database.
+"""
+
+from django.db.models import Max
+
+from .cache import PerVersion
+from .models import FlightRoute
+from .replicas import read_connection
+
+MAX_BINS = 200
+
+AIRLINE_SQL = """
+WITH served AS (
+    SELECT airline, count(DISTINCT airport_id) AS airports
+    FROM (
+        SELECT airline, origin_id AS airport_id FROM maps_flightroute
+        UNION ALL
+        SELECT airline, destination_id FROM maps_flightroute
+    ) endpoints
+    GROUP BY airline
+)
+SELECT r.airline,
+       count(*) AS routes,
+       s.airports,
+       avg(r.distance_km) AS avg_km,
+       max(r.distance_km) AS max_km,
+       coalesce(sum(r.distance_km), 0) AS total_km
+FROM maps_flightroute r JOIN served s ON s.airline = r.airline
+GROUP BY r.airline, s.airports
+ORDER BY routes DESC, r.airline
+"""
+
+# Orderings accepted by AirlineStats.top
+AIRLINE_ORDERINGS = ("routes", "airports", "avg_km", "max_km", "total_km")
+
+HISTOGRAM_SQL = """
+SELECT LEAST(width_bucket(distance_km, %s, %s, %s), %s) AS bucket, count(*)
+FROM maps_flightroute
+WHERE distance_km BETWEEN %s AND %s {airline}
+GROUP BY bucket
+ORDER BY bucket
+"""
+
+
+def _round(value, digits=1):
+    return round(value, digits) if value is not None else None
+
+
+class AirlineStats:
+    """Per-airline aggregates for one dataset version, keyed by airline code."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.by_airline = {row["airline"]: row for row in rows}
+
+    @classmethod
+    def build(cls, version):
+        with read_connection().cursor() as cursor:
+            cursor.execute(AIRLINE_SQL)
+            rows = [
+                {
+                    "airline": airline,
+                    "routes": routes,
+                    "airports": airports,
+                    "avg_km": _round(avg_km),
+                    "max_km": _round(max_km),
+                    "total_km": _round(total_km),
+                }
+                for airline, routes, airports, avg_km, max_km, total_km in cursor.fetchall()
+            ]
+        return cls(version, rows)
+
+    def top(self, order="routes", limit=50):
+        """The ``limit`` airlines with the highest ``order`` value."""
+        if order == "routes":
+            return self.rows[:limit]
+        ranked = sorted(self.rows, key=lambda row: (row[order] is None, -(row[order] or 0)))
+        return ranked[:limit]
+
+
+_airline_stats = PerVersion(AirlineStats.build)
+
+
+def get_airline_stats():
+    return _airline_stats.get()
+
+
+def distance_histogram(bins=20, min_km=0.0, max_km=None, airline=None):
+    """
+    Route counts in ``bins`` equal-width distance buckets between ``min_km``
+    and ``max_km`` (default: the longest route), optionally for one airline.
+    Returns a list of {"min_km", "max_km", "count"}, empty buckets included.
+    """
+    if max_km is None:
+        routes = FlightRoute.objects.all()
+        if airline is not None:
+            routes = routes.filter(airline=airline)
+        max_km = routes.aggregate(longest=Max("distance_km"))["longest"]
+        if max_km is None:
+            return []
+    if max_km <= min_km:
+        max_km = min_km + 1
+
+    params = [min_km, max_km, bins, bins, min_km, max_km]
+    airline_sql = ""
+    if airline is not None:
+        airline_sql = "AND airline = %s"
+        params.append(airline)
+
+    counts = [0] * bins
+    with read_connection().cursor() as cursor:
+        cursor.execute(HISTOGRAM_SQL.format(airline=airline_sql), params)
+        for bucket, count in cursor.fetchall():
+            counts[bucket - 1] = count
+
+    width = (max_km - min_km) / bins
+    return [
+        {
+            "min_km": round(min_km + i * width, 1),
+            "max_km": round(min_km + (i + 1) * width, 1),
+            "count": count,
+        }
+        for i, count in enumerate(counts)
+    ]
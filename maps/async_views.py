@@ -0,0 +1,317 @@
+"""
+Async (ASGI) versions of the hot read endpoints, under ``/api/async/``.
+
+They talk to Postgres through a psycopg 3 ``AsyncConnectionPool`` (one per
+event loop, opened on first use) instead of the ORM, so a slow client
+or a slow query holds a coroutine rather than a thread. PostGIS builds the
+GeoJSON itself (``json_build_object``/``json_agg``), so each request is a
+single round trip that returns finished bytes. Responses match the sync
+endpoints and go through the same versioned cache.
+
+Serve them with an ASGI server, e.g. ``uvicorn CA.asgi:application``. Under
+WSGI Django would run each request in a throwaway event loop, leaving a pool
+behind per request, so there they answer 404.
+"""
+
+import asyncio
+import time
+import weakref
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse
+
+from .cache import DATASET_VERSION_ID, acached_response
+from .metrics import record_query
+from .viewport import ZOOM_LIMITS, bbox_polygons, parse_bbox, parse_zoom
+
+try:
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # the async API needs psycopg[pool]
+    AsyncConnectionPool = None
+
+POINT_SQL = "ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography"
+
+AIRPORT_PROPERTIES = """
+'id', a.id, 'name', a.name, 'iata_code', a.iata_code, 'city', a.city,
+'country', a.country, 'altitude_ft', a.altitude_ft, 'is_major_hub', a.is_major_hub
+"""
+
+AIRPORT_FEATURE = f"""
+json_build_object(
+    'type', 'Feature',
+    'geometry', json_build_object('type', 'Point', 'coordinates', json_build_array(ST_X(a.geom), ST_Y(a.geom))),
+    'properties', json_build_object({AIRPORT_PROPERTIES} {{extra}})
+)
+"""
+
+ROUTE_FEATURE = """
+json_build_object(
+    'type', 'Feature',
+    'geometry', json_build_object('type', 'LineString', 'coordinates', json_build_array(
+        json_build_array(ST_X(o.geom), ST_Y(o.geom)), json_build_array(ST_X(d.geom), ST_Y(d.geom))
+    )),
+    'properties', json_build_object(
+        'id', r.id, 'origin', o.iata_code, 'destination', d.iata_code,
+        'airline', r.airline, 'distance_km', r.distance_km
+    )
+)
+"""
+
+# {features} is a subquery yielding (feature, ord) rows
+COLLECTION_SQL = """
+SELECT json_build_object(
+    'type', 'FeatureCollection',
+    'features', coalesce(json_agg(f.feature ORDER BY f.ord), '[]'::json)
+)::text
+FROM ({features}) f
+"""
+
+# Rounded like the sync endpoints' distance_km
+DISTANCE_SQL = f"round((ST_Distance(a.geom::geography, {POINT_SQL}) / 1000.0)::numeric, 2)"
+DISTANCE_PROPERTY = f", 'distance_km', {DISTANCE_SQL}"
+
+VERSION_SQL = "SELECT version FROM maps_datasetversion WHERE id = %s"
+
+# Event loop → task opening its pool. A pool's connections belong to the
+# loop that opened them, so each loop gets its own.
+_pools = weakref.WeakKeyDictionary()
+
+
+# ---------------------------------------------------------------------------
+# Connection pool
+# ---------------------------------------------------------------------------
+
+def _conninfo():
+    db = settings.DATABASES[getattr(settings, "MAPS_ASYNC_DATABASE", "default")]
+    return make_conninfo(
+        dbname=db["NAME"], user=db["USER"], password=db["PASSWORD"],
+        host=db["HOST"], port=db["PORT"],
+    )
+
+
+async def _open_pool():
+    pool = AsyncConnectionPool(
+        _conninfo(),
+        min_size=getattr(settings, "MAPS_ASYNC_POOL_MIN", 2),
+        max_size=getattr(settings, "MAPS_ASYNC_POOL_MAX", 20),
+        open=False,
+    )
+    await pool.open()
+    return pool
+
+
+async def get_pool():
+    if AsyncConnectionPool is None:
+        raise ImproperlyConfigured("The async API needs psycopg[pool] (see requirements.txt)")
+    loop = asyncio.get_running_loop()
+    # Concurrent first requests all await the same task
+    task = _pools.get(loop)
+    if task is None:
+        task = _pools[loop] = loop.create_task(_open_pool())
+    try:
+        return await task
+    except Exception:
+        if _pools.get(loop) is task:
+            del _pools[loop]
+        raise
+
+
+async def fetchone(request, sql, params=()):
+    pool = await get_pool()
+    started = time.perf_counter()
+    async with pool.connection() as conn:
+        cursor = await conn.execute(sql, params)
+        row = await cursor.fetchone()
+    record_query(request, time.perf_counter() - started, sql)
+    return row
+
+
+async def dataset_version(request):
+    row = await fetchone(request, VERSION_SQL, [DATASET_VERSION_ID])
+    return row[0] if row else 0
+
+
+async def collection(request, features_sql, params):
+    """Run a (feature, ord) subquery and return the FeatureCollection bytes."""
+    row = await fetchone(request, COLLECTION_SQL.format(features=features_sql), params)
+    return row[0].encode()
+
+
+def _error(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+def _json(body):
+    return HttpResponse(body, content_type="application/json")
+
+
+def _read_only(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            raise Http404("The async API is only served over ASGI")
+        if request.method not in ("GET", "HEAD"):
+            return _error("Method not allowed", status=405)
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Views
+# ---------------------------------------------------------------------------
+
+@_read_only
+async def airport_list(request):
+    """
+    Airports as GeoJSON, with the same ``bbox``/``zoom`` handling as the
+    sync list.
+    Example: /api/async/airports/?bbox=-11,49,3,59&zoom=5
+    """
+    where, params = [], []
+    try:
+        bbox = request.GET.get("bbox")
+        if bbox:
+            boxes = []
+            for polygon in bbox_polygons(parse_bbox(bbox)):
+                boxes.append("a.geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)")
+                params.extend(polygon.extent)
+            where.append(f"({' OR '.join(boxes)})")
+        zoom = request.GET.get("zoom")
+        limit = ZOOM_LIMITS.get(parse_zoom(zoom)) if zoom not in (None, "") else None
+    except ValueError:
+        return _error("Use ?bbox=<minLon,minLat,maxLon,maxLat>&zoom=<0-22>")
+
+    # Thinned views keep the busiest airports, as in viewport.thin_for_zoom
+    order = "a.id" if limit is None else "a.is_major_hub DESC, s.degree DESC NULLS LAST, a.id"
+    features = (
+        f"SELECT {AIRPORT_FEATURE.format(extra='')} AS feature, row_number() OVER (ORDER BY {order}) AS ord "
+        "FROM maps_airport a LEFT JOIN maps_airportstats s ON s.airport_id = a.id"
+    )
+    if where:
+        features += f" WHERE {' AND '.join(where)}"
+    if limit is not None:
+        features += " ORDER BY ord LIMIT %s"
+        params.append(limit)
+
+    version = await dataset_version(request)
+    return await acached_response(
+        request, lambda: collection(request, features, params), version, params=("bbox", "zoom"),
+    )
+
+
+@_read_only
+async def airport_routes(request):
+    """
+    Routes departing from an airport.
+    Example: /api/async/airports/routes/?origin=DUB
+    """
+    origin_code = request.GET.get("origin")
+    if not origin_code:
+        return _error("Please provide ?origin=<IATA>")
+    code = origin_code.strip().upper()
+
+    row = await fetchone(request, "SELECT id FROM maps_airport WHERE iata_code = %s", [code])
+    if row is None:
+        return _error(f"No airport found with IATA '{origin_code}'", status=404)
+
+    features = (
+        f"SELECT {ROUTE_FEATURE} AS feature, r.id AS ord "
+        "FROM maps_flightroute r "
+        "JOIN maps_airport o ON o.id = r.origin_id "
+        "JOIN maps_airport d ON d.id = r.destination_id "
+        "WHERE r.origin_id = %s"
+    )
+    version = await dataset_version(request)
+    return await acached_response(
+        request, lambda: collection(request, features, [row[0]]), version, params=("origin",),
+    )
+
+
+def _point(request):
+    lat = float(request.GET["lat"])
+    lon = float(request.GET["lon"])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon out of range")
+    return lat, lon
+
+
+@_read_only
+async def airport_nearby(request):
+    """
+    Airports within a radius (km) of a point, nearest first.
+    Example: /api/async/airports/nearby/?lat=53.3&lon=-6.2&radius=100
+    """
+    try:
+        lat, lon = _point(request)
+        radius = float(request.GET.get("radius", 100))
+    except (KeyError, ValueError):
+        return _error("Use ?lat=<value>&lon=<value>&radius=<km>")
+    if radius < 0:
+        return _error("lat/lon out of range or negative radius")
+
+    features = (
+        f"SELECT {AIRPORT_FEATURE.format(extra=DISTANCE_PROPERTY)} AS feature, {DISTANCE_SQL} AS ord "
+        "FROM maps_airport a "
+        f"WHERE ST_DWithin(a.geom::geography, {POINT_SQL}, %s) "
+        "ORDER BY ord LIMIT 300"
+    )
+    params = [lon, lat, lon, lat, lon, lat, radius * 1000]
+    return _json(await collection(request, features, params))
+
+
+@_read_only
+async def airport_nearest(request):
+    """
+    The k nearest airports (default 1) to a point.
+    Example: /api/async/airports/nearest/?lat=53.3&lon=-6.2&k=1
+    """
+    try:
+        lat, lon = _point(request)
+        k = int(request.GET.get("k", 1))
+    except (KeyError, ValueError):
+        return _error("Use ?lat=<value>&lon=<value>")
+    if not 1 <= k <= 100:
+        return _error("lat/lon out of range or k not in 1-100")
+
+    # KNN in the subquery so it is answered from the geography GIST index
+    features = (
+        f"SELECT {AIRPORT_FEATURE.format(extra=DISTANCE_PROPERTY)} AS feature, {DISTANCE_SQL} AS ord "
+        "FROM ("
+        f"SELECT * FROM maps_airport ORDER BY geom::geography <-> {POINT_SQL} LIMIT %s"
+        ") a"
+    )
+    params = [lon, lat, lon, lat, lon, lat, k]
+    return _json(await collection(request, features, params))
+
+
+@_read_only
+async def airport_hubs(request):
+    """
+    Top countries ranked by number of airports.
+    Example: /api/async/airports/hubs/?top=10
+    """
+    try:
+        top = int(request.GET.get("top", 10))
+    except ValueError:
+        top = 0
+    if not 1 <= top <= 250:
+        return _error("Use ?top=<1-250>")
+
+    sql = """
+    SELECT coalesce(json_agg(t), '[]'::json)::text FROM (
+        SELECT country, count(*) AS count FROM maps_airport
+        GROUP BY country ORDER BY count DESC LIMIT %s
+    ) t
+    """
+
+    async def producer():
+        row = await fetchone(request, sql, [top])
+        return row[0].encode()
+
+    version = await dataset_version(request)
+    return await acached_response(request, producer, version, params=("top",))
@@ -0,0 +1,321 @@
+"""
+Performance benchmark: synthetic OpenFlights-shaped data plus timed runs of
+the loaders and every read endpoint.
+
+Data is generated in the airports.dat/routes.dat formats at a multiple of
+the real OpenFlights size and loaded with the real management commands, so
+the loaders are measured too. Each endpoint is then requested in-process
+through the Django test client: latency percentiles over repeated calls
+(with the response and tile caches and the in-memory graph, KD-tree and
+search indexes cleared before each call, and again with them warm), plus
+one instrumented call recording query count, query time and peak Python
+memory (tracemalloc). Results are plain dicts, ready to be written out as
+JSON and compared across commits.
+"""
+
+import csv
+import subprocess
+import time
+import tracemalloc
+from io import StringIO
+from itertools import product
+from pathlib import Path
+from string import ascii_uppercase, digits
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .cache import CACHE_ALIAS, PerVersion
+from .tiles import clear_tile_cache
+
+# Rows in the OpenFlights files this project ships with
+OPENFLIGHTS_AIRPORTS = 7698
+OPENFLIGHTS_ROUTES = 67663
+OPENFLIGHTS_AIRLINES = 568
+OPENFLIGHTS_COUNTRIES = 240
+
+SCALES = {"1x": 1, "10x": 10, "100x": 100}
+
+# Loaders only accept 3-character IATA codes, so airports top out at 36^3
+# (about 6x OpenFlights). Larger scales grow only the routes; results
+# record the real counts and factors.
+CODE_ALPHABET = ascii_uppercase + digits
+MAX_AIRPORTS = len(CODE_ALPHABET) ** 3
+
+PERCENTILES = (50, 90, 95, 99)
+
+TABLES = ("maps_flightroute", "maps_airportstats", "maps_ingestmanifest", "maps_airport", "maps_datasetversion")
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def generate_airports(path, scale, seed=0):
+    """
+    Write an airports.dat with ``scale`` times the OpenFlights airport count
+    (capped at ``MAX_AIRPORTS``). Airports are clustered around "regions" so
+    bbox and nearest queries see realistic density. Returns the IATA codes.
+    """
+    rng = np.random.default_rng(seed)
+    count = min(OPENFLIGHTS_AIRPORTS * scale, MAX_AIRPORTS)
+    codes = np.array(["".join(c) for c in product(CODE_ALPHABET, repeat=3)])
+    codes = codes[rng.permutation(len(codes))[:count]]
+
+    regions = 200
+    centre_lat = np.degrees(np.arcsin(rng.uniform(-0.85, 0.95, regions)))
+    centre_lon = rng.uniform(-180, 180, regions)
+    region = rng.integers(0, regions, count)
+    lat = np.clip(centre_lat[region] + rng.normal(0, 4, count), -89.9, 89.9)
+    lon = (centre_lon[region] + rng.normal(0, 6, count) + 180) % 360 - 180
+    country = region * OPENFLIGHTS_COUNTRIES // regions
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for i, code in enumerate(codes.tolist()):
+            writer.writerow([
+                i + 1, f"Airport {code}", f"City {region[i]}-{i % 50}", f"Country {country[i]}",
+                code, f"X{code}", f"{lat[i]:.6f}", f"{lon[i]:.6f}", int(rng.integers(0, 8000)),
+                0, "U", "Etc/UTC", "airport", "Synthetic",
+            ])
+    return codes.tolist()
+
+
+def generate_routes(path, codes, scale, seed=0):
+    """
+    Write a routes.dat with ``scale`` times the OpenFlights route count.
+    Endpoints are drawn from a Zipf-like popularity curve, so a few hubs get
+    most routes as in the real network. Returns the number of routes.
+    """
+    rng = np.random.default_rng(seed + 1)
+    count = OPENFLIGHTS_ROUTES * scale
+    airlines = OPENFLIGHTS_AIRLINES * scale
+
+    weights = 1.0 / np.arange(1, len(codes) + 1) ** 0.9
+    weights /= weights.sum()
+    # Draw extra rows so there are enough left after dropping duplicates
+    draw = int(count * 1.3)
+    origin = rng.choice(len(codes), draw, p=weights)
+    destination = rng.choice(len(codes), draw, p=weights)
+    airline = rng.zipf(1.6, draw) % airlines
+
+    rows = np.unique(np.column_stack((origin, destination, airline)), axis=0)
+    rows = rows[rows[:, 0] != rows[:, 1]]
+    rows = rows[rng.permutation(len(rows))[:count]]
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for o, d, a in rows.tolist():
+            writer.writerow([f"A{a}", a, codes[o], o + 1, codes[d], d + 1, "", 0, "320"])
+    return len(rows)
+
+
+def reset_tables():
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY")
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f"p{p}": round(float(np.percentile(samples, p)), 3) for p in PERCENTILES}
+    summary["mean"] = round(float(samples.mean()), 3)
+    summary["max"] = round(float(samples.max()), 3)
+    return summary
+
+
+def instrumented(fn):
+    """Run ``fn`` once, recording wall time, queries and peak Python memory."""
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {
+        "ms": round(elapsed * 1000, 3),
+        "queries": len(queries.captured_queries),
+        "query_ms": round(sum(float(q["time"]) for q in queries.captured_queries) * 1000, 3),
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_command(name, *args, **options):
+    """Time one management command run."""
+    _, stats = instrumented(lambda: call_command(name, *args, stdout=StringIO(), **options))
+    return stats
+
+
+def _request(client, method, path, data):
+    if method == "post":
+        response = client.post(path, data, content_type="application/json")
+    else:
+        response = client.get(path, data)
+    body = b"".join(response.streaming_content) if response.streaming else response.content
+    return response.status_code, len(body)
+
+
+def bench_endpoint(client, method, path, data=None, repeat=20):
+    """
+    Latency percentiles for one endpoint with cold and warm caches, plus an
+    instrumented cold call for queries and memory.
+    """
+    cache = caches[CACHE_ALIAS]
+
+    def clear():
+        cache.clear()
+        clear_tile_cache()
+        PerVersion.clear_all()
+
+    clear()
+    (status, size), stats = instrumented(lambda: _request(client, method, path, data))
+
+    cold = []
+    for _ in range(repeat):
+        clear()
+        started = time.perf_counter()
+        _request(client, method, path, data)
+        cold.append((time.perf_counter() - started) * 1000)
+
+    warm = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _request(client, method, path, data)
+        warm.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "status": status,
+        "response_bytes": size,
+        "queries": stats["queries"],
+        "query_ms": stats["query_ms"],
+        "peak_memory_bytes": stats["peak_memory_bytes"],
+        "cold_ms": percentiles(cold),
+        "warm_ms": percentiles(warm),
+    }
+
+
+def endpoint_cases(codes, seed=0):
+    """(name, method, path, data) for every read endpoint benchmarked."""
+    rng = np.random.default_rng(seed + 2)
+    hub, other = codes[0], codes[min(50, len(codes) - 1)]
+    points = np.column_stack((rng.uniform(-180, 180, 1000), rng.uniform(-60, 70, 1000)))
+    return [
+        ("airports", "get", "/api/airports/", None),
+        ("airports_viewport", "get", "/api/airports/", {"bbox": "-11,35,30,60", "zoom": "4"}),
+        ("airports_world_z2", "get", "/api/airports/", {"bbox": "-180,-85,180,85", "zoom": "2"}),
+        ("airport_routes", "get", "/api/airports/routes/", {"origin": hub}),
+        ("nearby", "get", "/api/airports/nearby/", {"lat": "48.8", "lon": "2.3", "radius": "500"}),
+        ("nearest", "get", "/api/airports/nearest/", {"lat": "48.8", "lon": "2.3", "k": "5"}),
+        ("nearest_batch", "post", "/api/airports/nearest/batch/", {"points": points.tolist(), "k": 1}),
+        ("search", "get", "/api/airports/search/", {"q": hub[:2].lower()}),
+        ("top", "get", "/api/airports/top/", {"by": "degree", "limit": "50"}),
+        ("hubs", "get", "/api/airports/hubs/", {"top": "10"}),
+        ("connections", "get", "/api/airports/connections/", {"from": hub, "to": other, "max_hops": "3"}),
+        ("reachable", "get", "/api/airports/reachable/", {"origin": hub, "max_hops": "2"}),
+        ("routes_page", "get", "/api/routes/", {"page_size": "1000"}),
+        ("analytics_airlines", "get", "/api/analytics/airlines/", {"top": "50"}),
+        ("analytics_distances", "get", "/api/analytics/distances/", {"bins": "40"}),
+        ("tile_airports", "get", "/tiles/airports/2/1/1.pbf", None),
+        ("tile_routes", "get", "/tiles/routes/2/1/1.pbf", None),
+    ]
+
+
+def run_scale(scale, workdir, repeat=20, seed=0, workers=1, log=print):
+    """Generate, load and benchmark one scale. Returns its results dict."""
+    factor = SCALES[scale]
+    workdir = Path(workdir)
+    airports_path = workdir / f"airports_{scale}.dat"
+    routes_path = workdir / f"routes_{scale}.dat"
+
+    log(f"[{scale}] generating data")
+    codes = generate_airports(airports_path, factor, seed)
+    route_count = generate_routes(routes_path, codes, factor, seed)
+    if len(codes) < OPENFLIGHTS_AIRPORTS * factor:
+        log(f"[{scale}] airports capped at {len(codes)} ({len(codes) / OPENFLIGHTS_AIRPORTS:.1f}x)")
+
+    reset_tables()
+    log(f"[{scale}] loading {len(codes)} airports and {route_count} routes")
+    commands = {
+        "load_airports": run_command("load_airports", str(airports_path), workers=workers),
+        "load_routes": run_command("load_routes", str(routes_path), workers=workers),
+        "load_routes_incremental_noop": run_command("load_routes", str(routes_path), incremental=True),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    # Busiest airports first, so cases hit hubs
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.iata_code FROM maps_airport a JOIN maps_airportstats s ON s.airport_id = a.id "
+            "ORDER BY s.degree DESC, a.id"
+        )
+        ranked = [row[0] for row in cursor.fetchall()]
+
+    client = Client()
+    endpoints = {}
+    for name, method, path, data in endpoint_cases(ranked or codes, seed):
+        log(f"[{scale}] {name}")
+        endpoints[name] = bench_endpoint(client, method, path, data, repeat)
+
+    return {
+        "airports": len(codes),
+        "routes": route_count,
+        # Actual multiples of OpenFlights; airports are capped, see MAX_AIRPORTS
+        "airport_factor": round(len(codes) / OPENFLIGHTS_AIRPORTS, 2),
+        "route_factor": round(route_count / OPENFLIGHTS_ROUTES, 2),
+        "commands": commands,
+        "endpoints": endpoints,
+    }
+
+
+def environment():
+    """Commit, database and settings the results were produced with."""
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version(), PostGIS_Lib_Version()")
+        postgres, postgis = cursor.fetchone()
+    return {
+        "git_commit": git("rev-parse", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "postgres": postgres,
+        "postgis": postgis,
+        "spatial_index": getattr(settings, "MAPS_SPATIAL_INDEX", True),
+    }
+
+
+def compare(baseline, current, metric="p95"):
+    """
+    Rows of (scale, endpoint, cache, baseline ms, current ms, ratio) for
+    endpoints present in both result files.
+    """
+    rows = []
+    for scale, results in current["scales"].items():
+        before = baseline.get("scales", {}).get(scale)
+        if not before:
+            continue
+        for name, stats in results["endpoints"].items():
+            old = before["endpoints"].get(name)
+            if not old:
+                continue
+            for cache in ("cold_ms", "warm_ms"):
+                a, b = old[cache][metric], stats[cache][metric]
+                rows.append((scale, name, cache[:-3], a, b, round(b / a, 2) if a else None))
+    return rows
@@ -0,0 +1,117 @@
+"""
+Batch writes for airports (``/api/airports/bulk/``).
+
+A batch is validated item by item without touching the database, and the
+valid items are applied in one transaction:
+- one query loads the existing airports by ``iata_code``;
+- one ``bulk_create(update_conflicts=True)`` upserts them all;
+- one set-based statement rewrites the routes of airports that moved;
+- the affected ``AirportStats`` are refreshed and the dataset version is
+  bumped once.
+Bad items are reported by index and don't stop the rest of the batch.
+"""
+
+from django.contrib.gis.geos import Point
+from django.db import transaction
+
+from .cache import bump_dataset_version
+from .geometry import refresh_route_geometry
+from .models import Airport
+from .serializers import AirportBulkItemSerializer
+from .stats import refresh_airport_stats, route_neighbours
+
+MAX_BULK_AIRPORTS = 10_000
+BULK_CREATE_BATCH_SIZE = 2000
+
+# Written by the upsert; iata_code is the conflict key. is_major_hub is
+# derived by the stats refresh, so clients can't set it.
+UPDATE_FIELDS = ("name", "city", "country", "geom", "altitude_ft")
+
+
+def validate_items(items, partial):
+    """
+    Returns ({iata_code: (index, validated data)}, [error dicts]). Later
+    items repeating an ``iata_code`` are rejected.
+    """
+    valid, errors = {}, []
+    for index, item in enumerate(items):
+        serializer = AirportBulkItemSerializer(data=item, partial=partial)
+        if not serializer.is_valid():
+            errors.append({"index": index, "errors": serializer.errors})
+            continue
+        data = serializer.validated_data
+        code = data.get("iata_code")
+        if code is None:
+            errors.append({"index": index, "errors": {"iata_code": ["This field is required."]}})
+        elif code in valid:
+            errors.append({"index": index, "iata_code": code, "errors": {"iata_code": ["Duplicate in this batch."]}})
+        else:
+            valid[code] = (index, data)
+    return valid, errors
+
+
+# Field values of a new airport, or of a replaced one (POST)
+DEFAULTS = {"city": "", "country": "", "altitude_ft": None, "geom": None}
+
+
+def build_airport(code, data, current, partial):
+    """Unsaved Airport for the upsert (no pk: the conflict key is iata_code)."""
+    if partial:
+        # PATCH keeps the fields that weren't given
+        values = {field: getattr(current, field) for field in UPDATE_FIELDS}
+    else:
+        values = dict(DEFAULTS)
+    data = dict(data)
+    if "lat" in data:
+        values["geom"] = Point(data.pop("lon"), data.pop("lat"), srid=4326)
+    values.update(data)
+    values["iata_code"] = code
+    return Airport(**values)
+
+
+def bulk_write_airports(items, partial=False):
+    """
+    Upsert ``items`` (POST: create or replace; PATCH with ``partial``:
+    change the given fields of existing airports). Returns a dict with
+    ``created``, ``updated`` and per-item ``errors``.
+    """
+    valid, errors = validate_items(items, partial)
+    airports, created_codes, changed, moved = [], [], [], []
+    with transaction.atomic():
+        existing = Airport.objects.in_bulk(list(valid), field_name="iata_code") if valid else {}
+        for code, (index, data) in valid.items():
+            current = existing.get(code)
+            if current is None and partial:
+                errors.append({"index": index, "iata_code": code, "errors": {"iata_code": ["No such airport."]}})
+                continue
+            airport = build_airport(code, data, current, partial)
+            airports.append(airport)
+            if current is None:
+                created_codes.append(code)
+            else:
+                changed.append(current.pk)
+                if not airport.geom.equals_exact(current.geom, 0):
+                    moved.append(current.pk)
+
+        if airports:
+            Airport.objects.bulk_create(
+                airports,
+                batch_size=BULK_CREATE_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["iata_code"],
+                update_fields=UPDATE_FIELDS,
+            )
+            # bulk_create doesn't return ids on conflict, so look up the new ones
+            new_ids = (
+                list(Airport.objects.filter(iata_code__in=created_codes).values_list("pk", flat=True))
+                if created_codes else []
+            )
+            # Moves rewrite routes (and the route-km at their other ends);
+            # country changes reach every airport flying in
+            touched = refresh_route_geometry(moved) if moved else set()
+            neighbours = route_neighbours(changed) if changed else []
+            refresh_airport_stats([*new_ids, *changed, *neighbours, *touched])
+            bump_dataset_version()
+
+    errors.sort(key=lambda error: error["index"])
+    return {"created": len(created_codes), "updated": len(changed), "errors": errors}
@@ -0,0 +1,232 @@
+"""
+Dataset-versioned response cache for the read-only map API.
+
+Every write to airports or routes bumps ``DatasetVersion``; cached bodies
+and ETags are keyed on that version, so nothing is ever invalidated by hand
+and stale data is never served. Bodies are stored once per version together
+with pre-compressed gzip (and brotli, if installed) variants.
+
+Keys are the path plus only the query parameters the view declares it
+reads, so junk parameters can't fill the cache with copies of the same
+body, and entries expire after the cache's ``TIMEOUT`` so bodies of old
+versions don't linger.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import threading
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .metrics import record_cache
+from .models import DatasetVersion
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+CACHE_ALIAS = "default"
+CACHE_PREFIX = "maps"
+DATASET_VERSION_ID = 1
+
+
+# ---------------------------------------------------------------------------
+# Dataset version
+# ---------------------------------------------------------------------------
+
+def get_dataset_version():
+    """Return the current dataset version (one primary-key lookup)."""
+    version = (
+        DatasetVersion.objects.filter(pk=DATASET_VERSION_ID)
+        .values_list("version", flat=True)
+        .first()
+    )
+    return version or 0
+
+
+def bump_dataset_version():
+    """
+    Increment the dataset version. Runs inside the caller's transaction, so
+    the new version becomes visible together with the data it describes.
+    """
+    updated = DatasetVersion.objects.filter(pk=DATASET_VERSION_ID).update(version=F("version") + 1)
+    if not updated:
+        DatasetVersion.objects.get_or_create(pk=DATASET_VERSION_ID, defaults={"version": 1})
+
+
+class PerVersion:
+    """
+    An in-process object (graph, index, ...) built lazily once per dataset
+    version and shared between threads.
+    """
+
+    # Every instance, so benchmarks can start cold
+    instances = []
+
+    def __init__(self, build):
+        self.build = build
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        PerVersion.instances.append(self)
+
+    def get(self):
+        version = get_dataset_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._value = self.build(version)
+                    self._version = version
+        return self._value
+
+    def clear(self):
+        with self._lock:
+            self._value = self._version = None
+
+    @classmethod
+    def clear_all(cls):
+        for instance in cls.instances:
+            instance.clear()
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def request_cache_key(request, params=()):
+    """
+    Path plus the sorted values of the query parameters named in
+    ``params``; order and any other parameters don't matter.
+    """
+    values = sorted((name, request.GET.getlist(name)) for name in set(params) if name in request.GET)
+    return f"{request.path}?{urlencode(values, doseq=True)}"
+
+
+def make_etag(version, key):
+    digest = hashlib.md5(key.encode()).hexdigest()[:16]
+    # Weak: the same representation may be sent with different encodings
+    return f'W/"v{version}-{digest}"'
+
+
+def etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        name, _, value = params.strip().partition("=")
+        try:
+            q = float(value) if name.strip() == "q" else 1.0
+        except ValueError:
+            q = 1.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress_variants(body):
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=6)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=5)
+    return variants
+
+
+def _variant_response(request, variants, content_type):
+    """The stored body in the best encoding the client accepts."""
+    accepted = accepted_encodings(request)
+    for encoding in ("br", "gzip"):
+        if encoding in variants and encoding in accepted:
+            response = HttpResponse(variants[encoding], content_type=content_type)
+            response["Content-Encoding"] = encoding
+            return response
+    return HttpResponse(variants["identity"], content_type=content_type)
+
+
+def _finalize(response, etag):
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Cached responses
+# ---------------------------------------------------------------------------
+
+def cached_response(request, producer, params=(), key=None, content_type="application/json"):
+    """
+    Serve ``producer()`` (an iterable of bytes) through the versioned cache.
+    ``params`` names the query parameters the body depends on.
+
+    - If-None-Match with the current ETag → 304, nothing is queried.
+    - Cache hit → the stored body in the best encoding the client accepts.
+    - Cache miss → the producer is streamed to the client and its output is
+      stored (with compressed variants) once the last chunk has been sent.
+    """
+    key = key or request_cache_key(request, params)
+    version = get_dataset_version()
+    etag = make_etag(version, key)
+
+    if etag_matches(request, etag):
+        record_cache(request, "not_modified")
+        return _finalize(HttpResponseNotModified(), etag)
+
+    cache = caches[CACHE_ALIAS]
+    cache_key = f"{CACHE_PREFIX}:{version}:{key}"
+    variants = cache.get(cache_key)
+
+    if variants is not None:
+        record_cache(request, "hit")
+        return _finalize(_variant_response(request, variants, content_type), etag)
+
+    record_cache(request, "miss")
+
+    def tee():
+        chunks = []
+        for chunk in producer():
+            chunks.append(chunk)
+            yield chunk
+        cache.set(cache_key, compress_variants(b"".join(chunks)))
+
+    return _finalize(StreamingHttpResponse(tee(), content_type=content_type), etag)
+
+
+async def acached_response(request, producer, version, params=(), key=None, content_type="application/json"):
+    """
+    Async counterpart of ``cached_response`` for the ASGI views.
+    ``producer`` is a coroutine function returning the whole body as bytes,
+    and ``version`` the dataset version the caller has already read.
+    Compression runs in a worker thread so the event loop isn't blocked.
+    """
+    key = key or request_cache_key(request, params)
+    etag = make_etag(version, key)
+
+    if etag_matches(request, etag):
+        record_cache(request, "not_modified")
+        return _finalize(HttpResponseNotModified(), etag)
+
+    cache = caches[CACHE_ALIAS]
+    cache_key = f"{CACHE_PREFIX}:{version}:{key}"
+    variants = await cache.aget(cache_key)
+
+    if variants is None:
+        record_cache(request, "miss")
+        variants = await asyncio.to_thread(compress_variants, await producer())
+        await cache.aset(cache_key, variants)
+    else:
+        record_cache(request, "hit")
+    return _finalize(_variant_response(request, variants, content_type), etag)
@@ -0,0 +1,142 @@
+"""
+Server-side airport clusters for low-zoom map views.
+
+Airports are binned into a square grid in Web Mercator tile space,
+``CELLS_PER_TILE`` cells across each 256 px tile, so a cell is the same
+size on screen at every zoom. A response never has more clusters than
+there are cells on screen. For each cluster we keep the count, the
+centroid and the top hub (major hubs first, then by route count, as in
+``viewport.thin_for_zoom``). Every zoom up to ``MAX_CLUSTER_ZOOM`` is
+computed with NumPy once per dataset version; higher zooms reuse the last
+level, where clusters are already single airports.
+
+The grid also never has more than ``MAX_CELLS`` cells over the requested
+bbox: a bbox larger than the screen (a world bbox at zoom 10, say) is
+served from the finest coarser level that fits, so the response stays
+bounded whatever the zoom.
+"""
+
+import numpy as np
+from django.db.models import F
+
+from .cache import PerVersion
+from .geojson import airport_rows
+from .models import Airport
+
+CELLS_PER_TILE = 4  # 64 px cells
+MAX_CLUSTER_ZOOM = 12
+# Without a bbox the whole world is returned, so only allow it at low zooms
+MAX_WORLD_ZOOM = 3
+# The whole world at MAX_WORLD_ZOOM, and a few full-HD screens at any zoom
+MAX_CELLS = (2 ** MAX_WORLD_ZOOM * CELLS_PER_TILE) ** 2
+
+MAX_MERCATOR_LAT = 85.0511287798
+
+
+def mercator_y(lat):
+    """Web Mercator y in [0, 1], 0 at the top."""
+    phi = np.radians(np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    return (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / np.pi) / 2.0
+
+
+def grid_cells(lon, lat, zoom):
+    """Cell number of each lon/lat point on the grid for ``zoom``."""
+    n = (2 ** zoom) * CELLS_PER_TILE
+    x = (lon + 180.0) / 360.0
+    y = mercator_y(lat)
+    cx = np.clip((x * n).astype(np.int64), 0, n - 1)
+    cy = np.clip((y * n).astype(np.int64), 0, n - 1)
+    return cx * n + cy
+
+
+def grid_zoom(zoom, bbox=None):
+    """
+    The cluster level served for ``zoom``: at most ``MAX_CLUSTER_ZOOM``, and
+    coarse enough that ``bbox`` covers no more than ``MAX_CELLS`` cells.
+    """
+    zoom = min(zoom, MAX_CLUSTER_ZOOM)
+    if bbox is None:
+        return zoom
+    min_lon, min_lat, max_lon, max_lat = bbox
+    width = (max_lon - min_lon if min_lon <= max_lon else 360 - (min_lon - max_lon)) / 360.0
+    height = float(mercator_y(min_lat) - mercator_y(max_lat))
+    while zoom > 0:
+        n = (2 ** zoom) * CELLS_PER_TILE
+        if np.ceil(width * n) * np.ceil(height * n) <= MAX_CELLS:
+            break
+        zoom -= 1
+    return zoom
+
+
+class ClusterLevel:
+    """Clusters at one zoom, as parallel arrays."""
+
+    def __init__(self, lon, lat, zoom):
+        cells = grid_cells(lon, lat, zoom)
+        # Airports are sorted busiest first, so each cell's first index is its top hub
+        _, self.top, inverse, self.count = np.unique(
+            cells, return_index=True, return_inverse=True, return_counts=True,
+        )
+        self.lon = np.bincount(inverse, weights=lon) / self.count
+        self.lat = np.bincount(inverse, weights=lat) / self.count
+
+    def within(self, bbox):
+        """Indices of clusters whose centroid lies in ``bbox``."""
+        if bbox is None:
+            return np.arange(len(self.count))
+        min_lon, min_lat, max_lon, max_lat = bbox
+        inside = (self.lat >= min_lat) & (self.lat <= max_lat)
+        if min_lon <= max_lon:
+            inside &= (self.lon >= min_lon) & (self.lon <= max_lon)
+        else:  # crosses the antimeridian
+            inside &= (self.lon >= min_lon) | (self.lon <= max_lon)
+        return np.flatnonzero(inside)
+
+
+class AirportClusters:
+    """Cluster levels for zooms 0..MAX_CLUSTER_ZOOM over one dataset version."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        lon = np.array([row["lon"] for row in rows], dtype=np.float64)
+        lat = np.array([row["lat"] for row in rows], dtype=np.float64)
+        self.levels = [ClusterLevel(lon, lat, zoom) for zoom in range(MAX_CLUSTER_ZOOM + 1)]
+
+    @classmethod
+    def build(cls, version):
+        queryset = Airport.objects.order_by(
+            "-is_major_hub", F("stats__degree").desc(nulls_last=True), "id"
+        )
+        return cls(version, list(airport_rows(queryset)))
+
+    def features(self, zoom, bbox=None):
+        """GeoJSON Point features, largest clusters first."""
+        level = self.levels[grid_zoom(zoom, bbox)]
+        found = level.within(bbox)
+        found = found[np.argsort(-level.count[found], kind="stable")]
+        for i in found.tolist():
+            top = self.rows[level.top[i]]
+            yield {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [round(float(level.lon[i]), 6), round(float(level.lat[i]), 6)],
+                },
+                "properties": {
+                    "count": int(level.count[i]),
+                    "top_hub": {
+                        "id": top["id"],
+                        "iata_code": top["iata_code"],
+                        "name": top["name"],
+                        "is_major_hub": top["is_major_hub"],
+                    },
+                },
+            }
+
+
+_clusters = PerVersion(AirportClusters.build)
+
+
+def get_airport_clusters():
+    return _clusters.get()
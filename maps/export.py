@@ -0,0 +1,267 @@
+"""
+Bulk exports of the airport and route tables in compact columnar formats.
+
+- ``fgb``: FlatGeobuf with its packed R-tree spatial index (needs GDAL's
+  ``osgeo`` bindings).
+- ``parquet``: GeoParquet 1.0, WKB geometry column (needs ``pyarrow``).
+- ``json``: columnar JSON, one array per column (coordinates as parallel
+  ``lon``/``lat`` arrays) instead of one object per feature.
+
+Rows are read from a server-side cursor ``CHUNK_SIZE`` at a time and written
+out as they arrive (a Parquet row group, or a slice of every JSON column,
+per chunk), so a dump is one sequential scan in constant memory. Finished
+files are cached on disk under ``EXPORT_CACHE_DIR/v<dataset version>/``
+like the vector tiles.
+"""
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import get_dataset_version
+from .geojson import CHUNK_SIZE, airport_rows, route_rows
+from .models import Airport, FlightRoute
+
+try:
+    from osgeo import ogr, osr
+except ImportError:  # FlatGeobuf export needs the GDAL Python bindings
+    ogr = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # GeoParquet export needs pyarrow
+    pa = None
+
+# Columns per layer as (name, type); types map to OGR and Arrow types below
+LAYER_COLUMNS = {
+    "airports": [
+        ("id", "int"), ("name", "str"), ("iata_code", "str"), ("city", "str"),
+        ("country", "str"), ("altitude_ft", "int"), ("is_major_hub", "bool"),
+        ("lon", "float"), ("lat", "float"),
+    ],
+    "routes": [
+        ("id", "int"), ("airline", "str"), ("distance_km", "float"),
+        ("origin_code", "str"), ("destination_code", "str"),
+        ("origin_lon", "float"), ("origin_lat", "float"),
+        ("destination_lon", "float"), ("destination_lat", "float"),
+    ],
+}
+
+GEOMETRY_TYPES = {"airports": "Point", "routes": "LineString"}
+
+FORMATS = {
+    "fgb": ("application/octet-stream", ".fgb"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "json": ("application/json", ".json"),
+}
+
+
+class ExportUnavailable(Exception):
+    """The format's optional dependency isn't installed."""
+
+
+def layer_rows(layer):
+    """Rows of ``layer`` in id order, from a server-side cursor."""
+    if layer == "airports":
+        queryset = airport_rows(Airport.objects.order_by("id"))
+    else:
+        queryset = route_rows(FlightRoute.objects.order_by("id"))
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    buf = []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+def wkb(layer, row):
+    """Little-endian WKB for a row's Point or two-point LineString."""
+    if layer == "airports":
+        return struct.pack("<BIdd", 1, 1, row["lon"], row["lat"])
+    return struct.pack(
+        "<BII4d", 1, 2, 2,
+        row["origin_lon"], row["origin_lat"], row["destination_lon"], row["destination_lat"],
+    )
+
+
+# ---------------------------------------------------------------------------
+# Writers: (layer, rows, path, version)
+# ---------------------------------------------------------------------------
+
+def write_json(layer, rows, path, version):
+    """
+    ``{"layer", "version", "count", "columns": {name: [values]}}``. Each
+    column is spooled to its own temp file chunk by chunk and the columns
+    are concatenated at the end.
+    """
+    names = [name for name, _ in LAYER_COLUMNS[layer]]
+    count = 0
+    with tempfile.TemporaryDirectory(dir=Path(path).parent) as spool_dir:
+        spools = {name: open(Path(spool_dir) / name, "w+", encoding="utf-8") for name in names}
+        try:
+            for chunk in chunks(rows):
+                for name, spool in spools.items():
+                    values = json.dumps([row[name] for row in chunk], ensure_ascii=False)[1:-1]
+                    spool.write(("," if count else "") + values)
+                count += len(chunk)
+
+            with open(path, "w", encoding="utf-8") as out:
+                head = json.dumps({"layer": layer, "version": version, "count": count})
+                out.write(head[:-1] + ',"columns":{')
+                for i, (name, spool) in enumerate(spools.items()):
+                    out.write(f'{"," if i else ""}{json.dumps(name)}:[')
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, out)
+                    out.write("]")
+                out.write("}}")
+        finally:
+            for spool in spools.values():
+                spool.close()
+    return count
+
+
+ARROW_TYPES = {"int": "int64", "str": "string", "float": "float64", "bool": "bool_"}
+
+
+def write_parquet(layer, rows, path, version):
+    """GeoParquet with one row group per chunk of rows."""
+    if pa is None:
+        raise ExportUnavailable("GeoParquet export needs pyarrow")
+    columns = LAYER_COLUMNS[layer]
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        # No "crs" member means OGC:CRS84 (lon/lat WGS84), as stored
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": [GEOMETRY_TYPES[layer]]}},
+    }
+    schema = pa.schema(
+        [(name, getattr(pa, ARROW_TYPES[kind])()) for name, kind in columns]
+        + [("geometry", pa.binary())],
+        metadata={"geo": json.dumps(geo), "maps_dataset_version": str(version)},
+    )
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks(rows):
+            data = {name: [row[name] for row in chunk] for name, _ in columns}
+            data["geometry"] = [wkb(layer, row) for row in chunk]
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def write_fgb(layer, rows, path, version):
+    """FlatGeobuf through OGR; the spatial index is written on close."""
+    if ogr is None:
+        raise ExportUnavailable("FlatGeobuf export needs the GDAL Python bindings (osgeo)")
+    ogr.UseExceptions()
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    driver = ogr.GetDriverByName("FlatGeobuf")
+    dataset = driver.CreateDataSource(str(path))
+    geom_type = ogr.wkbPoint if layer == "airports" else ogr.wkbLineString
+    out = dataset.CreateLayer(layer, srs, geom_type, options=["SPATIAL_INDEX=YES"])
+    for name, kind in LAYER_COLUMNS[layer]:
+        if kind == "float":
+            field = ogr.FieldDefn(name, ogr.OFTReal)
+        elif kind == "str":
+            field = ogr.FieldDefn(name, ogr.OFTString)
+        else:
+            field = ogr.FieldDefn(name, ogr.OFTInteger64 if kind == "int" else ogr.OFTInteger)
+            if kind == "bool":
+                field.SetSubType(ogr.OFSTBoolean)
+        out.CreateField(field)
+
+    definition = out.GetLayerDefn()
+    names = [name for name, _ in LAYER_COLUMNS[layer]]
+    count = 0
+    for row in rows:
+        feature = ogr.Feature(definition)
+        for i, name in enumerate(names):
+            value = row[name]
+            if value is None:
+                feature.SetFieldNull(i)
+            else:
+                feature.SetField(i, int(value) if isinstance(value, bool) else value)
+        feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb(layer, row)))
+        out.CreateFeature(feature)
+        count += 1
+    # Dropping the references closes the file and writes the index
+    out = dataset = None
+    return count
+
+
+WRITERS = {"fgb": write_fgb, "parquet": write_parquet, "json": write_json}
+
+
+def write_export(layer, fmt, path, version=None):
+    """Write ``layer`` in ``fmt`` to ``path``. Returns the number of rows."""
+    if version is None:
+        version = get_dataset_version()
+    return WRITERS[fmt](layer, layer_rows(layer), path, version)
+
+
+# ---------------------------------------------------------------------------
+# On-disk cache
+# ---------------------------------------------------------------------------
+
+def export_cache_dir():
+    return Path(settings.EXPORT_CACHE_DIR)
+
+
+def _prune_old_versions(root, current):
+    if not root.exists():
+        return
+    for child in root.iterdir():
+        if child.is_dir() and child.name != current:
+            shutil.rmtree(child, ignore_errors=True)
+
+
+def get_export(layer, fmt, version=None):
+    """
+    Path of the cached export for the current dataset version, writing it on
+    a miss.
+    """
+    if version is None:
+        version = get_dataset_version()
+    root = export_cache_dir()
+    version_dir = root / f"v{version}"
+    path = version_dir / f"{layer}{FORMATS[fmt][1]}"
+    if path.exists():
+        return path
+
+    if not version_dir.exists():
+        _prune_old_versions(root, version_dir.name)
+    version_dir.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temp file and rename, so readers never see a partial export
+    fd, tmp = tempfile.mkstemp(dir=version_dir, suffix=FORMATS[fmt][1])
+    os.close(fd)
+    try:
+        if fmt == "fgb":
+            os.unlink(tmp)  # OGR creates the file itself
+        write_export(layer, fmt, tmp, version)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return path
+
+
+def export_filename(layer, fmt, version):
+    return f"{layer}-v{version}{FORMATS[fmt][1]}"
+
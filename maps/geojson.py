@@ -0,0 +1,137 @@
+"""
+Streaming GeoJSON output for the map API.
+
+Airports and routes are read straight from ``.values()`` querysets with the
+raw lon/lat pulled out by PostGIS, so no GEOS objects are built and nothing
+is serialized twice. Features are encoded in chunks, so a FeatureCollection
+can be written out while the server-side cursor is still being read.
+"""
+
+import json
+
+from django.db.models import F, FloatField, Func
+
+# Features encoded per chunk written to the client
+CHUNK_SIZE = 2000
+
+AIRPORT_FIELDS = ("id", "name", "iata_code", "city", "country", "altitude_ft", "is_major_hub")
+
+
+class X(Func):
+    function = "ST_X"
+    output_field = FloatField()
+
+
+class Y(Func):
+    function = "ST_Y"
+    output_field = FloatField()
+
+
+def dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+# ---------------------------------------------------------------------------
+# Row projections
+# ---------------------------------------------------------------------------
+
+def airport_rows(queryset, *extra):
+    """
+    Project an Airport queryset to plain dicts with ``lon``/``lat`` (plus any
+    ``extra`` annotated fields).
+    """
+    return queryset.annotate(lon=X("geom"), lat=Y("geom")).values(*AIRPORT_FIELDS, "lon", "lat", *extra)
+
+
+def route_rows(queryset):
+    """Project a FlightRoute queryset to plain dicts with endpoint codes and coordinates."""
+    return queryset.annotate(
+        origin_code=F("origin__iata_code"),
+        destination_code=F("destination__iata_code"),
+        origin_lon=X("origin__geom"),
+        origin_lat=Y("origin__geom"),
+        destination_lon=X("destination__geom"),
+        destination_lat=Y("destination__geom"),
+    ).values(
+        "id",
+        "airline",
+        "distance_km",
+        "origin_code",
+        "destination_code",
+        "origin_lon",
+        "origin_lat",
+        "destination_lon",
+        "destination_lat",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Features
+# ---------------------------------------------------------------------------
+
+def airport_feature(row, **extra):
+    properties = {field: row[field] for field in AIRPORT_FIELDS}
+    properties.update(extra)
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [row["lon"], row["lat"]]},
+        "properties": properties,
+    }
+
+
+def route_feature(row, **extra):
+    properties = {
+        "id": row["id"],
+        "origin": row["origin_code"],
+        "destination": row["destination_code"],
+        "airline": row["airline"],
+        "distance_km": row["distance_km"],
+    }
+    properties.update(extra)
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": [
+                [row["origin_lon"], row["origin_lat"]],
+                [row["destination_lon"], row["destination_lat"]],
+            ],
+        },
+        "properties": properties,
+    }
+
+
+def airport_features(queryset):
+    for row in airport_rows(queryset).iterator(chunk_size=CHUNK_SIZE):
+        yield airport_feature(row)
+
+
+def route_features(queryset):
+    for row in route_rows(queryset).iterator(chunk_size=CHUNK_SIZE):
+        yield route_feature(row)
+
+
+# ---------------------------------------------------------------------------
+# FeatureCollection encoding
+# ---------------------------------------------------------------------------
+
+def iter_feature_collection(features, **members):
+    """
+    Encode an iterable of features as a FeatureCollection, one chunk of
+    ``CHUNK_SIZE`` features at a time. ``members`` (e.g. paging links) are
+    written as extra top-level keys ahead of the features.
+    """
+    head = dumps({"type": "FeatureCollection", **members})
+    yield (head[:-1] + ',"features":[').encode()
+    sep = ""
+    buf = []
+    for feature in features:
+        buf.append(dumps(feature))
+        if len(buf) >= CHUNK_SIZE:
+            yield (sep + ",".join(buf)).encode()
+            sep = ","
+            buf = []
+    if buf:
+        yield (sep + ",".join(buf)).encode()
+    yield b"]}"
+
@@ -0,0 +1,57 @@
+"""
+Route geometry and distance, derived from the positions of the airports.
+
+A route's ``geom`` is the two-point line between its airports and
+``distance_km`` the great-circle length of that line. Both are computed in
+Python for single saves (from coordinates already in hand) and in one
+set-based ``UPDATE ... FROM maps_airport`` when airports move. The SQL uses
+the spherical geography length, whose radius matches ``EARTH_RADIUS_KM``, so
+it agrees with the loaders' NumPy haversine.
+"""
+
+import numpy as np
+from django.db import connection
+
+# Mean Earth radius, as used by PostGIS for spherical geography measurements
+EARTH_RADIUS_KM = 6371.0088
+
+ROUTE_GEOMETRY_SQL = """
+UPDATE maps_flightroute r
+SET geom = ST_MakeLine(o.geom, d.geom),
+    distance_km = ST_Length(ST_MakeLine(o.geom, d.geom)::geography, false) / 1000.0
+FROM maps_airport o, maps_airport d
+WHERE o.id = r.origin_id AND d.id = r.destination_id
+  AND {where}
+  AND (r.geom IS NULL OR r.distance_km IS NULL
+       OR NOT ST_OrderingEquals(r.geom, ST_MakeLine(o.geom, d.geom)))
+RETURNING r.origin_id, r.destination_id
+"""
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works on scalars or NumPy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def refresh_route_geometry(airport_ids=None):
+    """
+    Recompute ``geom`` and ``distance_km`` of the routes touching
+    ``airport_ids`` (all routes if None) in one statement. Routes that are
+    already up to date are left alone. Returns the ids of the airports at
+    either end of the updated routes, whose route-km has changed.
+    """
+    if airport_ids is None:
+        where, params = "TRUE", []
+    else:
+        ids = sorted({i for i in airport_ids if i is not None})
+        if not ids:
+            return set()
+        where, params = "(r.origin_id = ANY(%s) OR r.destination_id = ANY(%s))", [ids, ids]
+    with connection.cursor() as cursor:
+        cursor.execute(ROUTE_GEOMETRY_SQL.format(where=where), params)
+        return {airport_id for row in cursor.fetchall() for airport_id in row}
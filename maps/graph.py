@@ -0,0 +1,255 @@
+"""
+In-memory route graph.
+
+``FlightRoute`` rows are loaded once per dataset version into a compressed
+sparse row (CSR) adjacency over airport indices, one edge per
+(origin, destination) pair weighted by ``distance_km``. The airlines flying
+each edge are kept in a second CSR so searches can be limited to an airline.
+Multi-hop searches then run in Python/NumPy without touching the database.
+"""
+
+import heapq
+
+import numpy as np
+
+from .cache import PerVersion
+from .geojson import airport_rows
+from .geometry import haversine_km
+from .models import Airport, FlightRoute
+
+
+class RouteGraph:
+    """
+    CSR route graph over airports.
+
+    Node ``i`` is ``airports[i]``; its outgoing edges are
+    ``indices[indptr[i]:indptr[i + 1]]`` with lengths in ``weights``.
+    The airlines on edge ``e`` are ``airlines[edge_airline_ids[a]]`` for
+    ``a`` in ``edge_airline_ptr[e]:edge_airline_ptr[e + 1]``.
+    """
+
+    def __init__(self, version, airports, origins, destinations, airline_names, distances):
+        self.version = version
+        self.airports = airports
+        self.ids = np.array([a["id"] for a in airports], dtype=np.int64)
+        self.lon = np.array([a["lon"] for a in airports], dtype=np.float64)
+        self.lat = np.array([a["lat"] for a in airports], dtype=np.float64)
+        self.index_by_iata = {a["iata_code"].upper(): i for i, a in enumerate(airports)}
+        n = len(airports)
+
+        # Map airport ids to node indices (ids are sorted)
+        src = np.searchsorted(self.ids, np.asarray(origins, dtype=np.int64))
+        dst = np.searchsorted(self.ids, np.asarray(destinations, dtype=np.int64))
+        dist = np.array([np.nan if d is None else d for d in distances], dtype=np.float64)
+        missing = np.isnan(dist)
+        dist[missing] = haversine_km(self.lat[src[missing]], self.lon[src[missing]],
+                                     self.lat[dst[missing]], self.lon[dst[missing]])
+
+        # One edge per (origin, destination); unique keys come out sorted by origin
+        keys, edge_of_route = np.unique(src * n + dst, return_inverse=True)
+        self.indices = (keys % n).astype(np.int32)
+        edge_src = keys // n
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_src, minlength=n), out=self.indptr[1:])
+        self.weights = np.full(len(keys), np.inf)
+        np.minimum.at(self.weights, edge_of_route, dist)
+
+        # Airlines per edge, as a second CSR
+        self.airlines, airline_of_route = np.unique(np.asarray(airline_names, dtype=object).astype(str),
+                                                    return_inverse=True)
+        order = np.lexsort((airline_of_route, edge_of_route))
+        self.edge_airline_ids = airline_of_route[order].astype(np.int32)
+        self.edge_airline_ptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_of_route, minlength=len(keys)), out=self.edge_airline_ptr[1:])
+
+        self.edge_src = edge_src.astype(np.int32)
+        self._adjacency = None
+
+    @classmethod
+    def build(cls, version):
+        airports = list(airport_rows(Airport.objects.order_by("id")))
+        routes = list(FlightRoute.objects.values_list("origin_id", "destination_id", "airline", "distance_km"))
+        origins, destinations, airlines, distances = zip(*routes) if routes else ((), (), (), ())
+        return cls(version, airports, origins, destinations, airlines, distances)
+
+    def __len__(self):
+        return len(self.airports)
+
+    # -----------------------------------------------------------------------
+    # Helpers
+    # -----------------------------------------------------------------------
+
+    def node(self, iata_code):
+        return self.index_by_iata.get((iata_code or "").upper())
+
+    def edge_airlines(self, edge):
+        lo, hi = self.edge_airline_ptr[edge], self.edge_airline_ptr[edge + 1]
+        return [str(self.airlines[a]) for a in self.edge_airline_ids[lo:hi]]
+
+    def airline_edge_mask(self, airline):
+        """Boolean mask of edges flown by ``airline`` (all True if None)."""
+        if not airline:
+            return np.ones(len(self.indices), dtype=bool)
+        match = np.flatnonzero(self.airlines == airline.upper())
+        flown = np.isin(self.edge_airline_ids, match)
+        counts = np.add.reduceat(flown, self.edge_airline_ptr[:-1]) if len(flown) else flown
+        return np.asarray(counts, dtype=bool)
+
+    def distances_to(self, node):
+        """Great-circle km from every airport to ``node``."""
+        return haversine_km(self.lat, self.lon, self.lat[node], self.lon[node])
+
+    def adjacency(self):
+        """Plain-list copy of the CSR for tight Python loops."""
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self._adjacency
+
+    def find_edge(self, a, b):
+        lo, hi = self.indptr[a], self.indptr[a + 1]
+        pos = lo + np.searchsorted(self.indices[lo:hi], b)
+        return int(pos) if pos < hi and self.indices[pos] == b else None
+
+    # -----------------------------------------------------------------------
+    # Searches
+    # -----------------------------------------------------------------------
+
+    def hops_to(self, target, max_hops, mask=None):
+        """
+        Fewest flights from every airport to ``target`` over the edges in
+        ``mask`` (all if None); -1 where it takes more than ``max_hops``.
+        Breadth-first over reversed edges, one vectorized layer per hop.
+        """
+        src, dst = self.edge_src, self.indices
+        if mask is not None:
+            src, dst = src[mask], dst[mask]
+        hops = np.full(len(self), -1, dtype=np.int32)
+        hops[target] = 0
+        frontier = np.zeros(len(self), dtype=bool)
+        frontier[target] = True
+        for hop in range(1, max_hops + 1):
+            reached = np.zeros(len(self), dtype=bool)
+            reached[src[frontier[dst]]] = True
+            frontier = reached & (hops < 0)
+            if not frontier.any():
+                break
+            hops[frontier] = hop
+        return hops
+
+    def shortest_paths(self, source, target, k=3, max_hops=3, airline=None):
+        """
+        The ``k`` shortest loop-free itineraries from ``source`` to
+        ``target`` with at most ``max_hops`` flights.
+
+        A* over (path, distance) labels with the great-circle distance to
+        the target as heuristic (admissible, since every leg is at least
+        that long). Legs are only taken to airports that can still reach
+        the target within the remaining hops, so an unreachable target
+        returns at once. Paths ending at the same airport through the same
+        set of airports have the same continuations, so each such state is
+        expanded at most ``k`` times.
+        Returns a list of (distance_km, [node, ...]).
+        """
+        indptr, indices, weights = self.adjacency()
+        mask = self.airline_edge_mask(airline) if airline else None
+        allowed = mask.tolist() if mask is not None else None
+        to_target = self.hops_to(target, max_hops, mask)
+        if to_target[source] < 0:
+            return []
+        to_target = to_target.tolist()
+        h = self.distances_to(target).tolist()
+
+        heap = [(h[source], 0.0, (source,))]
+        expanded = {}
+        results = []
+        while heap and len(results) < k:
+            _, g, path = heapq.heappop(heap)
+            node = path[-1]
+            if node == target:
+                results.append((g, list(path)))
+                continue
+            state = (node, frozenset(path))
+            if expanded.get(state, 0) >= k:
+                continue
+            expanded[state] = expanded.get(state, 0) + 1
+            hops = len(path)
+            for e in range(indptr[node], indptr[node + 1]):
+                nxt = indices[e]
+                if not 0 <= to_target[nxt] <= max_hops - hops or nxt in path:
+                    continue
+                if allowed is not None and not allowed[e]:
+                    continue
+                cost = g + weights[e]
+                heapq.heappush(heap, (cost + h[nxt], cost, path + (nxt,)))
+        return results
+
+    def reachability(self, source, max_hops=2, max_km=None, airline=None):
+        """
+        Airports reachable from ``source`` in at most ``max_hops`` flights
+        (and, if given, at most ``max_km`` flown in total).
+
+        Bellman-Ford style relaxation one hop layer at a time, vectorized
+        over the edges leaving airports that improved in the last layer.
+        Returns (hops, distance_km) arrays; unreachable airports have
+        hops == -1 and distance == inf.
+        """
+        mask = self.airline_edge_mask(airline)
+        src, dst, w = self.edge_src[mask], self.indices[mask], self.weights[mask]
+
+        dist = np.full(len(self), np.inf)
+        hops = np.full(len(self), -1, dtype=np.int32)
+        dist[source] = 0.0
+        hops[source] = 0
+        frontier = np.zeros(len(self), dtype=bool)
+        frontier[source] = True
+
+        for hop in range(1, max_hops + 1):
+            active = frontier[src]
+            if not active.any():
+                break
+            candidate = dist[src[active]] + w[active]
+            if max_km is not None:
+                keep = candidate <= max_km
+                candidate, targets = candidate[keep], dst[active][keep]
+            else:
+                targets = dst[active]
+            new = dist.copy()
+            np.minimum.at(new, targets, candidate)
+            frontier = new < dist
+            hops[frontier & (hops < 0)] = hop
+            dist = new
+        return hops, dist
+
+    def itinerary_feature(self, rank, distance, path):
+        """GeoJSON LineString feature for one itinerary through ``path``."""
+        legs = []
+        for a, b in zip(path, path[1:]):
+            edge = self.find_edge(a, b)
+            legs.append({
+                "origin": self.airports[a]["iata_code"],
+                "destination": self.airports[b]["iata_code"],
+                "distance_km": round(float(self.weights[edge]), 1),
+                "airlines": self.edge_airlines(edge),
+            })
+        return {
+            "type": "Feature",
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[self.airports[n]["lon"], self.airports[n]["lat"]] for n in path],
+            },
+            "properties": {
+                "rank": rank,
+                "distance_km": round(distance, 1),
+                "hops": len(path) - 1,
+                "airports": [self.airports[n]["iata_code"] for n in path],
+                "legs": legs,
+            },
+        }
+
+
+_graph = PerVersion(RouteGraph.build)
+
+
+def get_route_graph():
+    """Return the route graph for the current dataset version, building it once."""
+    return _graph.get()
@@ -0,0 +1,657 @@
+"""
+Bulk ingest helpers for the OpenFlights loaders.
+
+Rows are parsed and validated in Python into plain tuples, streamed into a
+temporary staging table with ``COPY``, and merged into the real table with a
+single ``INSERT ... ON CONFLICT DO UPDATE``.
+
+Every row also gets a key and a fingerprint. ``IngestManifest`` keeps the
+fingerprints from the last run, so an incremental load can diff against it
+and apply only inserts, updates and deletes.
+
+For large files the parse/COPY step can run in a process pool over byte
+ranges of the input, each worker writing to a shared UNLOGGED staging table
+over its own connection; the merge then picks one row per key by
+(chunk, row) order, so the result doesn't depend on worker timing.
+"""
+
+import csv
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.db import connection, connections, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from .geojson import X, Y
+from .geometry import haversine_km
+from .models import Airport, IngestManifest
+
+# Columns Airport rows are staged with
+AIRPORT_COLUMNS = ("iata_code", "name", "city", "country", "lon", "lat")
+# Columns FlightRoute rows are staged with
+ROUTE_COLUMNS = ("origin_id", "destination_id", "airline", "geom", "distance_km")
+NAME_MAX_LENGTH = 120
+
+
+class SkipRow(Exception):
+    """Raised by the row parsers with the reason a row is rejected."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def fingerprint(*values):
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _text(value):
+    return (value or "").strip('" ')[:NAME_MAX_LENGTH]
+
+
+# ---------------------------------------------------------------------------
+# Airports
+# ---------------------------------------------------------------------------
+
+def airport_record(row):
+    """
+    Validate one airports.dat row and return
+    (iata_code, name, city, country, lon, lat). Raises SkipRow.
+
+    1,"Goroka Airport","Goroka","Papua New Guinea","GKA","AYGA",-6.08,145.39,5282,...
+    """
+    if not row or len(row) < 8:
+        raise SkipRow("short_row")
+
+    name = _text(row[1])
+    city = _text(row[2])
+    country = _text(row[3])
+    iata = (row[4] or "").strip('" ').upper()
+    try:
+        lat = float(row[6])
+        lon = float(row[7])
+    except ValueError:
+        raise SkipRow("bad_coordinates")
+
+    if not iata or len(iata) != 3:
+        raise SkipRow("no_iata")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise SkipRow("out_of_range")
+    if "heli" in name.lower() or "seaplane" in name.lower():
+        raise SkipRow("heli_or_seaplane")
+    if country.strip().lower() in ["antarctica", "unknown"]:
+        raise SkipRow("excluded_country")
+
+    return (iata, name or "Unnamed Airport", city, country, lon, lat)
+
+
+def read_airports(lines):
+    """
+    Parse airports.dat lines. Returns ({iata_code: record}, Counter of skip
+    reasons). A later row for the same IATA code replaces an earlier one.
+    """
+    records = {}
+    skipped = Counter()
+    for row in csv.reader(lines):
+        try:
+            record = airport_record(row)
+        except SkipRow as skip:
+            skipped[skip.reason] += 1
+            continue
+        if record[0] in records:
+            skipped["duplicate_iata"] += 1
+        records[record[0]] = record
+    return records, skipped
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+
+class RouteBatch:
+    """
+    Routes parsed into columns: airport ids, endpoint coordinates and
+    airline codes, one entry per unique (origin, destination, airline).
+    """
+
+    def __init__(self, origin_ids, destination_ids, airlines, coords):
+        self.origin_ids = np.asarray(origin_ids, dtype=np.int64)
+        self.destination_ids = np.asarray(destination_ids, dtype=np.int64)
+        self.airlines = airlines
+        # (n, 4) array of origin lon/lat, destination lon/lat
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.airlines)
+
+    def distances(self):
+        """Great-circle km for every route in one vectorized call."""
+        c = self.coords
+        return haversine_km(c[:, 1], c[:, 0], c[:, 3], c[:, 2])
+
+    def ewkb_hex(self):
+        """Hex EWKB (SRID 4326, two-point LineString) for every route."""
+        record = np.dtype([
+            ("order", "u1"), ("type", "<u4"), ("srid", "<u4"), ("npoints", "<u4"), ("coords", "<f8", (4,)),
+        ])
+        wkb = np.empty(len(self), dtype=record)
+        wkb["order"] = 1  # little endian
+        wkb["type"] = 0x20000002  # LineString with SRID flag
+        wkb["srid"] = 4326
+        wkb["npoints"] = 2
+        wkb["coords"] = self.coords
+        hexed = wkb.tobytes().hex()
+        width = record.itemsize * 2
+        return [hexed[i:i + width] for i in range(0, len(hexed), width)]
+
+    def keys(self):
+        """Manifest key per route: ``origin_id:destination_id:airline``."""
+        return [
+            f"{o}:{d}:{a}"
+            for o, d, a in zip(self.origin_ids.tolist(), self.destination_ids.tolist(), self.airlines)
+        ]
+
+    def fingerprints(self):
+        return [fingerprint(key, coords) for key, coords in zip(self.keys(), self.coords.tolist())]
+
+    def take(self, positions):
+        """A new batch with only the routes at ``positions``."""
+        positions = np.asarray(positions, dtype=np.int64)
+        return RouteBatch(
+            self.origin_ids[positions],
+            self.destination_ids[positions],
+            [self.airlines[i] for i in positions.tolist()],
+            self.coords[positions],
+        )
+
+    def rows(self):
+        """Staging rows in ``ROUTE_COLUMNS`` order."""
+        return zip(
+            self.origin_ids.tolist(),
+            self.destination_ids.tolist(),
+            self.airlines,
+            self.ewkb_hex(),
+            self.distances().tolist(),
+        )
+
+
+def airport_lookup():
+    """{IATA code: (id, lon, lat)} for every airport with a 3-letter code."""
+    rows = Airport.objects.annotate(lon=X("geom"), lat=Y("geom")).values_list("iata_code", "id", "lon", "lat")
+    return {code.upper(): (pk, lon, lat) for code, pk, lon, lat in rows if code and len(code) == 3}
+
+
+def read_routes(lines, airports):
+    """
+    Parse routes.dat lines against an ``airport_lookup()`` dict.
+    Returns (RouteBatch, Counter of skip reasons).
+
+    2B,410,AER,2965,KZN,2990,,0,CR2
+    """
+    seen = set()
+    origin_ids, destination_ids, airlines, coords = [], [], [], []
+    skipped = Counter()
+    for row in csv.reader(lines):
+        if not row or len(row) < 6:
+            skipped["short_row"] += 1
+            continue
+        airline = (row[0] or "").strip().upper()[:NAME_MAX_LENGTH]
+        src = (row[2] or "").strip().upper()
+        dst = (row[4] or "").strip().upper()
+        if len(src) != 3 or len(dst) != 3:
+            skipped["no_iata"] += 1
+            continue
+        if src == dst:
+            skipped["same_airport"] += 1
+            continue
+        a1 = airports.get(src)
+        a2 = airports.get(dst)
+        if not a1 or not a2:
+            skipped["unknown_airport"] += 1
+            continue
+        key = (a1[0], a2[0], airline)
+        if key in seen:
+            skipped["duplicate_route"] += 1
+            continue
+        seen.add(key)
+        origin_ids.append(a1[0])
+        destination_ids.append(a2[0])
+        airlines.append(airline)
+        coords.extend((a1[1], a1[2], a2[1], a2[2]))
+    return RouteBatch(origin_ids, destination_ids, airlines, coords), skipped
+
+
+# ---------------------------------------------------------------------------
+# COPY + merge
+# ---------------------------------------------------------------------------
+
+class CsvStream(io.TextIOBase):
+    """Read-only file over rows encoded as CSV on demand, for COPY FROM STDIN."""
+
+    def __init__(self, rows, batch=5000):
+        self._rows = iter(rows)
+        self._batch = batch
+        self._buffer = ""
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out, lineterminator="\n")
+
+    def readable(self):
+        return True
+
+    def _fill(self, size):
+        while size < 0 or len(self._buffer) < size:
+            self._out.seek(0)
+            self._out.truncate()
+            for _, row in zip(range(self._batch), self._rows):
+                self._writer.writerow(row)
+            chunk = self._out.getvalue()
+            if not chunk:
+                break
+            self._buffer += chunk
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+COPY_BLOCK_SIZE = 1 << 16
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Stream ``rows`` into ``table`` with COPY (CSV format), on either driver:
+    Django uses psycopg 3 whenever it is installed (the async pool needs
+    it), and psycopg 3 cursors have ``copy()`` instead of ``copy_expert``.
+    """
+    cols = ", ".join(columns)
+    sql = f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL ({cols}))"
+    stream = CsvStream(rows)
+    if is_psycopg3:
+        with cursor.copy(sql) as copy:
+            while block := stream.read(COPY_BLOCK_SIZE):
+                copy.write(block)
+    else:
+        cursor.copy_expert(sql, stream)
+
+
+AIRPORT_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS airport_staging (
+    iata_code varchar(10) PRIMARY KEY,
+    name varchar(120),
+    city varchar(120),
+    country varchar(120),
+    lon double precision,
+    lat double precision
+) ON COMMIT DROP
+"""
+
+AIRPORT_MERGE_SQL = """
+INSERT INTO maps_airport (iata_code, name, city, country, geom, altitude_ft, is_major_hub)
+SELECT iata_code, name, city, country, ST_SetSRID(ST_MakePoint(lon, lat), 4326), NULL, false
+FROM airport_staging
+ON CONFLICT (iata_code) DO UPDATE SET
+    name = EXCLUDED.name,
+    city = EXCLUDED.city,
+    country = EXCLUDED.country,
+    geom = EXCLUDED.geom
+RETURNING (xmax = 0)
+"""
+
+
+def merge_airports(records):
+    """
+    COPY airport records into a staging table and upsert them on
+    ``iata_code``. Returns (inserted, updated).
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(AIRPORT_STAGING_SQL)
+        cursor.execute("TRUNCATE airport_staging")
+        copy_rows(cursor, "airport_staging", AIRPORT_COLUMNS, records)
+        cursor.execute(AIRPORT_MERGE_SQL)
+        flags = [row[0] for row in cursor.fetchall()]
+    inserted = sum(flags)
+    return inserted, len(flags) - inserted
+
+
+ROUTE_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS route_staging (
+    origin_id bigint,
+    destination_id bigint,
+    airline varchar(120),
+    geom geometry(LineString, 4326),
+    distance_km double precision
+) ON COMMIT DROP
+"""
+
+ROUTE_MERGE_SQL = """
+INSERT INTO maps_flightroute (origin_id, destination_id, airline, geom, distance_km)
+SELECT origin_id, destination_id, airline, geom, distance_km
+FROM route_staging
+ON CONFLICT (origin_id, destination_id, airline) DO UPDATE SET
+    geom = EXCLUDED.geom,
+    distance_km = EXCLUDED.distance_km
+RETURNING (xmax = 0)
+"""
+
+
+def merge_routes(batch):
+    """
+    COPY a RouteBatch into a staging table and upsert it on
+    (origin, destination, airline). Returns (inserted, updated).
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(ROUTE_STAGING_SQL)
+        cursor.execute("TRUNCATE route_staging")
+        copy_rows(cursor, "route_staging", ROUTE_COLUMNS, batch.rows())
+        cursor.execute(ROUTE_MERGE_SQL)
+        flags = [row[0] for row in cursor.fetchall()]
+    inserted = sum(flags)
+    return inserted, len(flags) - inserted
+
+
+# ---------------------------------------------------------------------------
+# Deletes
+# ---------------------------------------------------------------------------
+
+def delete_airports(iata_codes):
+    """Delete airports (and the routes touching them) by IATA code."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM maps_flightroute r USING maps_airport a
+            WHERE a.iata_code = ANY(%s) AND (r.origin_id = a.id OR r.destination_id = a.id)
+            """,
+            [list(iata_codes)],
+        )
+        cursor.execute("DELETE FROM maps_airport WHERE iata_code = ANY(%s)", [list(iata_codes)])
+        return cursor.rowcount
+
+
+def delete_routes(keys):
+    """Delete routes by manifest key (``origin_id:destination_id:airline``)."""
+    origins, destinations, airlines = [], [], []
+    for key in keys:
+        origin, destination, airline = key.split(":", 2)
+        origins.append(int(origin))
+        destinations.append(int(destination))
+        airlines.append(airline)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM maps_flightroute r
+            USING unnest(%s::bigint[], %s::bigint[], %s::text[]) AS d(origin_id, destination_id, airline)
+            WHERE r.origin_id = d.origin_id AND r.destination_id = d.destination_id AND r.airline = d.airline
+            """,
+            [origins, destinations, airlines],
+        )
+        return cursor.rowcount
+
+
+def touched_airports(keys):
+    """Airport ids at either end of the routes with these manifest keys."""
+    ids = set()
+    for key in keys:
+        origin, destination, _ = key.split(":", 2)
+        ids.update((int(origin), int(destination)))
+    return ids
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+
+class Delta:
+    """Keys to insert, update and delete relative to the last ingest."""
+
+    def __init__(self, inserts, updates, deletes, unchanged):
+        self.inserts = inserts
+        self.updates = updates
+        self.deletes = deletes
+        self.unchanged = unchanged
+
+    def __bool__(self):
+        return bool(self.inserts or self.updates or self.deletes)
+
+    @property
+    def upserts(self):
+        return self.inserts + self.updates
+
+    def report(self, sample=5):
+        """Lines describing the change set, with a few example keys each."""
+        lines = [
+            f"{len(self.inserts)} to insert, {len(self.updates)} to update, "
+            f"{len(self.deletes)} to delete, {self.unchanged} unchanged"
+        ]
+        for label, keys in (("insert", self.inserts), ("update", self.updates), ("delete", self.deletes)):
+            if keys:
+                more = f" (+{len(keys) - sample} more)" if len(keys) > sample else ""
+                lines.append(f"  {label}: {', '.join(keys[:sample])}{more}")
+        return lines
+
+
+def load_manifest(source):
+    return dict(IngestManifest.objects.filter(source=source).values_list("key", "fingerprint"))
+
+
+def diff_manifest(source, current):
+    """Compare ``{key: fingerprint}`` from this run against the stored manifest."""
+    previous = load_manifest(source)
+    inserts, updates = [], []
+    for key, fp in current.items():
+        old = previous.get(key)
+        if old is None:
+            inserts.append(key)
+        elif old != fp:
+            updates.append(key)
+    deletes = [key for key in previous if key not in current]
+    unchanged = len(current) - len(inserts) - len(updates)
+    return Delta(sorted(inserts), sorted(updates), sorted(deletes), unchanged)
+
+
+def save_manifest(source, fingerprints):
+    """Upsert ``{key: fingerprint}`` entries for ``source``."""
+    IngestManifest.objects.bulk_create(
+        [IngestManifest(source=source, key=key, fingerprint=fp) for key, fp in fingerprints.items()],
+        update_conflicts=True,
+        unique_fields=["source", "key"],
+        update_fields=["fingerprint"],
+    )
+
+
+def forget_manifest(source, keys):
+    IngestManifest.objects.filter(source=source, key__in=list(keys)).delete()
+
+
+# ---------------------------------------------------------------------------
+# Parallel chunked ingest
+# ---------------------------------------------------------------------------
+
+PARALLEL_SPECS = {
+    "airports": {
+        "columns": AIRPORT_COLUMNS,
+        "staging": """
+            iata_code varchar(10),
+            name varchar(120),
+            city varchar(120),
+            country varchar(120),
+            lon double precision,
+            lat double precision
+        """,
+        "merge": """
+            INSERT INTO maps_airport (iata_code, name, city, country, geom, altitude_ft, is_major_hub)
+            SELECT iata_code, name, city, country, ST_SetSRID(ST_MakePoint(lon, lat), 4326), NULL, false
+            FROM (
+                SELECT DISTINCT ON (iata_code) * FROM {table}
+                ORDER BY iata_code, chunk_no DESC, row_no DESC
+            ) picked
+            ON CONFLICT (iata_code) DO UPDATE SET
+                name = EXCLUDED.name,
+                city = EXCLUDED.city,
+                country = EXCLUDED.country,
+                geom = EXCLUDED.geom
+            RETURNING (xmax = 0)
+        """,
+        # Later rows win, as in a sequential load
+        "order": "DESC",
+        "duplicate": "duplicate_iata",
+    },
+    "routes": {
+        "columns": ROUTE_COLUMNS,
+        "staging": """
+            origin_id bigint,
+            destination_id bigint,
+            airline varchar(120),
+            geom geometry(LineString, 4326),
+            distance_km double precision
+        """,
+        "merge": """
+            INSERT INTO maps_flightroute (origin_id, destination_id, airline, geom, distance_km)
+            SELECT origin_id, destination_id, airline, geom, distance_km
+            FROM (
+                SELECT DISTINCT ON (origin_id, destination_id, airline) * FROM {table}
+                ORDER BY origin_id, destination_id, airline, chunk_no, row_no
+            ) picked
+            ON CONFLICT (origin_id, destination_id, airline) DO UPDATE SET
+                geom = EXCLUDED.geom,
+                distance_km = EXCLUDED.distance_km
+            RETURNING (xmax = 0)
+        """,
+        # The first row wins, as in a sequential load
+        "order": "ASC",
+        "duplicate": "duplicate_route",
+    },
+}
+
+PARALLEL_MANIFEST_SQL = """
+INSERT INTO maps_ingestmanifest (source, key, fingerprint)
+SELECT DISTINCT ON (key) %s, key, fingerprint FROM {table}
+ORDER BY key, chunk_no {order}, row_no {order}
+ON CONFLICT (source, key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint
+"""
+
+# Set per worker process by _init_worker
+_worker_airports = None
+
+
+def byte_ranges(path, parts):
+    """Split a file into up to ``parts`` (start, end) byte ranges on line boundaries."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode("utf-8").splitlines(keepends=True)
+
+
+def _init_worker(airports):
+    global _worker_airports
+    _worker_airports = airports
+
+
+def _ingest_chunk(kind, path, start, end, chunk_no, table):
+    """Worker: parse one byte range and COPY it into the staging table."""
+    lines = _read_range(path, start, end)
+    if kind == "airports":
+        records, skipped = read_airports(lines)
+        rows = list(records.values())
+        fingerprints = [fingerprint(*record) for record in rows]
+        keys = list(records)
+    else:
+        batch, skipped = read_routes(lines, _worker_airports)
+        rows = batch.rows()
+        fingerprints = batch.fingerprints()
+        keys = batch.keys()
+
+    columns = ("chunk_no", "row_no", *PARALLEL_SPECS[kind]["columns"], "key", "fingerprint")
+    staged = (
+        (chunk_no, row_no, *row, key, fp)
+        for row_no, (row, key, fp) in enumerate(zip(rows, keys, fingerprints))
+    )
+    try:
+        with connection.cursor() as cursor:
+            copy_rows(cursor, table, columns, staged)
+    finally:
+        connection.close()
+    return len(keys), skipped
+
+
+def parallel_supported():
+    """Whether ``parallel_ingest`` can run here: its workers are forked."""
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def parallel_ingest(kind, path, workers, airports=None):
+    """
+    Parse ``path`` in ``workers`` processes and merge it in one statement.
+    ``kind`` is "airports" or "routes" (which needs an ``airport_lookup()``).
+    Returns (inserted, updated, Counter of skip reasons, staged_at), where
+    ``staged_at`` is the ``time.perf_counter()`` at which every chunk had
+    been parsed and staged, so callers can split parse and merge time.
+    """
+    spec = PARALLEL_SPECS[kind]
+    table = f"{kind}_staging_{uuid.uuid4().hex[:8]}"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE UNLOGGED TABLE {table} (chunk_no int, row_no int, {spec['staging']}, "
+            f"key varchar(160), fingerprint varchar(32))"
+        )
+
+    try:
+        # Workers are forked: they must not share the parent's connections
+        connections.close_all()
+        tasks = [
+            (kind, path, start, end, chunk_no, table)
+            for chunk_no, (start, end) in enumerate(byte_ranges(path, workers))
+        ]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(airports,),
+        ) as pool:
+            results = list(pool.map(_ingest_chunk, *zip(*tasks)))
+        staged_at = time.perf_counter()
+
+        skipped = Counter()
+        staged = 0
+        for count, chunk_skipped in results:
+            staged += count
+            skipped.update(chunk_skipped)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(spec["merge"].format(table=table))
+            flags = [row[0] for row in cursor.fetchall()]
+            cursor.execute(PARALLEL_MANIFEST_SQL.format(table=table, order=spec["order"]), [kind])
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    if staged > len(flags):
+        skipped[spec["duplicate"]] += staged - len(flags)
+    inserted = sum(flags)
+    return inserted, len(flags) - inserted, skipped, staged_at
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from maps.benchmark import SCALES, compare, environment, run_scale
+from datetime import datetime, timezone
+import json
+import tempfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the loaders and read endpoints on synthetic OpenFlights-shaped data at 1x/10x/100x "
+        "scale. Runs in a separate test database and writes JSON results tagged with the git commit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", nargs="+", choices=list(SCALES), default=["1x"],
+            help="Data sizes relative to OpenFlights (default 1x)",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Timed calls per endpoint (default 20)")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+        parser.add_argument("--workers", type=int, default=1, help="Passed to the loaders' --workers")
+        parser.add_argument("--output", help="Write results JSON here instead of stdout")
+        parser.add_argument("--compare", help="Earlier results JSON to print p95 ratios against")
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Reuse the benchmark database instead of creating and dropping it",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        baseline = None
+        if opts["compare"]:
+            with open(opts["compare"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=opts["keepdb"])
+        try:
+            with tempfile.TemporaryDirectory() as workdir, override_settings(
+                ALLOWED_HOSTS=["*"], TILE_CACHE_DIR=f"{workdir}/tiles",
+            ):
+                results = {
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "environment": environment(),
+                    "repeat": opts["repeat"],
+                    "seed": opts["seed"],
+                    "scales": {
+                        scale: run_scale(
+                            scale, workdir, repeat=opts["repeat"], seed=opts["seed"],
+                            workers=opts["workers"], log=self.stderr.write,
+                        )
+                        for scale in opts["scale"]
+                    },
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=opts["keepdb"])
+
+        body = json.dumps(results, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                f.write(body + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote results to {opts['output']}"))
+        else:
+            self.stdout.write(body)
+
+        if baseline:
+            self.stdout.write(self.style.MIGRATE_HEADING("p95 ms vs baseline (ratio > 1 is slower)"))
+            for scale, name, cache, before, after, ratio in compare(baseline, results):
+                self.stdout.write(f"  {scale:>4} {name:<24} {cache:<4} {before:>10.2f} {after:>10.2f} {ratio}")
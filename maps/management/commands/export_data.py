@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from maps.cache import get_dataset_version
+from maps.export import FORMATS, LAYER_COLUMNS, ExportUnavailable, export_filename, write_export
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the airports or routes table as FlatGeobuf (fgb), GeoParquet (parquet) or "
+        "columnar JSON (json), streamed from a server-side cursor in one sequential scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("layer", choices=sorted(LAYER_COLUMNS), help="Table to export")
+        parser.add_argument(
+            "--format", dest="fmt", choices=sorted(FORMATS), default="parquet",
+            help="Output format (default: parquet)",
+        )
+        parser.add_argument(
+            "--output", type=str, default=None,
+            help="Output file (default: <layer>-v<dataset version>.<ext> in the current directory)",
+        )
+
+    def handle(self, *args, **opts):
+        layer, fmt = opts["layer"], opts["fmt"]
+        version = get_dataset_version()
+        output = opts["output"] or export_filename(layer, fmt, version)
+        if fmt == "fgb" and os.path.exists(output):
+            # OGR refuses to overwrite an existing FlatGeobuf file
+            os.unlink(output)
+
+        started = time.perf_counter()
+        try:
+            count = write_export(layer, fmt, output, version)
+        except ExportUnavailable as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        size = os.path.getsize(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {count} {layer} (v{version}) to {output} in {elapsed:.2f}s, {size / 1e6:.1f} MB."
+        ))
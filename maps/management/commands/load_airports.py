@@ -1,14 +1,43 @@
-from django.core.management.base import BaseCommand
-from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from maps.models import Airport
-import csv
+from maps.cache import bump_dataset_version
+from maps.ingest import (
+    chunked, delete_airports, diff_manifest, fingerprint, forget_manifest,
+    merge_airports, read_airports, parallel_ingest, parallel_supported, save_manifest,
+)
+from maps.geometry import refresh_route_geometry
+from maps.stats import refresh_airport_stats
+from maps.tiles import clear_tile_cache
 import os
+import time
+
+SOURCE = "airports"
 
 class Command(BaseCommand):
-    help = "Load real airports from OpenFlights airports.dat (filters invalid or small/private airports)."
+    help = (
+        "Load real airports from OpenFlights airports.dat (filters invalid or small/private airports). "
+        "Rows are COPY'd into a staging table and merged with one INSERT ... ON CONFLICT."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("dat_path", type=str, help="Path to airports.dat file")
+        parser.add_argument(
+            "--incremental", action="store_true",
+            help="Apply only rows added, changed or removed since the last ingest",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Print the incremental change report without writing anything",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Parse and COPY byte-range chunks in N processes (full loads only)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="Rows applied per transaction (default 5000)",
+        )
 
     def handle(self, *args, **opts):
         path = opts["dat_path"]
@@ -16,54 +45,66 @@ class Command(BaseCommand):
         if not os.path.exists(path):
             self.stderr.write(self.style.ERROR(f"File not found: {path}"))
             return
+        if opts["workers"] > 1 and (opts["incremental"] or opts["dry_run"]):
+            raise CommandError("--workers cannot be combined with --incremental or --dry-run")
+        if opts["workers"] > 1 and not parallel_supported():
+            raise CommandError("--workers needs fork() (not available on this platform); use --workers 1")
 
         self.stdout.write(f"Loading airports from: {path}")
+        started = time.perf_counter()
 
-        imported = skipped = 0
+        if opts["workers"] > 1:
+            inserted, updated, skipped, _ = parallel_ingest(SOURCE, path, opts["workers"])
+            self.finish(started, inserted, updated, 0, skipped)
+            return
 
         with open(path, "r", encoding="utf-8", newline="") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                # 1,"Goroka Airport","Goroka","Papua New Guinea","GKA","AYGA",-6.081689834590001,145.391998291,5282,10,"U","Pacific/Port_Moresby","airport","OurAirports"
-                if not row or len(row) < 8:
-                    continue
+            records, skipped = read_airports(f)
+        fingerprints = {code: fingerprint(*record) for code, record in records.items()}
 
-                try:
-                    name = (row[1] or "").strip('" ')
-                    city = (row[2] or "").strip('" ')
-                    country = (row[3] or "").strip('" ')
-                    iata = (row[4] or "").strip('" ').upper()
-                    lat = float(row[6])
-                    lon = float(row[7])
+        if opts["incremental"] or opts["dry_run"]:
+            delta = diff_manifest(SOURCE, fingerprints)
+            for line in delta.report():
+                self.stdout.write(line)
+            if opts["dry_run"]:
+                self.stdout.write(self.style.WARNING("Dry run: nothing written."))
+                return
+            upserts, deletes = delta.upserts, delta.deletes
+        else:
+            upserts, deletes = list(records), []
 
-                    # Filter logic
-                    if not iata or len(iata) != 3:
-                        skipped += 1
-                        continue
-                    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
-                        skipped += 1
-                        continue
-                    if "heli" in name.lower() or "seaplane" in name.lower():
-                        skipped += 1
-                        continue
-                    if country.strip().lower() in ["antarctica", "unknown"]:
-                        skipped += 1
-                        continue
+        inserted = updated = deleted = 0
+        for codes in chunked(upserts, opts["batch_size"]):
+            with transaction.atomic():
+                ins, upd = merge_airports([records[code] for code in codes])
+                save_manifest(SOURCE, {code: fingerprints[code] for code in codes})
+            inserted += ins
+            updated += upd
+        for codes in chunked(deletes, opts["batch_size"]):
+            with transaction.atomic():
+                deleted += delete_airports(codes)
+                forget_manifest(SOURCE, codes)
 
-                    Airport.objects.update_or_create(
-                        iata_code=iata,
-                        defaults=dict(
-                            name=name or "Unnamed Airport",
-                            city=city,
-                            country=country,
-                            geom=Point(lon, lat, srid=4326),
-                        ),
-                    )
-                    imported += 1
+        self.finish(started, inserted, updated, deleted, skipped)
 
-                except Exception:
-                    skipped += 1
+    def finish(self, started, inserted, updated, deleted, skipped):
+        moved = set()
+        if inserted or updated or deleted:
+            # Moved airports drag their routes (and route-km) along
+            if updated:
+                moved = refresh_route_geometry()
+            # Countries feed every airport's stats, so refresh them all
+            refresh_airport_stats()
+            bump_dataset_version()
+            clear_tile_cache()
 
-        self.stdout.write(self.style.SUCCESS(f"Imported or updated {imported} airports."))
-        self.stdout.write(self.style.WARNING(f"Skipped {skipped} rows."))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {inserted}, updated {updated} and deleted {deleted} airports in {elapsed:.2f}s."
+        ))
+        if moved:
+            self.stdout.write(f"Recomputed route geometry and distance at {len(moved)} airports after moves.")
+        self.stdout.write(self.style.WARNING(f"Skipped {sum(skipped.values())} rows."))
+        for reason, count in skipped.most_common():
+            self.stdout.write(f"  {reason}: {count}")
         self.stdout.write(f"Total in DB: {Airport.objects.count()}")
@@ -1,92 +1,122 @@
-from django.core.management.base import BaseCommand
-from django.contrib.gis.geos import LineString
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from maps.models import Airport, FlightRoute
-import csv, os, math
-
-def haversine_km(lat1, lon1, lat2, lon2):
-    """Calculate great-circle distance (km) between two lat/lon points."""
-    R = 6371.0088
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return 2 * R * math.asin(math.sqrt(a))
+from maps.models import FlightRoute
+from maps.cache import bump_dataset_version
+from maps.ingest import (
+    airport_lookup, chunked, delete_routes, diff_manifest, forget_manifest,
+    merge_routes, read_routes, parallel_ingest, parallel_supported, save_manifest,
+    touched_airports,
+)
+from maps.stats import refresh_airport_stats
+from maps.tiles import clear_tile_cache
+import os, time
+
+SOURCE = "routes"
 
 class Command(BaseCommand):
-    help = "Load flight routes from OpenFlights routes.dat, linking them to Airport objects efficiently."
+    help = (
+        "Load flight routes from OpenFlights routes.dat, linking them to Airport objects efficiently. "
+        "Distances and geometries are computed in bulk with NumPy and streamed in with COPY."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("dat_path", type=str, help="Path to routes.dat file")
+        parser.add_argument(
+            "--incremental", action="store_true",
+            help="Apply only routes added, changed or removed since the last ingest",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Print the incremental change report without writing anything",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Parse and COPY byte-range chunks in N processes (full loads only)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=20000,
+            help="Routes applied per transaction (default 20000)",
+        )
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         path = opts["dat_path"]
         if not os.path.exists(path):
             self.stderr.write(self.style.ERROR(f"File not found: {path}"))
             return
+        if opts["workers"] > 1 and (opts["incremental"] or opts["dry_run"]):
+            raise CommandError("--workers cannot be combined with --incremental or --dry-run")
+        if opts["workers"] > 1 and not parallel_supported():
+            raise CommandError("--workers needs fork() (not available on this platform); use --workers 1")
 
         self.stdout.write(f"Loading routes from: {path}")
+        started = time.perf_counter()
 
         # Preload all airports into a dict for instant lookups
-        airports = {
-            a.iata_code.upper(): a
-            for a in Airport.objects.all()
-            if a.iata_code and len(a.iata_code) == 3
-        }
+        airports = airport_lookup()
         self.stdout.write(f"Cached {len(airports)} airports in memory")
 
-        imported = skipped = 0
-        batch = []
+        if opts["workers"] > 1:
+            inserted, updated, skipped, staged = parallel_ingest(SOURCE, path, opts["workers"], airports)
+            # Workers parse and COPY together, then one statement merges
+            self.finish(
+                started, staged, inserted, updated, 0, skipped, touched=None,
+                phases=("Parsed and staged", "merged"),
+            )
+            return
 
         with open(path, "r", encoding="utf-8", newline="") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                if not row or len(row) < 6:
-                    continue
-
-                try:
-                    airline = (row[0] or "").strip().upper()
-                    src = (row[2] or "").strip().upper()
-                    dst = (row[4] or "").strip().upper()
-
-                    if len(src) != 3 or len(dst) != 3 or src == dst:
-                        skipped += 1
-                        continue
-
-                    a1 = airports.get(src)
-                    a2 = airports.get(dst)
-                    if not a1 or not a2:
-                        skipped += 1
-                        continue
-
-                    dist = haversine_km(a1.geom.y, a1.geom.x, a2.geom.y, a2.geom.x)
-                    geom = LineString(a1.geom, a2.geom, srid=4326)
-
-                    batch.append(
-                        FlightRoute(
-                            origin=a1,
-                            destination=a2,
-                            airline=airline,
-                            geom=geom,
-                            distance_km=dist,
-                        )
-                    )
-
-                    imported += 1
-
-                    # Insert in batches of 1000 for performance
-                    if len(batch) >= 1000:
-                        FlightRoute.objects.bulk_create(batch, ignore_conflicts=True)
-                        batch = []
-
-                except Exception:
-                    skipped += 1
-
-        # Final batch insert
-        if batch:
-            FlightRoute.objects.bulk_create(batch, ignore_conflicts=True)
-
-        self.stdout.write(self.style.SUCCESS(f"Imported {imported} routes"))
-        self.stdout.write(self.style.WARNING(f"Skipped {skipped} rows"))
+            batch, skipped = read_routes(f, airports)
+        keys = batch.keys()
+        fingerprints = dict(zip(keys, batch.fingerprints()))
+        position = {key: i for i, key in enumerate(keys)}
+        parsed = time.perf_counter()
+
+        if opts["incremental"] or opts["dry_run"]:
+            delta = diff_manifest(SOURCE, fingerprints)
+            for line in delta.report():
+                self.stdout.write(line)
+            if opts["dry_run"]:
+                self.stdout.write(self.style.WARNING("Dry run: nothing written."))
+                return
+            upserts, deletes = delta.upserts, delta.deletes
+            touched = touched_airports([*upserts, *deletes])
+        else:
+            upserts, deletes = keys, []
+            touched = None
+
+        inserted = updated = deleted = 0
+        for chunk in chunked(upserts, opts["batch_size"]):
+            with transaction.atomic():
+                ins, upd = merge_routes(batch.take([position[key] for key in chunk]))
+                save_manifest(SOURCE, {key: fingerprints[key] for key in chunk})
+            inserted += ins
+            updated += upd
+        for chunk in chunked(deletes, opts["batch_size"]):
+            with transaction.atomic():
+                deleted += delete_routes(chunk)
+                forget_manifest(SOURCE, chunk)
+
+        self.finish(started, parsed, inserted, updated, deleted, skipped, touched)
+
+    def finish(self, started, parsed, inserted, updated, deleted, skipped, touched,
+               phases=("Parsed", "applied")):
+        if inserted or updated or deleted:
+            # Only airports at either end of a changed route (None: all of them)
+            refresh_airport_stats(touched)
+            bump_dataset_version()
+            clear_tile_cache()
+
+        finished = time.perf_counter()
+        applied = inserted + updated + deleted
+        rate = applied / (finished - started) if finished > started else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {inserted}, updated {updated} and deleted {deleted} routes"
+        ))
+        self.stdout.write(
+            f"{phases[0]} in {parsed - started:.2f}s, {phases[1]} in {finished - parsed:.2f}s "
+            f"({rate:,.0f} rows/s)"
+        )
+        self.stdout.write(self.style.WARNING(f"Skipped {sum(skipped.values())} rows"))
+        for reason, count in skipped.most_common():
+            self.stdout.write(f"  {reason}: {count}")
         self.stdout.write(f"Total routes in DB: {FlightRoute.objects.count()}")
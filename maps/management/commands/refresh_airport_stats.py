@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from maps.cache import bump_dataset_version
+from maps.models import Airport
+from maps.stats import hub_min_degree, refresh_airport_stats
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute AirportStats (degree, airlines, destination countries, route-km) for every "
+        "airport and re-derive is_major_hub. The loaders do this automatically after an ingest."
+    )
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        with transaction.atomic():
+            changed = refresh_airport_stats()
+            bump_dataset_version()
+        elapsed = time.perf_counter() - started
+
+        hubs = Airport.objects.filter(is_major_hub=True).count()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed airport stats in {elapsed:.2f}s."))
+        self.stdout.write(
+            f"{hubs} major hubs (>= {hub_min_degree()} routes), {changed} hub flags changed"
+        )
@@ -0,0 +1,308 @@
+"""
+Request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request, counts its SQL queries and their
+time through a database execute wrapper, and measures the response size;
+streamed responses are measured when the last chunk has been sent, since
+that is when their queries run. The middleware works under WSGI and ASGI;
+the async views count their pool queries with ``record_query``.
+``cached_response`` reports cache hits and misses through
+``record_cache``. Everything is kept in an in-process registry (one per
+worker, told apart by a ``pid`` label) and served at ``/metrics``, so a
+scrape sees only the worker that answered it: scrape every worker
+directly, never through a load balancer.
+
+``/metrics`` only answers clients in ``MAPS_METRICS_ALLOWED_IPS`` (CIDRs,
+loopback by default) and, if ``MAPS_METRICS_TOKEN`` is set, only with
+``Authorization: Bearer <token>``.
+
+With ``MAPS_SLOW_REQUEST_MS`` set, requests slower than that are logged to
+the ``maps.slow`` logger together with their slowest SQL statements.
+"""
+
+import hmac
+import ipaddress
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger("maps.slow")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Statements kept per request for the slow log
+SLOW_LOG_STATEMENTS = 10
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(**labels):
+    labels["pid"] = os.getpid()
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{{{labels}}} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, labels, value):
+        counts, total = self.values.get(labels, (None, 0))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[labels] = (counts, total + value)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {total}"
+            yield f"{self.name}_count{{{labels}}} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter("maps_http_requests_total", "HTTP requests by view, method and status.")
+        self.latency = Histogram(
+            "maps_http_request_duration_seconds", "Request latency, including streaming.", LATENCY_BUCKETS,
+        )
+        self.response_bytes = Histogram(
+            "maps_http_response_bytes", "Response body size as sent.", SIZE_BUCKETS,
+        )
+        self.queries = Histogram("maps_db_queries_per_request", "SQL queries per request.", QUERY_BUCKETS)
+        self.query_seconds = Counter("maps_db_query_seconds_total", "Time spent in SQL queries.")
+        self.cache = Counter("maps_cache_requests_total", "Response cache lookups by result.")
+        self.slow = Counter("maps_slow_requests_total", "Requests over MAPS_SLOW_REQUEST_MS.")
+
+    def metrics(self):
+        return (
+            self.requests, self.latency, self.response_bytes,
+            self.queries, self.query_seconds, self.cache, self.slow,
+        )
+
+    def render(self):
+        with self.lock:
+            lines = [line for metric in self.metrics() for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def record_cache(request, result):
+    """Note a response cache ``result`` (hit, miss or not_modified) for ``request``."""
+    # DRF wraps the HttpRequest the middleware sees
+    getattr(request, "_request", request).maps_cache_result = result
+
+
+class QueryStats:
+    """Database execute wrapper counting and timing the queries of one request."""
+
+    def __init__(self, capture_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.capture_sql = capture_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(time.perf_counter() - started, sql)
+
+    def record(self, elapsed, sql):
+        """Count one query; also called directly for queries Django doesn't run."""
+        self.count += 1
+        self.seconds += elapsed
+        if self.capture_sql:
+            self.statements.append((elapsed, sql))
+            if len(self.statements) > SLOW_LOG_STATEMENTS * 4:
+                self.statements.sort(reverse=True)
+                del self.statements[SLOW_LOG_STATEMENTS:]
+
+
+def record_query(request, elapsed, sql):
+    """Count a query run outside Django's connections (e.g. the async pool)."""
+    stats = getattr(request, "maps_query_stats", None)
+    if stats is not None:
+        stats.record(elapsed, sql)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "MAPS_METRICS", True)
+        self.slow_ms = getattr(settings, "MAPS_SLOW_REQUEST_MS", None)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        stats, wrapped, started = self._start(request)
+        try:
+            response = self.get_response(request)
+        except Exception:
+            self._unwrap(wrapped, stats)
+            raise
+        return self._finish(request, response, stats, wrapped, started)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        stats, wrapped, started = self._start(request)
+        try:
+            response = await self.get_response(request)
+        except Exception:
+            self._unwrap(wrapped, stats)
+            raise
+        return self._finish(request, response, stats, wrapped, started)
+
+    def _start(self, request):
+        stats = QueryStats(capture_sql=self.slow_ms is not None)
+        request.maps_query_stats = stats
+        wrapped = list(connections.all())
+        for conn in wrapped:
+            conn.execute_wrappers.append(stats)
+        return stats, wrapped, time.perf_counter()
+
+    def _finish(self, request, response, stats, wrapped, started):
+        if not response.streaming:
+            self._unwrap(wrapped, stats)
+            self._observe(request, response, stats, started, len(response.content))
+        elif response.is_async:
+            response.streaming_content = self._astream(
+                response.streaming_content, request, response, stats, wrapped, started,
+            )
+        else:
+            response.streaming_content = self._stream(
+                response.streaming_content, request, response, stats, wrapped, started,
+            )
+        return response
+
+    def _stream(self, content, request, response, stats, wrapped, started):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._unwrap(wrapped, stats)
+            self._observe(request, response, stats, started, size)
+
+    async def _astream(self, content, request, response, stats, wrapped, started):
+        size = 0
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._unwrap(wrapped, stats)
+            self._observe(request, response, stats, started, size)
+
+    @staticmethod
+    def _unwrap(wrapped, stats):
+        for conn in wrapped:
+            if stats in conn.execute_wrappers:
+                conn.execute_wrappers.remove(stats)
+
+    def _observe(self, request, response, stats, started, size):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        labels = _labels(view=view)
+        cache_result = getattr(request, "maps_cache_result", None)
+
+        with registry.lock:
+            registry.requests.inc(_labels(view=view, method=request.method, status=response.status_code))
+            registry.latency.observe(labels, elapsed)
+            registry.response_bytes.observe(labels, size)
+            registry.queries.observe(labels, stats.count)
+            registry.query_seconds.inc(labels, stats.seconds)
+            if cache_result:
+                registry.cache.inc(_labels(view=view, result=cache_result))
+            slow = self.slow_ms is not None and elapsed * 1000 >= self.slow_ms
+            if slow:
+                registry.slow.inc(labels)
+
+        if slow:
+            statements = sorted(stats.statements, reverse=True)[:SLOW_LOG_STATEMENTS]
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s",
+                request.method, request.get_full_path(), view, elapsed * 1000,
+                stats.count, stats.seconds * 1000,
+                "\n".join(f"  {seconds * 1000:8.1f} ms  {sql}" for seconds, sql in statements),
+            )
+
+
+@lru_cache(maxsize=None)
+def _allowed_networks(allowed):
+    return [ipaddress.ip_network(cidr.strip(), strict=False) for cidr in allowed if cidr.strip()]
+
+
+def scrape_allowed(request):
+    """Whether the client's address and token pass the metrics settings."""
+    allowed = getattr(settings, "MAPS_METRICS_ALLOWED_IPS", ("127.0.0.1/32", "::1/128"))
+    try:
+        client = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    if not any(client in network for network in _allowed_networks(tuple(allowed))):
+        return False
+    token = getattr(settings, "MAPS_METRICS_TOKEN", None)
+    if token:
+        scheme, _, given = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(given.strip(), token)
+    return True
+
+
+def metrics(request):
+    """Prometheus text exposition of this worker's registry."""
+    if not getattr(settings, "MAPS_METRICS", True):
+        raise Http404("Metrics are disabled")
+    if not scrape_allowed(request):
+        return HttpResponseForbidden("Forbidden", content_type="text/plain")
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0004_airport_geography_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=160)),
+                ('fingerprint', models.CharField(max_length=32)),
+            ],
+            options={
+                'unique_together': {('source', 'key')},
+            },
+        ),
+    ]
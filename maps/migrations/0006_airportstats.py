@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0005_ingestmanifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AirportStats',
+            fields=[
+                ('airport', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='maps.airport')),
+                ('out_degree', models.PositiveIntegerField(default=0)),
+                ('in_degree', models.PositiveIntegerField(default=0)),
+                ('degree', models.PositiveIntegerField(default=0)),
+                ('airline_count', models.PositiveIntegerField(default=0)),
+                ('destination_country_count', models.PositiveIntegerField(default=0)),
+                ('route_km', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-degree'], name='maps_airpor_degree_906259_idx'), models.Index(fields=['-airline_count'], name='maps_airpor_airline_76c7bb_idx'), models.Index(fields=['-destination_country_count'], name='maps_airpor_destina_1c2e82_idx'), models.Index(fields=['-route_km'], name='maps_airpor_route_k_c1a6b0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:33
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0006_airportstats'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='airport',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='airport_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='airport',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['city'], name='airport_city_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,15 @@
+# Hand-written: RunSQL for a GIST index on the geom::geography expression
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [("maps", "0007_airport_trigram_indexes")]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX IF NOT EXISTS idx_flightroute_geog "
+            "ON maps_flightroute USING GIST ((geom::geography));",
+            "DROP INDEX IF EXISTS idx_flightroute_geog;",
+        ),
+    ]
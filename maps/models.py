@@ -1,5 +1,9 @@
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.gis.geos import LineString
+from django.db.models import DEFERRED
+
+from .geometry import haversine_km
 
 
 class Airport(models.Model):
@@ -16,8 +20,32 @@ class Airport(models.Model):
             models.Index(fields=["iata_code"]),
             models.Index(fields=["country"]),
             models.Index(fields=["city"]),
+            # Trigram indexes for /api/airports/search/ (migration 0007 enables pg_trgm)
+            GinIndex(fields=["name"], name="airport_name_trgm", opclasses=["gin_trgm_ops"]),
+            GinIndex(fields=["city"], name="airport_city_trgm", opclasses=["gin_trgm_ops"]),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored position, so saves can tell whether it moved
+        geom = dict(zip(field_names, values)).get("geom", DEFERRED)
+        instance._loaded_geom = None if geom is DEFERRED else geom
+        return instance
+
+    def has_moved(self):
+        """
+        True if ``geom`` differs from what was loaded from the database (or
+        the loaded position isn't known).
+        """
+        loaded = getattr(self, "_loaded_geom", None)
+        return loaded is None or self.geom is None or not self.geom.equals_exact(loaded, 0)
+
+    def save(self, *args, **kwargs):
+        # post_save handlers (see signals.py) still see the old position
+        super().save(*args, **kwargs)
+        self._loaded_geom = self.geom.clone() if self.geom is not None else None
+
     def __str__(self):
         return f"{self.name} ({self.iata_code})"
 
@@ -33,10 +61,92 @@ class FlightRoute(models.Model):
         unique_together = (("origin", "destination", "airline"),)
         indexes = [models.Index(fields=["airline"])]
 
+    def endpoint_geoms(self):
+        """
+        Origin and destination points: from the related airports if they are
+        already loaded, otherwise fetched together in one query.
+        """
+        cached = [
+            getattr(self, name).geom
+            for name in ("origin", "destination")
+            if self._meta.get_field(name).is_cached(self)
+            and getattr(self, name).pk == getattr(self, f"{name}_id")
+        ]
+        if len(cached) == 2:
+            return cached
+        geoms = dict(
+            Airport.objects.filter(pk__in=(self.origin_id, self.destination_id)).values_list("pk", "geom")
+        )
+        return geoms[self.origin_id], geoms[self.destination_id]
+
     def save(self, *args, **kwargs):
         if self.origin_id and self.destination_id:
-            self.geom = LineString(self.origin.geom, self.destination.geom)
+            origin, destination = self.endpoint_geoms()
+            self.geom = LineString(origin, destination, srid=4326)
+            self.distance_km = float(haversine_km(origin.y, origin.x, destination.y, destination.x))
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.origin.iata_code} → {self.destination.iata_code} ({self.airline or '—'})"
+
+
+class DatasetVersion(models.Model):
+    """
+    Single-row counter bumped on every write to airports or routes.
+    Cached responses are keyed on it, so a bump invalidates them all.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dataset v{self.version}"
+
+
+class IngestManifest(models.Model):
+    """
+    Fingerprint of every row from the last ingest of a source file, so the
+    loaders can apply only what changed on the next run.
+    """
+
+    source = models.CharField(max_length=20)
+    key = models.CharField(max_length=160)
+    fingerprint = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = (("source", "key"),)
+
+    def __str__(self):
+        return f"{self.source}:{self.key}"
+
+
+class AirportStats(models.Model):
+    """
+    Route connectivity per airport, kept up to date by ``maps.stats`` so
+    rankings and hub detection never aggregate the routes table per request.
+    """
+
+    # No DB constraint: rows are refreshed in bulk SQL, and stale rows for
+    # deleted airports are pruned by the next refresh
+    airport = models.OneToOneField(
+        Airport, on_delete=models.CASCADE, primary_key=True,
+        related_name="stats", db_constraint=False,
+    )
+    out_degree = models.PositiveIntegerField(default=0)
+    in_degree = models.PositiveIntegerField(default=0)
+    degree = models.PositiveIntegerField(default=0)
+    airline_count = models.PositiveIntegerField(default=0)
+    destination_country_count = models.PositiveIntegerField(default=0)
+    route_km = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-degree"]),
+            models.Index(fields=["-airline_count"]),
+            models.Index(fields=["-destination_country_count"]),
+            models.Index(fields=["-route_km"]),
+        ]
+
+    def __str__(self):
+        return f"Stats for airport {self.airport_id}"
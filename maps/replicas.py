@@ -0,0 +1,109 @@
+"""
+Read-replica routing.
+
+Databases named ``replica_*`` (built in settings from
+``DATABASE_REPLICA_HOSTS``) serve the GET/HEAD requests of views that opt
+in with ``read_replica = True``; ``ReplicaMiddleware`` picks one at random
+per request. Everything else (writes, the admin, management commands,
+other views) keeps using ``default``.
+
+A successful write sets a short-lived cookie that keeps the client's reads
+on the primary for ``MAPS_REPLICA_PIN_SECONDS``, so it sees its own writes
+despite replication lag. Cache keys carry the dataset version read from the
+same database as the data, so a lagging replica serves a consistent older
+version rather than a mix. ORM queries reach that database through
+``ReplicaRouter``; raw SQL reads must take their cursor from
+``read_connection()`` rather than ``django.db.connection``, which is always
+the primary.
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, resolve
+
+REPLICA_PREFIX = "replica_"
+PIN_COOKIE = "maps_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Alias reads go to for the current request; None means the primary
+_read_alias = ContextVar("maps_read_alias", default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+def read_connection():
+    """Connection for raw SQL reads: the current request's replica, if any."""
+    return connections[_read_alias.get() or DEFAULT_DB_ALIAS]
+
+
+class ReplicaRouter:
+    """Sends reads to the replica chosen for the current request, if any."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db.startswith(REPLICA_PREFIX):
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Picks the read database for each request and pins clients after writes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.replicas = replica_aliases()
+        self.pin_seconds = getattr(settings, "MAPS_REPLICA_PIN_SECONDS", 5)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Set on every request (never left over from the last one) and left
+        # in place for streamed responses, whose queries run after we return
+        _read_alias.set(self.read_alias(request))
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        _read_alias.set(self.read_alias(request))
+        return self.pin(request, await self.get_response(request))
+
+    def read_alias(self, request):
+        if not self.replicas or request.method not in ("GET", "HEAD"):
+            return None
+        if request.COOKIES.get(PIN_COOKIE):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        # DRF viewset actions carry their class as .cls
+        if not getattr(getattr(match.func, "cls", None), "read_replica", False):
+            return None
+        return random.choice(self.replicas)
+
+    def pin(self, request, response):
+        if self.replicas and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=self.pin_seconds, httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,134 @@
+"""
+Type-ahead airport search over IATA code, name and city.
+
+Each dataset version gets an in-process prefix table (a flattened trie):
+every prefix of every IATA code and name/city word maps to its best
+``MAX_RESULTS`` airports, IATA-code matches first, then by route count. A
+keystroke is then one dict lookup. Queries the table can't answer exactly
+(several words over a crowded prefix, typos, mid-word matches) go to
+PostGIS, where ``pg_trgm`` GIN indexes on name and city serve word
+similarity.
+"""
+
+import re
+import unicodedata
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .cache import PerVersion
+from .geojson import airport_feature, airport_rows
+from .models import Airport
+
+MAX_RESULTS = 50
+# Longer prefixes than this are looked up by their first MAX_PREFIX characters
+MAX_PREFIX = 12
+
+IATA_MATCH, WORD_MATCH = 0, 1
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Lowercase and strip accents, so "Zürich" matches "zur"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def words(text):
+    return _WORD.findall(normalize(text))
+
+
+class SearchIndex:
+    """Prefix table over the airports of one dataset version."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        # Rows arrive busiest first, so a row's position is its tie-breaker
+        self.rows = rows
+        self.words = [set(words(f"{r['iata_code']} {r['name']} {r['city']}")) for r in rows]
+
+        best = {}
+        for i, row in enumerate(rows):
+            tokens = [(normalize(row["iata_code"]), IATA_MATCH)]
+            tokens += [(word, WORD_MATCH) for word in words(f"{row['name']} {row['city']}")]
+            for token, kind in tokens:
+                for end in range(1, min(len(token), MAX_PREFIX) + 1):
+                    candidates = best.setdefault(token[:end], {})
+                    key = (kind, i)
+                    if key < candidates.get(i, (WORD_MATCH + 1, i)):
+                        candidates[i] = key
+        self.prefixes = {
+            prefix: [i for _, i in sorted(candidates.values())[:MAX_RESULTS + 1]]
+            for prefix, candidates in best.items()
+        }
+
+    @classmethod
+    def build(cls, version):
+        queryset = Airport.objects.order_by(F("stats__degree").desc(nulls_last=True), "id")
+        return cls(version, list(airport_rows(queryset)))
+
+    def lookup(self, query, limit=10):
+        """
+        Matching row indices, best first, or None if the table can't answer
+        the query exactly and the database should be asked instead.
+        """
+        terms = words(query)
+        if not terms:
+            return []
+        head, rest = terms[0], terms[1:]
+        candidates = self.prefixes.get(head[:MAX_PREFIX])
+        if candidates is None:
+            return None
+        # A full list (MAX_RESULTS + 1 entries) may have been cut short
+        complete = len(candidates) <= MAX_RESULTS
+        if len(head) > MAX_PREFIX or rest:
+            if not complete:
+                return None
+            candidates = [
+                i for i in candidates
+                if all(any(w.startswith(t) for w in self.words[i]) for t in terms)
+            ]
+        return candidates[:limit]
+
+
+_index = PerVersion(SearchIndex.build)
+
+
+def get_search_index():
+    return _index.get()
+
+
+def _db_search(query, limit):
+    code = query.strip().upper()
+    queryset = (
+        Airport.objects.annotate(
+            iata_match=Case(
+                When(iata_code__startswith=code, then=Value(IATA_MATCH)),
+                default=Value(WORD_MATCH),
+                output_field=IntegerField(),
+            ),
+            similarity=Greatest(
+                TrigramWordSimilarity(query, "name"),
+                TrigramWordSimilarity(query, "city"),
+            ),
+        )
+        # %> is answered by the trigram GIN indexes
+        .filter(
+            Q(iata_code__startswith=code)
+            | Q(name__trigram_word_similar=query)
+            | Q(city__trigram_word_similar=query)
+        )
+        .order_by("iata_match", "-similarity", F("stats__degree").desc(nulls_last=True), "id")[:limit]
+    )
+    return [airport_feature(row) for row in airport_rows(queryset)]
+
+
+def search_features(query, limit=10):
+    """GeoJSON features for airports matching ``query``, best first."""
+    index = get_search_index()
+    matches = index.lookup(query, limit)
+    if matches is not None:
+        return [airport_feature(index.rows[i]) for i in matches]
+    return _db_search(query, limit)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from django.contrib.gis.geos import GEOSGeometry, Point
+from django.db import transaction
 import json
 from .models import Airport, FlightRoute
 
@@ -61,11 +63,19 @@ class FlightRouteSerializer(serializers.ModelSerializer):
         }
 
 
+class IataCodeField(serializers.CharField):
+    """IATA code, upper-cased before validation so uniqueness checks match."""
+
+    def to_internal_value(self, data):
+        return super().to_internal_value(data).upper()
+
+
 class AirportCreateSerializer(serializers.ModelSerializer):
     """
     Serializer used for creating or updating Airport records (supports lat/lon input).
     """
 
+    iata_code = IataCodeField(max_length=10, validators=[UniqueValidator(queryset=Airport.objects.all())])
     lat = serializers.FloatField(write_only=True)
     lon = serializers.FloatField(write_only=True)
 
@@ -81,6 +91,8 @@ class AirportCreateSerializer(serializers.ModelSerializer):
             "lat",
             "lon",
         )
+        # Derived from route counts on every stats refresh (see stats.py)
+        read_only_fields = ("is_major_hub",)
 
     def create(self, validated_data):
         lat = validated_data.pop("lat")
@@ -88,8 +100,10 @@ class AirportCreateSerializer(serializers.ModelSerializer):
         validated_data["geom"] = Point(lon, lat, srid=4326)
         return Airport.objects.create(**validated_data)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        # Handle lat/lon if provided
+        # A move also rewrites the airport's routes (see signals.py), in this
+        # same transaction. Handle lat/lon if provided
         if "lat" in validated_data and "lon" in validated_data:
             lat = validated_data.pop("lat")
             lon = validated_data.pop("lon")
@@ -100,4 +114,21 @@ class AirportCreateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class AirportBulkItemSerializer(AirportCreateSerializer):
+    """
+    One item of a bulk airport write. Validation needs no queries:
+    ``iata_code`` uniqueness is what the upsert is keyed on, so the model's
+    UniqueValidator is dropped.
+    """
+
+    iata_code = IataCodeField(max_length=10)
+    lat = serializers.FloatField(write_only=True, min_value=-90, max_value=90)
+    lon = serializers.FloatField(write_only=True, min_value=-180, max_value=180)
+
+    def validate(self, attrs):
+        if ("lat" in attrs) != ("lon" in attrs):
+            raise serializers.ValidationError("lat and lon must be given together")
+        return attrs
@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_dataset_version
+from .geometry import refresh_route_geometry
+from .models import Airport, FlightRoute
+from .stats import refresh_airport_stats, route_endpoints, route_neighbours
+
+
+class PendingRefresh:
+    """Airports changed by one transaction, refreshed once it commits."""
+
+    def __init__(self):
+        self.airport_ids = set()
+
+    def __call__(self):
+        # After commit, so an airport deleted in the transaction (with its
+        # routes cascading) is already gone and its stats row gets pruned.
+        # Bump again: a response cached between the commit and this refresh
+        # holds the old stats under the write's version.
+        with transaction.atomic():
+            refresh_airport_stats(self.airport_ids)
+            bump_dataset_version()
+
+
+def record_change(airport_ids):
+    """
+    Note a change to ``airport_ids`` made through the ORM. The first change
+    in a transaction bumps the dataset version and schedules one stats
+    refresh on commit; later ones only add their airports to it. Bulk
+    loaders bump and refresh themselves.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, "maps_pending_refresh", None)
+    # Callbacks of rolled-back savepoints (and ones already run) are gone
+    # from run_on_commit; start over then
+    if pending is not None and any(func is pending for _, func, *_ in connection.run_on_commit):
+        pending.airport_ids.update(airport_ids)
+        return
+    pending = PendingRefresh()
+    pending.airport_ids.update(airport_ids)
+    connection.maps_pending_refresh = pending
+    bump_dataset_version()
+    # Outside a transaction this runs right away
+    transaction.on_commit(pending)
+
+
+# No delete receivers on FlightRoute: any would make Django load and delete
+# an airport's routes one by one instead of in one cascading DELETE. Airport
+# deletes record the routes' ends up front, and the admin records its own
+# route deletes.
+@receiver(post_save, sender=FlightRoute)
+def refresh_on_route_save(sender, instance, **kwargs):
+    record_change([instance.origin_id, instance.destination_id])
+
+
+@receiver(pre_delete, sender=Airport)
+def refresh_on_airport_delete(sender, instance, **kwargs):
+    record_change([instance.pk, *route_endpoints([instance.pk])])
+
+
+@receiver(post_save, sender=Airport)
+def refresh_on_airport_change(sender, instance, created, update_fields=None, **kwargs):
+    moved = not created and (update_fields is None or "geom" in update_fields) and instance.has_moved()
+    # A move rewrites the airport's routes in this same transaction; their
+    # other ends get new route-km
+    touched = refresh_route_geometry([instance.pk]) if moved else set()
+    # Its country counts towards the stats of every airport flying to it
+    record_change([instance.pk, *route_neighbours([instance.pk]), *touched])
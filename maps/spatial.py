@@ -0,0 +1,188 @@
+"""
+Nearest-airport and radius queries.
+
+Airports are held per dataset version as unit vectors on the sphere in a
+KD-tree; straight-line (chord) distance between unit vectors is monotonic
+in great-circle distance, so nearest-k and radius queries on the tree are
+exact on the sphere. Without SciPy (or with ``MAPS_SPATIAL_INDEX = False``)
+queries fall back to PostGIS: KNN ``<->`` and ``ST_DWithin`` on geography,
+both served by the geography GIST index.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .cache import PerVersion
+from .geojson import airport_feature, airport_rows
+from .geometry import EARTH_RADIUS_KM
+from .models import Airport
+from .replicas import read_connection
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # fall back to PostGIS queries
+    cKDTree = None
+
+POINT_SQL = "ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography"
+
+# One KNN lookup per point, all in a single statement
+BATCH_NEAREST_SQL = """
+SELECT p.ord, a.iata_code, ST_Distance(a.geom::geography, p.g) / 1000.0
+FROM (
+    SELECT ord, ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography AS g
+    FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS t(lon, lat, ord)
+) p
+CROSS JOIN LATERAL (
+    SELECT iata_code, geom FROM maps_airport
+    ORDER BY geom::geography <-> p.g
+    LIMIT %s
+) a
+ORDER BY p.ord, 3
+"""
+
+
+def unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class AirportIndex:
+    """KD-tree over airport unit vectors, with the airport rows alongside."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        lat = np.array([r["lat"] for r in rows], dtype=np.float64)
+        lon = np.array([r["lon"] for r in rows], dtype=np.float64)
+        self.codes = np.array([r["iata_code"] for r in rows], dtype=str)
+        self.tree = cKDTree(unit_vectors(lat, lon)) if rows else None
+
+    @classmethod
+    def build(cls, version):
+        return cls(version, list(airport_rows(Airport.objects.order_by("id"))))
+
+    def nearest(self, lat, lon, k=1, workers=1):
+        """
+        The ``k`` nearest airports to each point. ``lat``/``lon`` may be
+        arrays; returns (distance_km, index) arrays of shape (points, k).
+        """
+        points = unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))
+        k = min(k, len(self.rows))
+        if not k:
+            empty = np.empty((len(points), 0))
+            return empty, empty.astype(np.int64)
+        chord, idx = self.tree.query(points, k=k, workers=workers)
+        return chord_to_km(chord).reshape(len(points), k), idx.reshape(len(points), k)
+
+    def within(self, lat, lon, radius_km, limit=None):
+        """Airports within ``radius_km``, nearest first: (distance_km, index)."""
+        if self.tree is None:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        point = unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))[0]
+        idx = np.asarray(self.tree.query_ball_point(point, km_to_chord(radius_km)), dtype=np.int64)
+        dist = chord_to_km(np.linalg.norm(self.tree.data[idx] - point, axis=1))
+        order = np.argsort(dist, kind="stable")[:limit]
+        return dist[order], idx[order]
+
+
+_index = PerVersion(AirportIndex.build)
+
+
+def use_index():
+    return cKDTree is not None and getattr(settings, "MAPS_SPATIAL_INDEX", True)
+
+
+def get_airport_index():
+    return _index.get()
+
+
+# ---------------------------------------------------------------------------
+# Feature queries (index or PostGIS)
+# ---------------------------------------------------------------------------
+
+def _db_distance(lon, lat):
+    return RawSQL(
+        f"ST_Distance(maps_airport.geom::geography, {POINT_SQL}) / 1000.0",
+        (lon, lat),
+        output_field=FloatField(),
+    )
+
+
+def _features(rows):
+    return [
+        airport_feature(row, distance_km=round(row["distance_km"], 2)) for row in rows
+    ]
+
+
+def nearest_features(lat, lon, k=1):
+    """GeoJSON features for the ``k`` airports nearest to (lat, lon)."""
+    if use_index():
+        index = get_airport_index()
+        dist, idx = index.nearest(lat, lon, k)
+        return [
+            airport_feature(index.rows[i], distance_km=round(float(d), 2))
+            for d, i in zip(dist[0], idx[0])
+        ]
+
+    queryset = (
+        Airport.objects.annotate(distance_km=_db_distance(lon, lat))
+        .order_by(RawSQL(f"maps_airport.geom::geography <-> {POINT_SQL}", (lon, lat)))[:k]
+    )
+    return _features(airport_rows(queryset, "distance_km"))
+
+
+def nearby_features(lat, lon, radius_km, limit=300):
+    """GeoJSON features for airports within ``radius_km``, nearest first."""
+    if use_index():
+        index = get_airport_index()
+        dist, idx = index.within(lat, lon, radius_km, limit)
+        return [
+            airport_feature(index.rows[i], distance_km=round(float(d), 2))
+            for d, i in zip(dist, idx)
+        ]
+
+    queryset = (
+        Airport.objects.filter(
+            RawSQL(
+                f"ST_DWithin(maps_airport.geom::geography, {POINT_SQL}, %s)",
+                (lon, lat, radius_km * 1000),
+                output_field=BooleanField(),
+            )
+        )
+        .annotate(distance_km=_db_distance(lon, lat))
+        .order_by("distance_km")[:limit]
+    )
+    return _features(airport_rows(queryset, "distance_km"))
+
+
+def nearest_batch(lon, lat, k=1):
+    """
+    Nearest ``k`` airports for many points at once. ``lon``/``lat`` are
+    arrays; returns (iata_codes, distance_km) as nested lists, one row of
+    ``k`` per point. The KD-tree path is one vectorized query over all
+    cores; the PostGIS path is one LATERAL KNN statement.
+    """
+    if use_index():
+        index = get_airport_index()
+        dist, idx = index.nearest(lat, lon, k, workers=-1)
+        return index.codes[idx].tolist(), np.round(dist, 2).tolist()
+
+    codes = [[] for _ in range(len(lon))]
+    dists = [[] for _ in range(len(lon))]
+    with read_connection().cursor() as cursor:
+        cursor.execute(BATCH_NEAREST_SQL, [np.asarray(lon).tolist(), np.asarray(lat).tolist(), k])
+        for ord_, code, dist in cursor.fetchall():
+            codes[ord_ - 1].append(code)
+            dists[ord_ - 1].append(round(dist, 2))
+    return codes, dists
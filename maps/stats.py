@@ -0,0 +1,139 @@
+"""
+Materialized per-airport connectivity statistics.
+
+``AirportStats`` holds out/in degree, distinct airlines, distinct
+destination countries and total route-km for every airport. Rows are
+recomputed in one set-based statement, either for the whole table (after a
+full load) or only for the airports touched by a change, and
+``Airport.is_major_hub`` is derived from the result. Rankings then read a
+handful of rows off an index instead of aggregating every route.
+"""
+
+from django.conf import settings
+from django.db import connection
+
+# An airport is a major hub if this many routes depart from or arrive at it
+DEFAULT_HUB_MIN_DEGREE = 200
+
+STAT_FIELDS = (
+    "out_degree", "in_degree", "degree", "airline_count", "destination_country_count", "route_km",
+)
+
+# Ranking name → AirportStats field
+RANKINGS = {
+    "degree": "degree",
+    "out_degree": "out_degree",
+    "in_degree": "in_degree",
+    "airlines": "airline_count",
+    "countries": "destination_country_count",
+    "route_km": "route_km",
+}
+
+# ``{where}`` limits the routes/airports considered to the refreshed set
+REFRESH_SQL = """
+WITH targets AS (
+    SELECT id FROM maps_airport WHERE {where}
+),
+edges AS (
+    SELECT r.origin_id AS airport_id, true AS outbound, NULLIF(r.airline, '') AS airline,
+           r.distance_km, d.country
+    FROM maps_flightroute r JOIN maps_airport d ON d.id = r.destination_id
+    WHERE r.origin_id IN (SELECT id FROM targets)
+    UNION ALL
+    SELECT r.destination_id, false, NULLIF(r.airline, ''), r.distance_km, NULL
+    FROM maps_flightroute r
+    WHERE r.destination_id IN (SELECT id FROM targets)
+),
+totals AS (
+    SELECT airport_id,
+           count(*) FILTER (WHERE outbound) AS out_degree,
+           count(*) FILTER (WHERE NOT outbound) AS in_degree,
+           count(DISTINCT airline) AS airline_count,
+           count(DISTINCT country) AS destination_country_count,
+           coalesce(sum(distance_km), 0) AS route_km
+    FROM edges
+    GROUP BY airport_id
+)
+INSERT INTO maps_airportstats
+    (airport_id, out_degree, in_degree, degree, airline_count, destination_country_count, route_km, updated_at)
+SELECT t.id,
+       coalesce(s.out_degree, 0),
+       coalesce(s.in_degree, 0),
+       coalesce(s.out_degree + s.in_degree, 0),
+       coalesce(s.airline_count, 0),
+       coalesce(s.destination_country_count, 0),
+       coalesce(s.route_km, 0),
+       now()
+FROM targets t LEFT JOIN totals s ON s.airport_id = t.id
+ON CONFLICT (airport_id) DO UPDATE SET
+    out_degree = EXCLUDED.out_degree,
+    in_degree = EXCLUDED.in_degree,
+    degree = EXCLUDED.degree,
+    airline_count = EXCLUDED.airline_count,
+    destination_country_count = EXCLUDED.destination_country_count,
+    route_km = EXCLUDED.route_km,
+    updated_at = EXCLUDED.updated_at
+"""
+
+PRUNE_SQL = """
+DELETE FROM maps_airportstats s
+WHERE {where} AND NOT EXISTS (SELECT 1 FROM maps_airport a WHERE a.id = s.airport_id)
+"""
+
+HUB_SQL = """
+UPDATE maps_airport a SET is_major_hub = (s.degree >= %s)
+FROM maps_airportstats s
+WHERE s.airport_id = a.id AND {where} AND a.is_major_hub <> (s.degree >= %s)
+"""
+
+
+def hub_min_degree():
+    return getattr(settings, "MAPS_HUB_MIN_DEGREE", DEFAULT_HUB_MIN_DEGREE)
+
+
+def refresh_airport_stats(airport_ids=None):
+    """
+    Recompute stats for ``airport_ids`` (every airport if None) and update
+    their ``is_major_hub`` flag. Returns the number of hub flags changed,
+    so callers know whether cached responses went stale.
+    """
+    if airport_ids is None:
+        where, params = "true", []
+    else:
+        airport_ids = sorted(set(airport_ids))
+        if not airport_ids:
+            return 0
+        where, params = "{column} = ANY(%s)", [airport_ids]
+
+    threshold = hub_min_degree()
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_SQL.format(where=where.format(column="id")), params)
+        cursor.execute(PRUNE_SQL.format(where=where.format(column="s.airport_id")), params)
+        cursor.execute(
+            HUB_SQL.format(where=where.format(column="a.id")), [threshold, *params, threshold]
+        )
+        return cursor.rowcount
+
+
+def route_neighbours(airport_ids):
+    """
+    Airports whose destination countries depend on ``airport_ids``: every
+    origin with a route into one of them.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT origin_id FROM maps_flightroute WHERE destination_id = ANY(%s)",
+            [list(airport_ids)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def route_endpoints(airport_ids):
+    """Airports at either end of a route touching one of ``airport_ids``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT origin_id, destination_id FROM maps_flightroute "
+            "WHERE origin_id = ANY(%s) OR destination_id = ANY(%s)",
+            [list(airport_ids), list(airport_ids)],
+        )
+        return {airport_id for row in cursor.fetchall() for airport_id in row}
@@ -1,3 +1,806 @@
-from django.test import TestCase
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.contrib.gis.geos import Point
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings, tag
+
+from .airspace import MAX_CORRIDOR_KM, bbox_region, parse_geometry, parse_region, unwrap
+from .analytics import MAX_BINS
+from .benchmark import MAX_AIRPORTS, generate_airports, generate_routes, percentiles
+from .bulk import MAX_BULK_AIRPORTS
+from .cache import PerVersion, etag_matches, get_dataset_version, make_etag, request_cache_key
+from .clusters import MAX_CELLS, MAX_CLUSTER_ZOOM, MAX_WORLD_ZOOM, ClusterLevel, grid_zoom
+from .geojson import CHUNK_SIZE, iter_feature_collection
+from .graph import RouteGraph
+from .ingest import (
+    SkipRow, airport_lookup, airport_record, byte_ranges, diff_manifest, merge_airports,
+    merge_routes, read_airports, read_routes, touched_airports,
+)
+from .metrics import Histogram, metrics, registry, scrape_allowed
+from .models import Airport, AirportStats, FlightRoute
+from .replicas import PIN_COOKIE, ReplicaMiddleware, _read_alias, read_connection
+from .search import MAX_RESULTS as MAX_SEARCH_RESULTS, SearchIndex
+from .serializers import AirportBulkItemSerializer, IataCodeField
+from .spatial import AirportIndex, cKDTree
+from .viewport import bbox_polygons, parse_bbox, parse_zoom
+
+
+def airport(pk, code, lon, lat):
+    return {"id": pk, "iata_code": code, "lon": lon, "lat": lat}
+
+
+class FeatureCollectionTests(SimpleTestCase):
+    def collect(self, features, **members):
+        return json.loads(b"".join(iter_feature_collection(features, **members)))
+
+    def test_chunks_join_into_one_document(self):
+        features = [
+            {"type": "Feature", "geometry": None, "properties": {"n": i}}
+            for i in range(2 * CHUNK_SIZE + 1)
+        ]
+        body = self.collect(iter(features))
+        self.assertEqual(body["type"], "FeatureCollection")
+        self.assertEqual(body["features"], features)
+
+    def test_empty(self):
+        self.assertEqual(self.collect([]), {"type": "FeatureCollection", "features": []})
+
+    def test_members_come_before_features(self):
+        body = self.collect([], next=None, next_cursor=None)
+        self.assertEqual(list(body), ["type", "next", "next_cursor", "features"])
+        self.assertIsNone(body["next"])
+
+
+class ETagTests(SimpleTestCase):
+    def request(self, if_none_match=None):
+        headers = {"HTTP_IF_NONE_MATCH": if_none_match} if if_none_match else {}
+        return RequestFactory().get("/api/airports/", **headers)
+
+    def test_make_etag(self):
+        etag = make_etag(7, "/api/airports/?zoom=3")
+        self.assertRegex(etag, r'^W/"v7-[0-9a-f]{16}"$')
+        self.assertEqual(etag, make_etag(7, "/api/airports/?zoom=3"))
+        self.assertNotEqual(etag, make_etag(8, "/api/airports/?zoom=3"))
+        self.assertNotEqual(etag, make_etag(7, "/api/airports/?zoom=4"))
+
+    def test_etag_matches(self):
+        etag = make_etag(7, "key")
+        self.assertTrue(etag_matches(self.request(etag), etag))
+        self.assertTrue(etag_matches(self.request(etag.removeprefix("W/")), etag))
+        self.assertTrue(etag_matches(self.request(f'"other", {etag}'), etag))
+        self.assertTrue(etag_matches(self.request("*"), etag))
+        self.assertFalse(etag_matches(self.request(make_etag(6, "key")), etag))
+        self.assertFalse(etag_matches(self.request(), etag))
+
+
+class CacheKeyTests(SimpleTestCase):
+    def test_only_declared_params_in_order(self):
+        request = RequestFactory().get("/api/airports/", {"zoom": "4", "x": "1", "bbox": "-11,49,3,59"})
+        self.assertEqual(request_cache_key(request, ("bbox", "zoom")), "/api/airports/?bbox=-11%2C49%2C3%2C59&zoom=4")
+        self.assertEqual(request_cache_key(request), "/api/airports/?")
+
+
+class PerVersionTests(SimpleTestCase):
+    def test_clear_all(self):
+        builds = []
+        per_version = PerVersion(lambda version: builds.append(version) or version)
+        self.addCleanup(PerVersion.instances.remove, per_version)
+        with mock.patch("maps.cache.get_dataset_version", return_value=3):
+            per_version.get()
+            per_version.get()
+            PerVersion.clear_all()
+            self.assertEqual(per_version.get(), 3)
+        self.assertEqual(builds, [3, 3])
+
+
+class ViewportTests(SimpleTestCase):
+    def test_parse_bbox(self):
+        self.assertEqual(parse_bbox("-11,49,3,59"), (-11, 49, 3, 59))
+        self.assertEqual(parse_bbox("170,-10,-170,10"), (170, -10, -170, 10))
+        for value in ["1,2,3", "a,b,c,d", "0,0,200,10", "0,10,5,0", "0,-91,1,0"]:
+            with self.subTest(value), self.assertRaises(ValueError):
+                parse_bbox(value)
+
+    def test_parse_zoom(self):
+        self.assertEqual(parse_zoom("5"), 5)
+        for value in ["23", "-1", "x"]:
+            with self.subTest(value), self.assertRaises(ValueError):
+                parse_zoom(value)
+
+    def test_bbox_across_the_antimeridian_is_split(self):
+        self.assertEqual(len(bbox_polygons((-11, 49, 3, 59))), 1)
+        east, west = bbox_polygons((170, -10, -170, 10))
+        self.assertEqual(east.extent, (170, -10, 180, 10))
+        self.assertEqual(west.extent, (-180, -10, -170, 10))
+
+
+class RequestValidationTests(SimpleTestCase):
+    """Malformed requests are turned away before any query runs."""
+
+    def assertRejected(self, path, *cases):
+        for params in cases:
+            with self.subTest(params):
+                self.assertEqual(self.client.get(path, params).status_code, 400)
+
+    def assertPostRejected(self, path, *bodies, method="post"):
+        for body in bodies:
+            with self.subTest(body):
+                response = getattr(self.client, method)(path, body, content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+
+    def test_airport_list(self):
+        self.assertRejected("/api/airports/", {"bbox": "1,2,3"}, {"bbox": "0,0,200,10"}, {"zoom": "23"}, {"zoom": "x"})
+
+    def test_tile(self):
+        for path in ["/tiles/lakes/1/0/0.pbf", "/tiles/airports/1/2/0.pbf", "/tiles/airports/23/0/0.pbf"]:
+            with self.subTest(path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_connections(self):
+        self.assertRejected(
+            "/api/airports/connections/",
+            {"to": "SYD"},
+            {"from": "DUB", "to": "SYD", "max_hops": "5"},
+            {"from": "DUB", "to": "SYD", "k": "0"},
+            {"from": "DUB", "to": "SYD", "k": "x"},
+        )
+
+    def test_reachable(self):
+        self.assertRejected(
+            "/api/airports/reachable/",
+            {}, {"origin": "DUB", "max_hops": "7"}, {"origin": "DUB", "max_hops": "x"},
+            {"origin": "DUB", "max_km": "far"},
+        )
+
+    def test_reachable_needs_a_real_max_km(self):
+        self.assertRejected(
+            "/api/airports/reachable/",
+            {"origin": "DUB", "max_km": "-1"}, {"origin": "DUB", "max_km": "inf"},
+            {"origin": "DUB", "max_km": "nan"},
+        )
+
+    def test_nearby(self):
+        self.assertRejected(
+            "/api/airports/nearby/",
+            {"lat": "53.3"}, {"lat": "x", "lon": "0"}, {"lat": "91", "lon": "0"},
+            {"lat": "0", "lon": "0", "radius": "-1"},
+        )
+
+    def test_nearest(self):
+        self.assertRejected(
+            "/api/airports/nearest/",
+            {"lon": "0"}, {"lat": "0", "lon": "181"}, {"lat": "0", "lon": "0", "k": "0"},
+            {"lat": "0", "lon": "0", "k": "101"},
+        )
+
+    def test_nearest_batch(self):
+        path = "/api/airports/nearest/batch/"
+        self.assertPostRejected(
+            path,
+            [[0, 0]], {"points": "x"}, {"points": [[0, 0, 0]]}, {"points": [[0, 91]]},
+            {"points": [[0, 0]], "k": 11},
+        )
+        packed = np.zeros(3).tobytes()
+        self.assertEqual(self.client.post(path, packed, content_type="application/octet-stream").status_code, 400)
+
+    def test_top(self):
+        self.assertRejected("/api/airports/top/", {"by": "x"}, {"limit": "0"}, {"limit": "501"}, {"limit": "x"})
+
+    def test_airlines(self):
+        self.assertRejected("/api/analytics/airlines/", {"order": "x"}, {"top": "0"}, {"top": "1001"})
+
+    def test_distances(self):
+        self.assertRejected(
+            "/api/analytics/distances/",
+            {"bins": "0"}, {"bins": str(MAX_BINS + 1)}, {"bins": "x"}, {"min_km": "-1"},
+            {"min_km": "100", "max_km": "50"},
+        )
+
+    def test_distances_must_be_finite(self):
+        self.assertRejected("/api/analytics/distances/", {"max_km": "inf"}, {"min_km": "nan"}, {"max_km": "nan"})
+
+    def test_route_list(self):
+        self.assertRejected(
+            "/api/routes/",
+            {"cursor": "-1"}, {"cursor": "x"}, {"page_size": "0"}, {"page_size": "10001"},
+            {"min_km": "x"},
+        )
+
+    def test_search(self):
+        self.assertRejected(
+            "/api/airports/search/",
+            {}, {"q": "  "}, {"q": "dub", "limit": "0"}, {"q": "dub", "limit": str(MAX_SEARCH_RESULTS + 1)},
+        )
+
+    def test_hubs(self):
+        self.assertRejected("/api/airports/hubs/", {"top": "0"}, {"top": "251"}, {"top": "x"})
+
+    def test_export(self):
+        for path in ["/api/export/lakes.json", "/api/export/routes.csv"]:
+            with self.subTest(path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_clusters(self):
+        self.assertRejected(
+            "/api/airports/clusters/",
+            {}, {"zoom": "23"}, {"zoom": "2", "bbox": "1,2,3"}, {"zoom": str(MAX_WORLD_ZOOM + 1)},
+        )
+
+    def test_bulk(self):
+        too_many = [{}] * (MAX_BULK_AIRPORTS + 1)
+        for method in ("post", "patch"):
+            self.assertPostRejected("/api/airports/bulk/", {"iata_code": "DUB"}, [], '"x"', too_many, method=method)
+
+    def test_intersecting(self):
+        self.assertRejected(
+            "/api/routes/intersecting/",
+            {}, {"bbox": "1,2,3"}, {"polygon": "garbage"}, {"polygon": "POINT(1 2)"},
+        )
+
+    def test_intersecting_hemisphere(self):
+        self.assertRejected("/api/routes/intersecting/", {"bbox": "-170,-80,170,80"})
+
+    def test_near(self):
+        self.assertRejected(
+            "/api/routes/near/",
+            {}, {"lat": "91", "lon": "0"}, {"lat": "0", "lon": "0", "km": str(MAX_CORRIDOR_KM + 1)},
+            {"corridor": "POINT(1 2)"}, {"lat": "0", "lon": "0", "km": "x"},
+        )
+
+
+class RouteGraphTests(SimpleTestCase):
+    """
+    Four airports on a 10-degree square with routes
+    AAA -> BBB -> CCC, AAA -> DDD -> CCC and AAA -> CCC direct.
+    """
+
+    def setUp(self):
+        airports = [
+            airport(1, "AAA", 0, 0), airport(2, "BBB", 0, 10),
+            airport(3, "CCC", 10, 10), airport(4, "DDD", 10, 0),
+        ]
+        routes = [(1, 2, "XX"), (2, 3, "XX"), (1, 4, "YY"), (4, 3, "YY"), (1, 3, "ZZ")]
+        origins, destinations, airlines = zip(*routes)
+        self.graph = RouteGraph(1, airports, origins, destinations, airlines, [None] * len(routes))
+        self.a, self.b, self.c, self.d = (self.graph.node(code) for code in ("aaa", "BBB", "CCC", "DDD"))
+
+    def codes(self, path):
+        return [self.graph.airports[n]["iata_code"] for n in path]
+
+    def test_shortest_paths_in_distance_order(self):
+        results = self.graph.shortest_paths(self.a, self.c, k=3, max_hops=2)
+        self.assertEqual(
+            [self.codes(path) for _, path in results],
+            [["AAA", "CCC"], ["AAA", "BBB", "CCC"], ["AAA", "DDD", "CCC"]],
+        )
+        distances = [distance for distance, _ in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[0], 1568.5, delta=1)
+
+    def test_shortest_paths_respects_hops_and_k(self):
+        self.assertEqual(len(self.graph.shortest_paths(self.a, self.c, k=3, max_hops=1)), 1)
+        self.assertEqual(len(self.graph.shortest_paths(self.a, self.c, k=2, max_hops=2)), 2)
+        self.assertEqual(self.graph.shortest_paths(self.c, self.a, k=3, max_hops=3), [])
+
+    def test_shortest_paths_past_dead_ends(self):
+        # Both cheap ways to XXX go through YYY, its only way on; the
+        # itinerary via CCC -> DDD -> XXX must still be found
+        codes = ["SSS", "YYY", "AAA", "BBB", "CCC", "DDD", "XXX", "TTT"]
+        airports = [airport(i, code, 0, 0) for i, code in enumerate(codes, start=1)]
+        s, y, a, b, c, d, x, t = range(1, 9)
+        legs = [(s, y, 1), (y, a, 1), (y, b, 1), (a, x, 1), (b, x, 1),
+                (s, c, 1), (c, d, 1), (d, x, 1.5), (x, y, 1), (y, t, 10)]
+        origins, destinations, distances = zip(*legs)
+        graph = RouteGraph(1, airports, origins, destinations, ["XX"] * len(legs), distances)
+        results = graph.shortest_paths(graph.node("SSS"), graph.node("TTT"), k=2, max_hops=5)
+        self.assertEqual(
+            [[graph.airports[n]["iata_code"] for n in path] for _, path in results],
+            [["SSS", "YYY", "TTT"], ["SSS", "CCC", "DDD", "XXX", "YYY", "TTT"]],
+        )
+
+    def test_hops_to(self):
+        self.assertEqual(self.graph.hops_to(self.c, max_hops=2).tolist(), [1, 1, 0, 1])
+        self.assertEqual(self.graph.hops_to(self.a, max_hops=3).tolist(), [0, -1, -1, -1])
+
+    def test_shortest_paths_by_airline(self):
+        results = self.graph.shortest_paths(self.a, self.c, k=3, max_hops=2, airline="xx")
+        self.assertEqual([self.codes(path) for _, path in results], [["AAA", "BBB", "CCC"]])
+
+    def test_reachability_by_hops(self):
+        hops, dist = self.graph.reachability(self.a, max_hops=1)
+        self.assertEqual(hops.tolist(), [0, 1, 1, 1])
+        self.assertEqual(dist[self.a], 0)
+
+    def test_reachability_within_max_km(self):
+        hops, dist = self.graph.reachability(self.a, max_hops=2, max_km=1200)
+        self.assertEqual(hops[self.c], -1)
+        self.assertEqual(dist[self.c], float("inf"))
+        self.assertEqual(hops[self.b], 1)
+
+    def test_reachability_by_airline(self):
+        hops, _ = self.graph.reachability(self.a, max_hops=2, airline="YY")
+        self.assertEqual(hops.tolist(), [0, -1, 2, 1])
+
+
+@skipUnless(cKDTree, "needs SciPy")
+class AirportIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = AirportIndex(1, [
+            airport(1, "DUB", -6.27, 53.42), airport(2, "LHR", -0.45, 51.47),
+            airport(3, "CDG", 2.55, 49.01), airport(4, "JFK", -73.78, 40.64),
+        ])
+
+    def test_nearest(self):
+        distance, idx = self.index.nearest(53.3, -6.2, k=2)
+        self.assertEqual(idx.tolist(), [[0, 1]])
+        self.assertAlmostEqual(distance[0, 0], 14, delta=1)
+        _, idx = self.index.nearest(np.array([53.3, 40.7]), np.array([-6.2, -74.0]))
+        self.assertEqual(idx[:, 0].tolist(), [0, 3])
+        self.assertEqual(self.index.nearest(0, 0, k=10)[1].shape, (1, 4))
+
+    def test_within(self):
+        distance, idx = self.index.within(51.5, -0.1, 400)
+        self.assertEqual(idx.tolist(), [1, 2])
+        self.assertEqual(distance.tolist(), sorted(distance.tolist()))
+        self.assertEqual(self.index.within(51.5, -0.1, 400, limit=1)[1].tolist(), [1])
+
+    def test_empty(self):
+        index = AirportIndex(1, [])
+        self.assertEqual(index.within(0, 0, 100)[1].tolist(), [])
+        self.assertEqual(index.nearest(0, 0)[1].shape, (1, 0))
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        # Busiest first, as SearchIndex.build orders them
+        rows = [
+            {"iata_code": "DBO", "name": "Dubbo Airport", "city": "Dubbo"},
+            {"iata_code": "LHR", "name": "Heathrow", "city": "London"},
+            {"iata_code": "DUB", "name": "Dublin Airport", "city": "Dublin"},
+            {"iata_code": "ZRH", "name": "Zürich Airport", "city": "Zurich"},
+            {"iata_code": "LGW", "name": "Gatwick", "city": "London"},
+        ]
+        self.index = SearchIndex(1, rows)
+
+    def test_iata_matches_come_first(self):
+        self.assertEqual(self.index.lookup("dub"), [2, 0])
+
+    def test_word_prefixes_in_row_order(self):
+        self.assertEqual(self.index.lookup("Lon"), [1, 4])
+
+    def test_accents_are_ignored(self):
+        self.assertEqual(self.index.lookup("zür"), [3])
+        self.assertEqual(self.index.lookup("ZUR"), [3])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.index.lookup("london heath"), [1])
+        self.assertEqual(self.index.lookup("airport dubl"), [2])
+
+    def test_limit_and_misses(self):
+        self.assertEqual(self.index.lookup("airport", limit=2), [0, 2])
+        self.assertEqual(self.index.lookup("  "), [])
+        self.assertIsNone(self.index.lookup("qqq"))
+
+
+class IngestParsingTests(SimpleTestCase):
+    GOROKA = '1,"Goroka Airport","Goroka","Papua New Guinea","GKA","AYGA",-6.08,145.39,5282,10,"U"'
+
+    def test_airport_record(self):
+        self.assertEqual(
+            read_airports([self.GOROKA])[0]["GKA"],
+            ("GKA", "Goroka Airport", "Goroka", "Papua New Guinea", 145.39, -6.08),
+        )
+
+    def test_airport_skip_reasons(self):
+        cases = {
+            "short_row": ["1", "A"],
+            "bad_coordinates": ["1", "A", "B", "C", "AAA", "", "north", "0"],
+            "no_iata": ["1", "A", "B", "C", "\\N", "", "0", "0"],
+            "out_of_range": ["1", "A", "B", "C", "AAA", "", "95", "0"],
+            "heli_or_seaplane": ["1", "City Heliport", "B", "C", "AAA", "", "0", "0"],
+            "excluded_country": ["1", "A", "B", "Antarctica", "AAA", "", "0", "0"],
+        }
+        for reason, row in cases.items():
+            with self.subTest(reason), self.assertRaises(SkipRow) as raised:
+                airport_record(row)
+            self.assertEqual(raised.exception.reason, reason)
+
+    def test_later_duplicate_airport_wins(self):
+        moved = self.GOROKA.replace("145.39", "145.5")
+        records, skipped = read_airports([self.GOROKA, moved])
+        self.assertEqual(records["GKA"][4], 145.5)
+        self.assertEqual(skipped["duplicate_iata"], 1)
+
+    def test_read_routes(self):
+        airports = {"AER": (1, 39.9, 43.4), "KZN": (2, 49.3, 55.6)}
+        lines = [
+            "2B,410,AER,2965,KZN,2990,,0,CR2",
+            "2B,410,AER,2965,KZN,2990,,0,CR2",
+            "2B,410,AER,2965,AER,2965,,0,CR2",
+            "2B,410,AER,2965,XXX,1,,0,CR2",
+            "2B,410,AERO,1,KZN,2990,,0,CR2",
+            "2B,410",
+        ]
+        batch, skipped = read_routes(lines, airports)
+        routes = zip(batch.origin_ids.tolist(), batch.destination_ids.tolist(), batch.airlines)
+        self.assertEqual(list(routes), [(1, 2, "2B")])
+        self.assertAlmostEqual(batch.distances()[0], 1513.8, delta=0.5)
+        self.assertEqual(skipped, {
+            "duplicate_route": 1, "same_airport": 1, "unknown_airport": 1, "no_iata": 1, "short_row": 1,
+        })
+
+    def test_touched_airports(self):
+        self.assertEqual(touched_airports(["1:2:AA", "3:1:B:C", "4:5:"]), {1, 2, 3, 4, 5})
+        self.assertEqual(touched_airports([]), set())
+
+    def test_diff_manifest(self):
+        previous = {"a": "1", "b": "2", "c": "3"}
+        with mock.patch("maps.ingest.load_manifest", return_value=previous):
+            delta = diff_manifest("routes", {"a": "1", "b": "changed", "d": "4"})
+        self.assertEqual((delta.inserts, delta.updates, delta.deletes, delta.unchanged), (["d"], ["b"], ["c"], 1))
+        self.assertTrue(delta)
+
+    def test_byte_ranges_split_on_lines(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = Path(workdir) / "routes.dat"
+            path.write_bytes(b"".join(f"{i},row\n".encode() for i in range(1000)))
+            data = path.read_bytes()
+            ranges = byte_ranges(path, 4)
+            self.assertEqual(byte_ranges(path, 1), [(0, len(data))])
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual((ranges[0][0], ranges[-1][1]), (0, len(data)))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[start - 1:start], b"\n")
+
+    def test_workers_need_fork(self):
+        with mock.patch("multiprocessing.get_all_start_methods", return_value=["spawn"]):
+            for command in ("load_airports", "load_routes"):
+                with self.subTest(command), self.assertRaisesMessage(CommandError, "--workers"):
+                    call_command(command, __file__, workers=2)
+
+
+@tag("postgis")
+class CopyMergeTests(TransactionTestCase):
+    """The COPY + INSERT ... ON CONFLICT loaders, against PostGIS."""
+
+    def test_merge_airports(self):
+        records, _ = read_airports([IngestParsingTests.GOROKA])
+        self.assertEqual(merge_airports(records.values()), (1, 0))
+        moved, _ = read_airports([IngestParsingTests.GOROKA.replace("145.39", "145.5")])
+        self.assertEqual(merge_airports(moved.values()), (0, 1))
+        airport = Airport.objects.get(iata_code="GKA")
+        self.assertEqual((airport.name, airport.geom.x, airport.geom.y), ("Goroka Airport", 145.5, -6.08))
+
+    def test_merge_routes(self):
+        for code, lon, lat in [("AER", 39.9, 43.4), ("KZN", 49.3, 55.6)]:
+            Airport.objects.create(name=code, iata_code=code, geom=Point(lon, lat, srid=4326))
+        line = "2B,410,AER,2965,KZN,2990,,0,CR2"
+        batch, _ = read_routes([line], airport_lookup())
+        self.assertEqual(merge_routes(batch), (1, 0))
+        self.assertEqual(merge_routes(batch), (0, 1))
+        route = FlightRoute.objects.get()
+        self.assertEqual((route.origin.iata_code, route.destination.iata_code, route.airline), ("AER", "KZN", "2B"))
+        self.assertAlmostEqual(route.distance_km, 1513.8, delta=0.5)
+
+
+@tag("postgis")
+class StatsSignalTests(TransactionTestCase):
+    """ORM writes bump the dataset version and refresh AirportStats on commit."""
+
+    def setUp(self):
+        self.dub, self.lhr, self.cdg = (
+            Airport.objects.create(name=name, iata_code=code, country=country, geom=Point(lon, lat, srid=4326))
+            for name, code, country, lon, lat in [
+                ("Dublin", "DUB", "Ireland", -6.27, 53.42),
+                ("Heathrow", "LHR", "United Kingdom", -0.45, 51.47),
+                ("Charles de Gaulle", "CDG", "France", 2.55, 49.01),
+            ]
+        )
+
+    def test_route_saves_refresh_stats(self):
+        before = get_dataset_version()
+        FlightRoute.objects.create(origin=self.dub, destination=self.lhr, airline="EI")
+        FlightRoute.objects.create(origin=self.dub, destination=self.cdg, airline="EI")
+        self.assertGreater(get_dataset_version(), before)
+        stats = AirportStats.objects.get(airport=self.dub)
+        self.assertEqual((stats.out_degree, stats.in_degree, stats.degree), (2, 0, 2))
+        self.assertEqual((stats.airline_count, stats.destination_country_count), (1, 2))
+        self.assertEqual(AirportStats.objects.get(airport=self.lhr).in_degree, 1)
+
+    def test_one_refresh_per_transaction(self):
+        before = get_dataset_version()
+        with transaction.atomic():
+            FlightRoute.objects.create(origin=self.dub, destination=self.lhr, airline="EI")
+            FlightRoute.objects.create(origin=self.dub, destination=self.cdg, airline="AF")
+            self.assertEqual(get_dataset_version(), before + 1)
+            self.assertEqual(AirportStats.objects.get(airport=self.dub).out_degree, 0)
+        # Bumped again by the refresh after commit
+        self.assertEqual(get_dataset_version(), before + 2)
+        self.assertEqual(AirportStats.objects.get(airport=self.dub).airline_count, 2)
+
+    def test_airport_delete(self):
+        FlightRoute.objects.create(origin=self.dub, destination=self.lhr, airline="EI")
+        FlightRoute.objects.create(origin=self.cdg, destination=self.lhr, airline="AF")
+        before = get_dataset_version()
+        self.lhr.delete()
+        self.assertFalse(FlightRoute.objects.exists())
+        self.assertEqual(AirportStats.objects.get(airport=self.dub).out_degree, 0)
+        self.assertEqual(AirportStats.objects.get(airport=self.cdg).out_degree, 0)
+        self.assertFalse(AirportStats.objects.filter(airport_id=self.lhr.pk).exists())
+        self.assertGreater(get_dataset_version(), before)
+
+    def test_move_rewrites_routes(self):
+        route = FlightRoute.objects.create(origin=self.dub, destination=self.lhr, airline="EI")
+        self.lhr.geom = Point(-6.27, 54.42, srid=4326)
+        self.lhr.save()
+        route.refresh_from_db()
+        self.assertEqual(route.geom.coords[1], (-6.27, 54.42))
+        self.assertAlmostEqual(route.distance_km, 111.2, delta=0.1)
+
+    def test_move_refreshes_stats_at_the_far_end(self):
+        FlightRoute.objects.create(origin=self.dub, destination=self.lhr, airline="EI")
+        self.lhr.geom = Point(-6.27, 54.42, srid=4326)
+        self.lhr.save()
+        self.assertAlmostEqual(AirportStats.objects.get(airport=self.dub).route_km, 111.2, delta=0.1)
+
+
+class BenchmarkDataTests(SimpleTestCase):
+    def test_synthetic_files_load_cleanly(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            airports_path, routes_path = Path(workdir) / "airports.dat", Path(workdir) / "routes.dat"
+            codes = generate_airports(airports_path, 1)
+            route_count = generate_routes(routes_path, codes, 1)
+            with open(airports_path, encoding="utf-8") as f:
+                records, skipped = read_airports(f)
+            self.assertEqual((len(records), dict(skipped)), (len(codes), {}))
+            lookup = {code: (i, lon, lat) for i, (code, *_, lon, lat) in enumerate(records.values())}
+            with open(routes_path, encoding="utf-8") as f:
+                batch, skipped = read_routes(f, lookup)
+            self.assertEqual((len(batch), dict(skipped)), (route_count, {}))
+
+    def test_percentiles(self):
+        summary = percentiles(range(1, 101))
+        self.assertEqual((summary["p50"], summary["max"], summary["mean"]), (50.5, 100, 50.5))
+        self.assertEqual(list(summary), ["p50", "p90", "p95", "p99", "mean", "max"])
+
+    def test_airports_cap_at_the_code_space(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            codes = generate_airports(Path(workdir) / "airports.dat", 10)
+        self.assertEqual(len(codes), MAX_AIRPORTS)
+        self.assertEqual(len(set(codes)), MAX_AIRPORTS)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("h", "Help.", (1, 5))
+        for value in (0.5, 3, 9):
+            histogram.observe('view="v"', value)
+        self.assertEqual(list(histogram.render())[2:], [
+            'h_bucket{view="v",le="1"} 1',
+            'h_bucket{view="v",le="5"} 2',
+            'h_bucket{view="v",le="+Inf"} 3',
+            'h_sum{view="v"} 12.5',
+            'h_count{view="v"} 3',
+        ])
+
+    def test_requests_are_counted(self):
+        self.client.get("/api/airports/search/")
+        self.assertIn('status="400",view="airports-search"}', registry.render())
+
+
+class MetricsAccessTests(SimpleTestCase):
+    def request(self, addr, token=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return RequestFactory().get("/metrics", REMOTE_ADDR=addr, **headers)
+
+    @override_settings(MAPS_METRICS_ALLOWED_IPS=["127.0.0.1/32", "10.1.0.0/16"], MAPS_METRICS_TOKEN=None)
+    def test_allowlist(self):
+        self.assertTrue(scrape_allowed(self.request("127.0.0.1")))
+        self.assertTrue(scrape_allowed(self.request("10.1.2.3")))
+        self.assertFalse(scrape_allowed(self.request("172.18.0.5")))
+        self.assertEqual(metrics(self.request("172.18.0.5")).status_code, 403)
+
+    @override_settings(MAPS_METRICS_ALLOWED_IPS=["0.0.0.0/0"], MAPS_METRICS_TOKEN="s3cret")
+    def test_token(self):
+        self.assertTrue(scrape_allowed(self.request("172.18.0.5", "s3cret")))
+        self.assertFalse(scrape_allowed(self.request("172.18.0.5", "wrong")))
+        self.assertFalse(scrape_allowed(self.request("172.18.0.5")))
+
+
+class AsyncViewTests(SimpleTestCase):
+
+    def test_not_served_over_wsgi(self):
+        self.assertEqual(self.client.get("/api/async/airports/hubs/").status_code, 404)
+
+    async def test_rejects_bad_params(self):
+        cases = [
+            ("/api/async/airports/", {"bbox": "1,2,3"}),
+            ("/api/async/airports/", {"zoom": "23"}),
+            ("/api/async/airports/routes/", {}),
+            ("/api/async/airports/nearby/", {"lat": "91", "lon": "0"}),
+            ("/api/async/airports/nearest/", {"lat": "0", "lon": "0", "k": "0"}),
+        ]
+        for path, params in cases:
+            with self.subTest(path, **params):
+                response = await self.async_client.get(path, params)
+                self.assertEqual(response.status_code, 400)
+
+    async def test_rejects_bad_top(self):
+        for top in ("0", "251", "x"):
+            with self.subTest(top):
+                response = await self.async_client.get("/api/async/airports/hubs/", {"top": top})
+                self.assertEqual(response.status_code, 400)
+
+    async def test_read_only(self):
+        response = await self.async_client.post("/api/async/airports/")
+        self.assertEqual(response.status_code, 405)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.middleware = ReplicaMiddleware(lambda request: HttpResponse())
+        self.middleware.replicas = ["replica_1"]
+        self.factory = RequestFactory()
+
+    def test_api_reads_go_to_a_replica(self):
+        self.assertEqual(self.middleware.read_alias(self.factory.get("/api/airports/")), "replica_1")
+        self.assertIsNone(self.middleware.read_alias(self.factory.post("/api/airports/")))
+        self.assertIsNone(self.middleware.read_alias(self.factory.get("/admin/")))
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.middleware.pin(self.factory.post("/api/airports/"), HttpResponse())
+        self.assertIn(PIN_COOKIE, response.cookies)
+        pinned = self.factory.get("/api/airports/")
+        pinned.COOKIES[PIN_COOKIE] = "1"
+        self.assertIsNone(self.middleware.read_alias(pinned))
+        response = self.middleware.pin(self.factory.post("/api/airports/"), HttpResponse(status=400))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_read_connection(self):
+        with mock.patch("maps.replicas.connections", {"default": "primary", "replica_1": "replica"}):
+            self.assertEqual(read_connection(), "primary")
+            token = _read_alias.set("replica_1")
+            try:
+                self.assertEqual(read_connection(), "replica")
+            finally:
+                _read_alias.reset(token)
+
+
+class ClusterGridTests(SimpleTestCase):
+    def test_screen_sized_bbox_keeps_its_zoom(self):
+        self.assertEqual(grid_zoom(8, (-7, 52, -5, 54)), 8)
+        self.assertEqual(grid_zoom(20, (-6.3, 53.3, -6.2, 53.4)), MAX_CLUSTER_ZOOM)
+
+    def test_large_bbox_is_coarsened(self):
+        self.assertEqual(grid_zoom(10, (-180, -85, 180, 85)), MAX_WORLD_ZOOM)
+        self.assertLess(grid_zoom(10, (170, -60, -170, 60)), 10)
+
+    def test_cells_stay_bounded(self):
+        lon = np.random.default_rng(0).uniform(-180, 180, 20000)
+        lat = np.random.default_rng(1).uniform(-80, 80, 20000)
+        for bbox in [(-180, -85, 180, 85), (-30, 30, 40, 70), (100, -50, 180, 0)]:
+            zoom = grid_zoom(12, bbox)
+            with self.subTest(bbox):
+                self.assertLessEqual(len(ClusterLevel(lon, lat, zoom).within(bbox)), MAX_CELLS)
+
+
+class AirportModelTests(SimpleTestCase):
+    def test_has_moved(self):
+        airport = Airport.from_db("default", ["id", "geom"], [1, Point(-6.27, 53.42, srid=4326)])
+        self.assertFalse(airport.has_moved())
+        airport.geom = Point(-6.27, 53.5, srid=4326)
+        self.assertTrue(airport.has_moved())
+        self.assertTrue(Airport(geom=Point(0, 0, srid=4326)).has_moved())
+
+    def test_endpoint_geoms_from_loaded_airports(self):
+        origin = Airport(pk=1, geom=Point(-6.27, 53.42, srid=4326))
+        destination = Airport(pk=2, geom=Point(-0.45, 51.47, srid=4326))
+        route = FlightRoute(origin=origin, destination=destination)
+        # SimpleTestCase would fail on a query
+        self.assertEqual(list(route.endpoint_geoms()), [origin.geom, destination.geom])
+
+
+class AirportSerializerTests(SimpleTestCase):
+
+    def test_iata_code_field(self):
+        self.assertEqual(IataCodeField(max_length=10).run_validation(" jfk "), "JFK")
+
+    def test_bulk_item_upper_cases_iata_code(self):
+        item = AirportBulkItemSerializer(data={
+            "name": "John F Kennedy", "iata_code": "jfk", "city": "New York",
+            "country": "United States", "altitude_ft": 13, "lat": 40.64, "lon": -73.78,
+        })
+        self.assertTrue(item.is_valid(), item.errors)
+        self.assertEqual(item.validated_data["iata_code"], "JFK")
+
+    def test_bulk_item_needs_lat_and_lon(self):
+        item = AirportBulkItemSerializer(data={"iata_code": "JFK", "lat": 40.64}, partial=True)
+        self.assertFalse(item.is_valid())
+
+
+@tag("postgis")
+class BulkWriteTests(TransactionTestCase):
+
+    def test_post_creates_and_reports_bad_items(self):
+        response = self.client.post("/api/airports/bulk/", [
+            {"iata_code": "dub", "name": "Dublin Airport", "lat": 53.42, "lon": -6.27},
+            {"iata_code": "LHR", "name": "Heathrow"},
+        ], content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["created"], body["updated"]), (1, 0))
+        self.assertEqual([error["index"] for error in body["errors"]], [1])
+        self.assertEqual(Airport.objects.get(iata_code="DUB").geom.coords, (-6.27, 53.42))
+
+    def test_patch_updates_only_given_fields(self):
+        Airport.objects.create(name="Dublin", iata_code="DUB", city="Dublin", geom=Point(-6.27, 53.42, srid=4326))
+        before = get_dataset_version()
+        response = self.client.patch("/api/airports/bulk/", [
+            {"iata_code": "DUB", "name": "Dublin Airport"},
+            {"iata_code": "XXX", "name": "Nowhere"},
+        ], content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["created"], body["updated"]), (0, 1))
+        self.assertEqual([error.get("iata_code") for error in body["errors"]], ["XXX"])
+        airport = Airport.objects.get(iata_code="DUB")
+        self.assertEqual((airport.name, airport.city), ("Dublin Airport", "Dublin"))
+        self.assertEqual(airport.geom.coords, (-6.27, 53.42))
+        self.assertEqual(get_dataset_version(), before + 1)
+
+    def test_single_and_bulk_writes_share_codes(self):
+        response = self.client.post(
+            "/api/airports/",
+            {"name": "Dublin Airport", "iata_code": "dub", "lat": 53.42, "lon": -6.27},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        duplicate = {"name": "Dublin", "iata_code": "DUB", "lat": 53.42, "lon": -6.27}
+        response = self.client.post("/api/airports/", duplicate, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            "/api/airports/bulk/", [{"iata_code": "Dub", "city": "Dublin"}], content_type="application/json",
+        )
+        self.assertEqual(response.json()["updated"], 1)
+
+
+class UnwrapTests(SimpleTestCase):
+    def test_crossing_the_antimeridian_eastwards(self):
+        self.assertEqual(
+            unwrap([[170, 0], [179, 1], [-179, 2], [-170, 3]]),
+            [[170, 0], [179, 1], [181, 2], [190, 3]],
+        )
+
+    def test_crossing_the_antimeridian_westwards(self):
+        self.assertEqual(unwrap([[-175, 0], [175, 1]]), [[-175, 0], [-185, 1]])
+
+    def test_paths_that_dont_cross_are_unchanged(self):
+        self.assertEqual(unwrap([[-6.2, 53.4], [-0.5, 51.5]]), [[-6.2, 53.4], [-0.5, 51.5]])
+
+
+class RegionTests(SimpleTestCase):
+
+    def test_bbox_across_the_antimeridian_is_split(self):
+        region = bbox_region((170, -20, -170, 10))
+        self.assertEqual(region.geom_type, "MultiPolygon")
+        self.assertEqual(len(region), 2)
+
+    def test_regions_of_a_hemisphere_or_more_are_rejected(self):
+        for bbox in [(-170, -80, 170, 80), (10, -10, 0, 10), (0, -90, 10, 90)]:
+            with self.subTest(bbox), self.assertRaises(ValueError):
+                bbox_region(bbox)
+        with self.assertRaises(ValueError):
+            parse_region("POLYGON((-100 0, 100 0, 100 10, -100 10, -100 0))")
+        self.assertEqual(parse_region("POLYGON((-10 45, 2 45, 2 52, -10 52, -10 45))").geom_type, "Polygon")
+
+    def test_bad_geometries_are_rejected(self):
+        for value in ["garbage", "POINT(1 2)", "POLYGON((0 0, 200 0, 200 1, 0 0))"]:
+            with self.subTest(value), self.assertRaises(ValueError):
+                parse_geometry(value, ("Polygon", "MultiPolygon"))
@@ -0,0 +1,162 @@
+"""
+Mapbox Vector Tiles for airports and flight routes.
+
+Tiles are built in PostGIS with ST_AsMVT/ST_AsMVTGeom, selecting fewer
+attributes at low zooms, and written to an on-disk cache under
+``TILE_CACHE_DIR/v<dataset version>/``. A new dataset version gets a fresh
+directory; older ones are pruned, and the loaders clear the cache outright.
+Only tiles with features up to ``TILE_CACHE_MAX_ZOOM`` are stored: deeper
+zooms have far more tiles, each rarely requested and cheap to build, and
+empty tiles are served as 204 without a file.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import get_dataset_version
+from .replicas import read_connection
+
+EXTENT = 4096
+BUFFER = 64
+MAX_ZOOM = 22
+DEFAULT_CACHE_MAX_ZOOM = 12
+
+# Attributes per layer, as (min zoom, SQL expression, name)
+LAYER_ATTRIBUTES = {
+    "airports": [
+        (0, "a.iata_code", "iata_code"),
+        (0, "a.is_major_hub", "is_major_hub"),
+        (4, "a.name", "name"),
+        (6, "a.city", "city"),
+        (6, "a.country", "country"),
+        (8, "a.id", "id"),
+        (8, "a.altitude_ft", "altitude_ft"),
+    ],
+    "routes": [
+        (0, "r.distance_km", "distance_km"),
+        (4, "o.iata_code", "origin"),
+        (4, "d.iata_code", "destination"),
+        (6, "r.airline", "airline"),
+        (8, "r.id", "id"),
+    ],
+}
+
+# Below this zoom parallel routes (same pair, different airline) are drawn once
+ROUTE_DEDUPE_MAX_ZOOM = 6
+
+AIRPORT_SQL = """
+WITH bounds AS (SELECT ST_TileEnvelope(%s, %s, %s) AS geom),
+mvtgeom AS (
+    SELECT ST_AsMVTGeom(ST_Transform(a.geom, 3857), bounds.geom, {extent}, {buffer}, true) AS geom,
+           {columns}
+    FROM maps_airport a, bounds
+    WHERE a.geom && ST_Transform(bounds.geom, 4326)
+)
+SELECT ST_AsMVT(mvtgeom.*, 'airports', {extent}, 'geom') FROM mvtgeom
+"""
+
+ROUTE_SQL = """
+WITH bounds AS (SELECT ST_TileEnvelope(%s, %s, %s) AS geom),
+mvtgeom AS (
+    SELECT {distinct} ST_AsMVTGeom(ST_Transform(r.geom, 3857), bounds.geom, {extent}, {buffer}, true) AS geom,
+           {columns}
+    FROM maps_flightroute r
+    JOIN maps_airport o ON o.id = r.origin_id
+    JOIN maps_airport d ON d.id = r.destination_id,
+    bounds
+    WHERE r.geom && ST_Transform(bounds.geom, 4326)
+    {order_by}
+)
+SELECT ST_AsMVT(mvtgeom.*, 'routes', {extent}, 'geom') FROM mvtgeom
+"""
+
+
+def valid_tile(layer, z, x, y):
+    return layer in LAYER_ATTRIBUTES and 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_sql(layer, z):
+    columns = ", ".join(
+        f"{expr} AS {name}" for min_zoom, expr, name in LAYER_ATTRIBUTES[layer] if z >= min_zoom
+    )
+    if layer == "airports":
+        return AIRPORT_SQL.format(extent=EXTENT, buffer=BUFFER, columns=columns)
+    dedupe = z < ROUTE_DEDUPE_MAX_ZOOM
+    return ROUTE_SQL.format(
+        extent=EXTENT,
+        buffer=BUFFER,
+        columns=columns,
+        distinct="DISTINCT ON (r.origin_id, r.destination_id)" if dedupe else "",
+        order_by="ORDER BY r.origin_id, r.destination_id" if dedupe else "",
+    )
+
+
+def render_tile(layer, z, x, y):
+    """Build one MVT tile in PostGIS. Returns bytes (empty if no features)."""
+    with read_connection().cursor() as cursor:
+        cursor.execute(tile_sql(layer, z), [z, x, y])
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+# ---------------------------------------------------------------------------
+# On-disk cache
+# ---------------------------------------------------------------------------
+
+def tile_cache_dir():
+    return Path(settings.TILE_CACHE_DIR)
+
+
+def cache_max_zoom():
+    return getattr(settings, "TILE_CACHE_MAX_ZOOM", DEFAULT_CACHE_MAX_ZOOM)
+
+
+def _prune_old_versions(root, current):
+    if not root.exists():
+        return
+    for child in root.iterdir():
+        if child.is_dir() and child.name != current:
+            shutil.rmtree(child, ignore_errors=True)
+
+
+def clear_tile_cache():
+    """Remove every cached tile. Called by the data loaders."""
+    shutil.rmtree(tile_cache_dir(), ignore_errors=True)
+
+
+def get_tile(layer, z, x, y, version=None):
+    """
+    Return tile bytes from the disk cache, rendering on a miss and storing
+    the result if it is non-empty and within ``TILE_CACHE_MAX_ZOOM``.
+    """
+    if z > cache_max_zoom():
+        return render_tile(layer, z, x, y)
+    if version is None:
+        version = get_dataset_version()
+    root = tile_cache_dir()
+    version_dir = root / f"v{version}"
+    path = version_dir / layer / str(z) / str(x) / f"{y}.pbf"
+
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+
+    if not version_dir.exists():
+        _prune_old_versions(root, version_dir.name)
+
+    data = render_tile(layer, z, x, y)
+    if not data:
+        return data
+
+    # Write to a temp file and rename, so readers never see a partial tile
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return data
@@ -0,0 +1,88 @@
+"""
+Viewport filtering for map requests: ``bbox=`` and ``zoom=`` parameters.
+
+The bbox filter is a plain ``&&`` (bboverlaps) against ``geom`` so it is
+answered from the GIST index created in migration 0002. At low zooms the
+result is thinned to a fixed budget of airports, major hubs and busy
+airports first, so a world view doesn't pull the whole table.
+"""
+
+from django.contrib.gis.geos import Polygon
+from django.db.models import F, Q
+
+MAX_ZOOM = 22
+
+# Airports returned per viewport below full-detail zoom (zoom → limit)
+ZOOM_LIMITS = {0: 150, 1: 150, 2: 250, 3: 400, 4: 700, 5: 1200, 6: 2000}
+
+
+def parse_bbox(value):
+    """
+    Parse ``minLon,minLat,maxLon,maxLat``. A viewport crossing the
+    antimeridian has minLon > maxLon. Raises ValueError if malformed.
+    """
+    parts = [float(p) for p in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox needs four numbers")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError("bbox longitude out of range")
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox latitude out of range")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_zoom(value):
+    zoom = int(value)
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError("zoom out of range")
+    return zoom
+
+
+def bbox_polygons(bbox):
+    """One polygon per side of the antimeridian that the bbox covers."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_lon <= max_lon:
+        boxes = [(min_lon, min_lat, max_lon, max_lat)]
+    else:
+        boxes = [(min_lon, min_lat, 180, max_lat), (-180, min_lat, max_lon, max_lat)]
+    polygons = []
+    for box in boxes:
+        polygon = Polygon.from_bbox(box)
+        polygon.srid = 4326
+        polygons.append(polygon)
+    return polygons
+
+
+def filter_bbox(queryset, bbox, field="geom"):
+    condition = Q()
+    for polygon in bbox_polygons(bbox):
+        condition |= Q(**{f"{field}__bboverlaps": polygon})
+    return queryset.filter(condition)
+
+
+def thin_for_zoom(queryset, zoom):
+    """
+    Keep the ``ZOOM_LIMITS[zoom]`` most important airports: major hubs
+    first, then by number of routes touching the airport (from AirportStats).
+    """
+    limit = ZOOM_LIMITS.get(zoom)
+    if limit is None:
+        return queryset
+    return queryset.order_by(
+        "-is_major_hub", F("stats__degree").desc(nulls_last=True), "id"
+    )[:limit]
+
+
+def viewport_queryset(queryset, params):
+    """
+    Apply ``bbox`` and ``zoom`` from request query params.
+    Raises ValueError for malformed values.
+    """
+    bbox = params.get("bbox")
+    if bbox:
+        queryset = filter_bbox(queryset, parse_bbox(bbox))
+    zoom = params.get("zoom")
+    if zoom not in (None, ""):
+        queryset = thin_for_zoom(queryset, parse_zoom(zoom))
+    return queryset
@@ -1,14 +1,34 @@
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render
+from django.db.models import Count, F
 from django.contrib.gis.geos import Point
-from django.contrib.gis.measure import Distance
-from django.contrib.gis.db.models.functions import Distance as GDistance
-from django.db.models import Count
+import numpy as np
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from .models import Airport, FlightRoute
 from .serializers import AirportSerializer, FlightRouteSerializer, AirportCreateSerializer
+from .geojson import (
+    airport_feature, airport_features, airport_rows, dumps, iter_feature_collection,
+    route_feature, route_features, route_rows,
+)
+from .cache import cached_response, etag_matches, get_dataset_version, make_etag, request_cache_key
+from .tiles import get_tile, valid_tile
+from .export import FORMATS as EXPORT_FORMATS, LAYER_COLUMNS, ExportUnavailable, export_filename, get_export
+from .graph import get_route_graph
+from .spatial import nearby_features, nearest_batch, nearest_features
+from .search import MAX_RESULTS as MAX_SEARCH_RESULTS, search_features
+from .stats import RANKINGS, STAT_FIELDS
+from .analytics import AIRLINE_ORDERINGS, MAX_BINS, distance_histogram, get_airline_stats
+from .viewport import parse_bbox, parse_zoom, viewport_queryset
+from .clusters import MAX_WORLD_ZOOM, get_airport_clusters, grid_zoom
+from .bulk import MAX_BULK_AIRPORTS, bulk_write_airports
+from .airspace import (
+    MAX_CORRIDOR_KM, bbox_region, parse_geometry, parse_region, path_feature, path_rows, routes_in_region,
+    routes_near,
+)
 
 
 # FRONTEND MAP VIEW
@@ -17,26 +37,93 @@ def index(request):
     return render(request, "maps/index.html")
 
 
+# VECTOR TILES
+def tile(request, layer, z, x, y):
+    """
+    Serve a Mapbox Vector Tile for the airports or routes layer.
+    Example: /tiles/routes/3/4/2.pbf
+    """
+    if not valid_tile(layer, z, x, y):
+        raise Http404("Unknown layer or tile out of range")
+
+    version = get_dataset_version()
+    etag = make_etag(version, request.path)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        data = get_tile(layer, z, x, y, version=version)
+        if data:
+            response = HttpResponse(data, content_type="application/vnd.mapbox-vector-tile")
+        else:
+            response = HttpResponse(status=204)
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, no-cache"
+    return response
+
+
+# BULK EXPORT
+def export(request, layer, fmt):
+    """
+    Download a whole table as FlatGeobuf (fgb), GeoParquet (parquet) or
+    columnar JSON (json), written once per dataset version and then served
+    from disk.
+    Example: /api/export/routes.parquet
+    """
+    if layer not in LAYER_COLUMNS or fmt not in EXPORT_FORMATS:
+        raise Http404("Unknown layer or export format")
+
+    version = get_dataset_version()
+    etag = make_etag(version, request.path)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            path = get_export(layer, fmt, version=version)
+        except ExportUnavailable as exc:
+            return JsonResponse({"error": str(exc)}, status=501)
+        response = FileResponse(
+            open(path, "rb"),
+            content_type=EXPORT_FORMATS[fmt][0],
+            as_attachment=True,
+            filename=export_filename(layer, fmt, version),
+        )
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, no-cache"
+    return response
+
+
 # AIRPORT VIEWSET
+MAX_BATCH_POINTS = 100_000
+
+
 class AirportViewSet(viewsets.ModelViewSet):
     """
     Handles CRUD operations and spatial queries for Airport data.
     """
 
+    # GET requests may read from a replica (see maps/replicas.py)
+    read_replica = True
+
     queryset = Airport.objects.all()
     serializer_class = AirportSerializer
 
     def list(self, request, *args, **kwargs):
         """
-        Return all airports as a GeoJSON FeatureCollection.
+        Return airports as a streamed GeoJSON FeatureCollection, optionally
+        limited to a viewport and thinned for low zooms.
+        Example: /api/airports/?bbox=-11,49,3,59&zoom=5
         """
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(
-            {
-                "type": "FeatureCollection",
-                "features": serializer.data,
-            }
+        try:
+            queryset = viewport_queryset(
+                self.filter_queryset(self.get_queryset()), request.query_params
+            )
+        except ValueError:
+            return Response(
+                {"error": "Use ?bbox=<minLon,minLat,maxLon,maxLat>&zoom=<0-22>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return cached_response(
+            request, lambda: iter_feature_collection(airport_features(queryset)), params=("bbox", "zoom"),
         )
 
     def get_serializer_class(self):
@@ -44,6 +131,27 @@ class AirportViewSet(viewsets.ModelViewSet):
             return AirportCreateSerializer
         return AirportSerializer
 
+    @action(detail=False, methods=["post", "patch"])
+    def bulk(self, request):
+        """
+        Write many airports in one call, keyed on ``iata_code``: POST creates
+        or replaces them, PATCH changes the given fields of existing ones.
+        The body is a JSON list of airports as for create (with lat/lon).
+        Valid items are applied together; invalid ones are listed in
+        ``errors`` by index.
+        Example: POST /api/airports/bulk/ [{"iata_code": "DUB", "name": "Dublin Airport", "lat": 53.42, "lon": -6.27}]
+        """
+        items = request.data
+        if not isinstance(items, list) or not 1 <= len(items) <= MAX_BULK_AIRPORTS:
+            return Response(
+                {"error": f"Send a JSON list of 1-{MAX_BULK_AIRPORTS} airports"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = bulk_write_airports(items, partial=request.method == "PATCH")
+        applied = result["created"] + result["updated"]
+        return Response(result, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=["get"])
     def routes(self, request):
         """
@@ -65,13 +173,35 @@ class AirportViewSet(viewsets.ModelViewSet):
             )
 
         routes = FlightRoute.objects.filter(origin=origin_airport)
-        data = FlightRouteSerializer(routes, many=True).data
+        return cached_response(
+            request, lambda: iter_feature_collection(route_features(routes)), params=("origin",),
+        )
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Type-ahead search over IATA code, name and city; IATA-prefix matches
+        come first, then the busiest airports.
+        Example: /api/airports/search/?q=dub&limit=10
+        """
+        query = request.query_params.get("q", "").strip()
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 0
+        if not query or not 1 <= limit <= MAX_SEARCH_RESULTS:
+            return Response(
+                {"error": f"Use ?q=<text>&limit=<1-{MAX_SEARCH_RESULTS}>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        data = search_features(query, limit=limit)
         return Response({"type": "FeatureCollection", "features": data})
 
     @action(detail=False, methods=["get"])
     def nearby(self, request):
         """
-        Return airports within a radius (km) of a given lat/lon.
+        Return airports within a radius (km) of a given lat/lon, nearest first.
         Example: /api/airports/nearby/?lat=53.3&lon=-6.2&radius=100
         """
         try:
@@ -83,43 +213,230 @@ class AirportViewSet(viewsets.ModelViewSet):
                 {"error": "Use ?lat=<value>&lon=<value>&radius=<km>"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180 and radius >= 0):
+            return Response(
+                {"error": "lat/lon out of range or negative radius"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        pt = Point(lon, lat, srid=4326)
-        qs = (
-            Airport.objects.filter(geom__distance_lte=(pt, Distance(km=radius)))
-            .annotate(distance=GDistance("geom", pt))
-            .order_by("distance")[:300]
-        )
-        data = AirportSerializer(qs, many=True).data
+        data = nearby_features(lat, lon, radius, limit=300)
         return Response({"type": "FeatureCollection", "features": data})
 
     @action(detail=False, methods=["get"])
     def nearest(self, request):
         """
-        Return the single nearest airport to a given lat/lon.
-        Example: /api/airports/nearest/?lat=53.3&lon=-6.2
+        Return the k nearest airports (default 1) to a given lat/lon.
+        Example: /api/airports/nearest/?lat=53.3&lon=-6.2&k=1
         """
         try:
             lat = float(request.query_params["lat"])
             lon = float(request.query_params["lon"])
+            k = int(request.query_params.get("k", 1))
         except (KeyError, ValueError):
             return Response(
                 {"error": "Use ?lat=<value>&lon=<value>"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 1 <= k <= 100):
+            return Response(
+                {"error": "lat/lon out of range or k not in 1-100"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        pt = Point(lon, lat, srid=4326)
-        qs = Airport.objects.annotate(distance=GDistance("geom", pt)).order_by("distance")[:1]
+        data = nearest_features(lat, lon, k=k)
+        return Response({"type": "FeatureCollection", "features": data})
 
-        if qs.exists():
-            airport = qs.first()
-            data = AirportSerializer([airport], many=True).data
-            if data and len(data) > 0:
-                data[0]["properties"]["distance_km"] = round(airport.distance.km, 2)
-        else:
-            data = []
+    @action(detail=False, methods=["post"], url_path="nearest/batch")
+    def nearest_batch(self, request):
+        """
+        Resolve many points to their k nearest airports in one call.
+        Body is JSON {"points": [[lon, lat], ...], "k": 1}, or packed
+        little-endian float64 lon/lat pairs sent as application/octet-stream
+        (with ?k=<n>).
+        Example: POST /api/airports/nearest/batch/
+        """
+        try:
+            if request.content_type == "application/octet-stream":
+                points = np.frombuffer(request.body, dtype="<f8").reshape(-1, 2)
+                k = int(request.query_params.get("k", 1))
+            else:
+                points = np.asarray(request.data.get("points", []), dtype=np.float64).reshape(-1, 2)
+                k = int(request.data.get("k", request.query_params.get("k", 1)))
+        except (AttributeError, TypeError, ValueError):
+            return Response(
+                {"error": 'POST {"points": [[lon, lat], ...], "k": <n>} or packed float64 lon/lat pairs'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        lon, lat = points[:, 0], points[:, 1]
+        if not (
+            1 <= k <= 10
+            and len(points) <= MAX_BATCH_POINTS
+            and np.all(np.abs(lat) <= 90)
+            and np.all(np.abs(lon) <= 180)
+        ):
+            return Response(
+                {"error": f"k must be 1-10, at most {MAX_BATCH_POINTS} points, lat/lon in range"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        return Response({"type": "FeatureCollection", "features": data})
+        codes, distances = nearest_batch(lon, lat, k=k)
+        body = dumps({"count": len(points), "k": k, "iata_code": codes, "distance_km": distances})
+        return HttpResponse(body, content_type="application/json")
+
+    @action(detail=False, methods=["get"])
+    def connections(self, request):
+        """
+        Return the k shortest itineraries between two airports, computed on
+        the in-memory route graph.
+        Example: /api/airports/connections/?from=DUB&to=SYD&max_hops=3&k=3
+        """
+        try:
+            origin_code = request.query_params["from"]
+            destination_code = request.query_params["to"]
+            max_hops = int(request.query_params.get("max_hops", 2))
+            k = int(request.query_params.get("k", 3))
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Use ?from=<IATA>&to=<IATA>&max_hops=<1-4>&k=<1-10>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not (1 <= max_hops <= 4 and 1 <= k <= 10):
+            return Response(
+                {"error": "max_hops must be 1-4 and k must be 1-10"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        graph = get_route_graph()
+        source, target = graph.node(origin_code), graph.node(destination_code)
+        for code, node in ((origin_code, source), (destination_code, target)):
+            if node is None:
+                return Response(
+                    {"error": f"No airport found with IATA '{code}'"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+        def producer():
+            paths = graph.shortest_paths(
+                source, target, k=k, max_hops=max_hops,
+                airline=request.query_params.get("airline"),
+            )
+            features = [
+                graph.itinerary_feature(rank, distance, path)
+                for rank, (distance, path) in enumerate(paths, start=1)
+            ]
+            return iter_feature_collection(features)
+
+        return cached_response(request, producer, params=("from", "to", "max_hops", "k", "airline"))
+
+    @action(detail=False, methods=["get"])
+    def reachable(self, request):
+        """
+        Return every airport reachable from an origin within N flights
+        (and optionally X km flown), with hop count and cumulative distance.
+        Example: /api/airports/reachable/?origin=DUB&max_hops=2&max_km=5000&airline=FR
+        """
+        try:
+            origin_code = request.query_params["origin"]
+            max_hops = int(request.query_params.get("max_hops", 1))
+            max_km = request.query_params.get("max_km")
+            max_km = float(max_km) if max_km else None
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Use ?origin=<IATA>&max_hops=<1-6>&max_km=<km>&airline=<code>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 1 <= max_hops <= 6 or (max_km is not None and not (np.isfinite(max_km) and max_km >= 0)):
+            return Response(
+                {"error": "max_hops must be 1-6 and max_km a distance >= 0"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        graph = get_route_graph()
+        source = graph.node(origin_code)
+        if source is None:
+            return Response(
+                {"error": f"No airport found with IATA '{origin_code}'"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        def producer():
+            hops, dist = graph.reachability(
+                source, max_hops=max_hops, max_km=max_km,
+                airline=request.query_params.get("airline"),
+            )
+            reached = np.flatnonzero(hops > 0)
+            reached = reached[np.lexsort((dist[reached], hops[reached]))]
+            return iter_feature_collection(
+                airport_feature(
+                    graph.airports[i],
+                    hops=int(hops[i]),
+                    distance_km=round(float(dist[i]), 1),
+                )
+                for i in reached
+            )
+
+        return cached_response(request, producer, params=("origin", "max_hops", "max_km", "airline"))
+
+    @action(detail=False, methods=["get"])
+    def clusters(self, request):
+        """
+        Return airport clusters for a zoom level (count, centroid and top hub
+        per grid cell), for map views too far out to draw single airports.
+        ``bbox`` is required above zoom 3.
+        Example: /api/airports/clusters/?zoom=4&bbox=-30,30,40,70
+        """
+        try:
+            zoom = parse_zoom(request.query_params.get("zoom", ""))
+            bbox = request.query_params.get("bbox")
+            bbox = parse_bbox(bbox) if bbox else None
+        except ValueError:
+            bbox, zoom = None, None
+        if zoom is None or (bbox is None and zoom > MAX_WORLD_ZOOM):
+            return Response(
+                {"error": f"Use ?zoom=<0-22>&bbox=<minLon,minLat,maxLon,maxLat> (bbox required above zoom {MAX_WORLD_ZOOM})"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        def producer():
+            return iter_feature_collection(
+                get_airport_clusters().features(zoom, bbox), zoom=zoom, grid_zoom=grid_zoom(zoom, bbox),
+            )
+
+        return cached_response(request, producer, params=("zoom", "bbox"))
+
+    @action(detail=False, methods=["get"])
+    def top(self, request):
+        """
+        Return airports ranked by connectivity, read from the precomputed
+        AirportStats table. ``by`` is one of degree, out_degree, in_degree,
+        airlines, countries or route_km.
+        Example: /api/airports/top/?by=airlines&limit=20
+        """
+        by = request.query_params.get("by", "degree")
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 0
+        if by not in RANKINGS or not 1 <= limit <= 500:
+            return Response(
+                {"error": f"Use ?by=<{'|'.join(RANKINGS)}>&limit=<1-500>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = (
+            Airport.objects.filter(stats__isnull=False)
+            .annotate(**{field: F(f"stats__{field}") for field in STAT_FIELDS})
+            .order_by(f"-stats__{RANKINGS[by]}", "id")[:limit]
+        )
+
+        def producer():
+            rows = airport_rows(queryset, *STAT_FIELDS)
+            return iter_feature_collection(
+                airport_feature(row, rank=rank, **{field: row[field] for field in STAT_FIELDS})
+                for rank, row in enumerate(rows, start=1)
+            )
+
+        return cached_response(request, producer, params=("by", "limit"))
 
     @action(detail=False, methods=["get"])
     def hubs(self, request):
@@ -127,20 +444,258 @@ class AirportViewSet(viewsets.ModelViewSet):
         Return top countries ranked by number of airports.
         Example: /api/airports/hubs/?top=10
         """
-        top = int(request.query_params.get("top", 10))
+        try:
+            top = int(request.query_params.get("top", 10))
+        except ValueError:
+            top = 0
+        if not 1 <= top <= 250:
+            return Response(
+                {"error": "Use ?top=<1-250>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         rows = (
             Airport.objects.values("country")
             .annotate(count=Count("id"))
             .order_by("-count")[:top]
         )
-        return Response(list(rows))
+        return cached_response(request, lambda: [dumps(list(rows)).encode()], params=("top",))
 
 
 # FLIGHT ROUTE VIEWSET
+DEFAULT_ROUTE_PAGE_SIZE = 1000
+MAX_ROUTE_PAGE_SIZE = 10_000
+# Densified paths are larger, so region/corridor pages are smaller
+DEFAULT_PATH_PAGE_SIZE = 500
+MAX_PATH_PAGE_SIZE = 2000
+
+
 class FlightRouteViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Read-only access to FlightRoute data with spatial query support.
     """
 
-    queryset = FlightRoute.objects.all()
+    # GET requests may read from a replica (see maps/replicas.py)
+    read_replica = True
+
+    # Only what FlightRouteSerializer reads, with both airports joined in
+    queryset = FlightRoute.objects.select_related("origin", "destination").only(
+        "id", "airline", "distance_km", "geom", "origin__iata_code", "destination__iata_code",
+    )
     serializer_class = FlightRouteSerializer
+
+    def list(self, request, *args, **kwargs):
+        """
+        Return routes as a GeoJSON FeatureCollection, one keyset page at a
+        time: ``WHERE id > cursor ORDER BY id LIMIT page_size``, so every page
+        costs the same however deep it is. Follow ``next`` (or pass
+        ``next_cursor`` as ?cursor=) until it is null. Filters: origin,
+        destination, airline, min_km, max_km.
+        Example: /api/routes/?origin=DUB&min_km=1000&page_size=500
+        """
+        params = request.query_params
+        try:
+            min_km = float(params["min_km"]) if params.get("min_km") else None
+            max_km = float(params["max_km"]) if params.get("max_km") else None
+        except ValueError:
+            return Response(
+                {"error": "Use ?cursor=<id>&page_size=<n>&origin=<IATA>&destination=<IATA>"
+                          "&airline=<code>&min_km=<km>&max_km=<km>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = FlightRoute.objects.all()
+        if params.get("origin"):
+            queryset = queryset.filter(origin__iata_code=params["origin"].strip().upper())
+        if params.get("destination"):
+            queryset = queryset.filter(destination__iata_code=params["destination"].strip().upper())
+        if params.get("airline"):
+            queryset = queryset.filter(airline=params["airline"].strip().upper())
+        if min_km is not None:
+            queryset = queryset.filter(distance_km__gte=min_km)
+        if max_km is not None:
+            queryset = queryset.filter(distance_km__lte=max_km)
+
+        return self.keyset_page(
+            request, queryset, route_rows, route_feature,
+            params=("origin", "destination", "airline", "min_km", "max_km"),
+        )
+
+    @action(detail=False, methods=["get"])
+    def intersecting(self, request):
+        """
+        Return routes whose great-circle path crosses a region: ``bbox``
+        (may cross the antimeridian) or ``polygon`` (WKT or GeoJSON, lon/lat),
+        spanning less than 180 degrees each way. Paths are densified great
+        circles. Keyset-paged like the list.
+        Example: /api/routes/intersecting/?bbox=-10,45,2,52
+        """
+        params = request.query_params
+        try:
+            if params.get("bbox"):
+                region = bbox_region(parse_bbox(params["bbox"]))
+            elif params.get("polygon"):
+                region = parse_region(params["polygon"])
+            else:
+                raise ValueError("no region")
+        except ValueError as exc:
+            return Response(
+                {"error": f"Use ?bbox=<minLon,minLat,maxLon,maxLat> or ?polygon=<WKT|GeoJSON> ({exc})"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return self.keyset_page(
+            request, routes_in_region(region), path_rows, path_feature, params=("bbox", "polygon"),
+            default_size=DEFAULT_PATH_PAGE_SIZE, max_size=MAX_PATH_PAGE_SIZE,
+        )
+
+    @action(detail=False, methods=["get"])
+    def near(self, request):
+        """
+        Return routes whose great-circle path passes within ``km`` of a point
+        (``lat``/``lon``) or a corridor line (``corridor``, WKT or GeoJSON),
+        each with ``offset_km``, its closest approach. Keyset-paged like the
+        list.
+        Example: /api/routes/near/?lat=53.3&lon=-6.2&km=50
+        """
+        params = request.query_params
+        try:
+            km = float(params.get("km", 50))
+            if params.get("corridor"):
+                target = parse_geometry(params["corridor"], ("LineString", "MultiLineString"))
+            else:
+                lat, lon = float(params["lat"]), float(params["lon"])
+                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                    raise ValueError("lat/lon out of range")
+                target = Point(lon, lat, srid=4326)
+            if not 0 <= km <= MAX_CORRIDOR_KM:
+                raise ValueError(f"km must be 0-{MAX_CORRIDOR_KM}")
+        except (KeyError, ValueError) as exc:
+            return Response(
+                {"error": f"Use ?lat=<value>&lon=<value>&km=<km> or ?corridor=<WKT|GeoJSON>&km=<km> ({exc})"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return self.keyset_page(
+            request, routes_near(target, km),
+            lambda queryset: path_rows(queryset, "offset_km"),
+            lambda row: path_feature(row, offset_km=row["offset_km"]),
+            params=("lat", "lon", "km", "corridor"),
+            default_size=DEFAULT_PATH_PAGE_SIZE, max_size=MAX_PATH_PAGE_SIZE,
+        )
+
+    def keyset_page(self, request, queryset, rows, feature, params=(),
+                    default_size=DEFAULT_ROUTE_PAGE_SIZE, max_size=MAX_ROUTE_PAGE_SIZE):
+        """
+        One ``?cursor=``/``?page_size=`` page of ``queryset`` in id order,
+        projected with ``rows`` and encoded with ``feature``, with ``next``
+        and ``next_cursor`` links. ``params`` are the view's own query
+        parameters, kept in the cache key and the ``next`` link.
+        """
+        try:
+            cursor = int(request.query_params.get("cursor", 0))
+            page_size = int(request.query_params.get("page_size", default_size))
+        except ValueError:
+            cursor = page_size = -1
+        if not (cursor >= 0 and 1 <= page_size <= max_size):
+            return Response(
+                {"error": f"cursor must be >= 0 and page_size 1-{max_size}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = queryset.filter(id__gt=cursor).order_by("id")[:page_size + 1]
+        key = request_cache_key(request, (*params, "cursor", "page_size"))
+
+        def producer():
+            page = list(rows(queryset))
+            next_cursor = next_url = None
+            if len(page) > page_size:
+                page = page[:page_size]
+                next_cursor = page[-1]["id"]
+                next_url = replace_query_param(request.build_absolute_uri(key), "cursor", next_cursor)
+            return iter_feature_collection(
+                (feature(row) for row in page),
+                next=next_url,
+                next_cursor=next_cursor,
+            )
+
+        return cached_response(request, producer, key=key)
+
+
+# ANALYTICS VIEWSET
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Aggregates over the route network for dashboards, computed once per
+    dataset version and served from the versioned cache.
+    """
+
+    # GET requests may read from a replica (see maps/replicas.py)
+    read_replica = True
+
+    @action(detail=False, methods=["get"])
+    def airlines(self, request):
+        """
+        Return per-airline network size and stage lengths: routes, airports
+        served, average/max/total distance. Ordered by ``order`` (routes,
+        airports, avg_km, max_km or total_km), or one airline with ?airline=.
+        Example: /api/analytics/airlines/?order=max_km&top=20
+        """
+        order = request.query_params.get("order", "routes")
+        try:
+            top = int(request.query_params.get("top", 50))
+        except ValueError:
+            top = 0
+        if order not in AIRLINE_ORDERINGS or not 1 <= top <= 1000:
+            return Response(
+                {"error": f"Use ?order=<{'|'.join(AIRLINE_ORDERINGS)}>&top=<1-1000>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        stats = get_airline_stats()
+        airline = request.query_params.get("airline")
+        if airline is not None:
+            row = stats.by_airline.get(airline.strip().upper())
+            if row is None:
+                return Response(
+                    {"error": f"No routes found for airline '{airline}'"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            return cached_response(request, lambda: [dumps(row).encode()], params=("airline",))
+
+        return cached_response(
+            request,
+            lambda: [dumps({"count": len(stats.rows), "airlines": stats.top(order, top)}).encode()],
+            params=("order", "top"),
+        )
+
+    @action(detail=False, methods=["get"])
+    def distances(self, request):
+        """
+        Return a histogram of route distances, bucketed in SQL.
+        Example: /api/analytics/distances/?bins=20&max_km=5000&airline=FR
+        """
+        try:
+            bins = int(request.query_params.get("bins", 20))
+            min_km = float(request.query_params.get("min_km", 0))
+            max_km = request.query_params.get("max_km")
+            max_km = float(max_km) if max_km else None
+        except ValueError:
+            return Response(
+                {"error": "Use ?bins=<n>&min_km=<km>&max_km=<km>&airline=<code>"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        finite = np.isfinite(min_km) and (max_km is None or np.isfinite(max_km))
+        if not (finite and 1 <= bins <= MAX_BINS and min_km >= 0 and (max_km is None or max_km > min_km)):
+            return Response(
+                {"error": f"bins must be 1-{MAX_BINS} and 0 <= min_km < max_km"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        airline = request.query_params.get("airline")
+        airline = airline.strip().upper() if airline else None
+
+        def producer():
+            buckets = distance_histogram(bins, min_km, max_km, airline)
+            total = sum(bucket["count"] for bucket in buckets)
+            return [dumps({"airline": airline, "total": total, "bins": buckets}).encode()]
+
+        return cached_response(request, producer, params=("bins", "min_km", "max_km", "airline"))